@@ -0,0 +1,4 @@
+"""Benchmarks for the hot paths of the project.
+
+Run them from the project root, e.g.: ``python -m benchmarks.bench_loader``.
+"""
@@ -0,0 +1,103 @@
+"""Benchmark: single-pass :func:`clean_number` and the batch :func:`clean_numbers` against the previous regex chain.
+
+Usage: ``python -m benchmarks.bench_clean_number [--values 100000] [--repeat 5]``
+"""
+import argparse
+import random
+import re
+import time
+from typing import Callable, List
+
+from tegenaria.items import clean_number, clean_numbers
+
+# The previous implementation, kept here as the reference.
+REGEX_DIGITS_SEPARATORS_ONLY = re.compile(r"[\d,.]+")
+REGEX_DECIMAL_POINT = re.compile(r"^[\d,]+\.\d{1,2}$")
+REGEX_DECIMAL_COMMA = re.compile(r"^[\d.]+,\d{1,2}$")
+REGEX_GROUP_OF_THREE_COMMA = re.compile(r"^\d+(,\d{3})+$")
+REGEX_GROUP_OF_THREE_POINT = re.compile(r"^\d+(.\d{3})+$")
+
+
+def regex_clean_number(value: str) -> str:
+    """Clean a numeric value with findall() and up to four anchored regexes."""
+    digits_separators = REGEX_DIGITS_SEPARATORS_ONLY.findall(value)
+    value = "".join(digits_separators)
+
+    if REGEX_DECIMAL_POINT.match(value) or REGEX_GROUP_OF_THREE_COMMA.match(value):
+        value = value.replace(",", "")
+    elif REGEX_DECIMAL_COMMA.match(value) or REGEX_GROUP_OF_THREE_POINT.match(value):
+        value = value.replace(".", "").replace(",", ".")
+
+    for ending in (".00", ".0"):
+        if value.endswith(ending):
+            value = value[0 : -len(ending)]
+    return value
+
+
+def raw_values(count: int, seed: int = 42) -> List[str]:
+    """Prices, sizes and rooms the way the portals show them."""
+    rng = random.Random(seed)
+    templates = [
+        "{euros:,}.{cents:02d} €",
+        "{euros_de} €",
+        "{euros_de},{cents:02d} EUR",
+        " {euros}  ",
+        "Kaltmiete: {euros_de},{cents:02d} €",
+        "{size},{cents:02d} m²",
+        "{size}.{decimal} m²",
+        "{rooms} Zimmer",
+        " {rooms}.{decimal} room(s)",
+        "{rooms},5",
+    ]
+    values = []
+    for _ in range(count):
+        euros = rng.randint(250, 2500)
+        values.append(
+            rng.choice(templates).format(
+                euros=euros,
+                euros_de="{:,}".format(euros).replace(",", "."),
+                cents=rng.choice([0, 0, 0, 50, rng.randint(1, 99)]),
+                size=rng.randint(20, 160),
+                rooms=rng.randint(1, 6),
+                decimal=rng.choice([0, 5]),
+            )
+        )
+    return values
+
+
+def best_time(function: Callable[[], object], repeat: int) -> float:
+    """Best wall time of a function, in seconds."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    """Check that both implementations agree on the corpus, then time them."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--values", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    values = raw_values(args.values)
+    expected = [regex_clean_number(value) for value in values]
+    assert [clean_number(value) for value in values] == expected
+    assert clean_numbers(values) == expected
+
+    regex_seconds = best_time(lambda: [regex_clean_number(value) for value in values], args.repeat)
+    single_seconds = best_time(lambda: [clean_number(value) for value in values], args.repeat)
+    batch_seconds = best_time(lambda: clean_numbers(values), args.repeat)
+    print("{} values ({} distinct), best of {}".format(len(values), len(set(values)), args.repeat))
+    for name, seconds in (
+        ("Regex chain (previous)", regex_seconds),
+        ("clean_number()", single_seconds),
+        ("clean_numbers() batch", batch_seconds),
+    ):
+        print("{:24} {:7.3f} µs/value  {:5.1f}x".format(name, seconds / len(values) * 1e6, regex_seconds / seconds))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Benchmark: Distance Matrix calls of :class:`DistanceCalculator` against the old one-pin-at-a-time loop, offline.
+
+The requests go to :class:`FakeMatrixServer`, with a fixed latency per call.
+The old loop sent 20 apartments and one pin per request, one request after another.
+
+Usage: ``python -m benchmarks.bench_distance [--apartments 400] [--pins 3] [--latency 0.2] [--workers 4]``
+"""
+import argparse
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+
+from benchmarks.fake_distance_matrix import FakeMatrixServer
+from tegenaria.utils import DistanceCalculator, MatrixRequest, matrix_elements, plan_matrix_requests
+
+FAKE_KEY = "AIza-local"
+
+
+def old_plan(missing: List[Tuple[str, str, int]], pins: Dict[int, str]) -> List[MatrixRequest]:
+    """Requests of the old loop: for each pin, 20 apartments at a time."""
+    plan = []
+    for pin_id, pin_address in pins.items():
+        apartments = [(origin_key, address) for origin_key, address, missing_pin in missing if missing_pin == pin_id]
+        for start in range(0, len(apartments), 20):
+            chunk = apartments[start : start + 20]
+            plan.append(MatrixRequest([row[0] for row in chunk], [row[1] for row in chunk], [pin_id], [pin_address]))
+    return plan
+
+
+def measure(server: FakeMatrixServer, plan: List[MatrixRequest], workers: int) -> Tuple[float, int, int]:
+    """Send all requests of a plan.
+
+    :return: Wall time in seconds, requests and distances received.
+    """
+    calculator = DistanceCalculator([FAKE_KEY], server.base_url, workers)
+    calculator.load_client()
+    arrival_time = datetime.now() + timedelta(days=1)
+    server.requests = 0
+
+    start = time.perf_counter()
+    distances = sum(
+        len(matrix_elements(request, result)) for request, result in calculator.fetch_all(plan, arrival_time)
+    )
+    return time.perf_counter() - start, server.requests, distances
+
+
+def main():
+    """Compare both plans on the same missing distances."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--apartments", type=int, default=400)
+    parser.add_argument("--pins", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds per Distance Matrix call")
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    pins = {pin_id: "Pin {}, Berlin".format(pin_id) for pin_id in range(1, args.pins + 1)}
+    missing = [
+        ("street {} berlin".format(number), "Street {}, Berlin".format(number), pin_id)
+        for number in range(1, args.apartments + 1)
+        for pin_id in pins
+    ]
+
+    server = FakeMatrixServer(latency=args.latency).start()
+    try:
+        results = [
+            ("old: 20 x 1 pin, sequential", measure(server, old_plan(missing, pins), 1)),
+            (
+                "new: full requests, {} workers".format(args.workers),
+                measure(server, plan_matrix_requests(missing, pins), args.workers),
+            ),
+        ]
+    finally:
+        server.shutdown()
+
+    print("{} distances, {} pins, {:.0f} ms per call".format(len(missing), args.pins, args.latency * 1000))
+    for name, (seconds, requests, distances) in results:
+        assert distances == len(missing), "{}: {} distances instead of {}".format(name, distances, len(missing))
+        print("{:<34} {:>5} calls {:>8.2f} s {:>8.0f} distances/s".format(name, requests, seconds, distances / seconds))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Micro-benchmark: :class:`ApartmentLoader` against a Marshmallow :class:`ApartmentSchema` built for every item.
+
+Usage: ``python -m benchmarks.bench_loader [--items 2000] [--repeat 5]``
+"""
+import argparse
+import time
+from typing import Any, Callable, Dict, List
+
+from marshmallow import ValidationError
+from sqlalchemy import inspect
+
+from benchmarks.corpus import apartment_items
+from tegenaria.app import create_app
+from tegenaria.schemas import ApartmentLoader, ApartmentSchema
+from tegenaria.settings import TestConfig
+from tegenaria.spiders import SpiderMixin
+
+
+def schema_load(spider: SpiderMixin, data: Dict[str, Any]):
+    """Load an item the old way: a new schema and a transient model instance per item."""
+    schema = ApartmentSchema()
+    schema.context["spider"] = spider
+    try:
+        apartment = schema.load(data, transient=True)
+    except ValidationError as err:
+        return err.valid_data, err.messages
+    return {key: value for key, value in inspect(apartment).dict.items() if not key.startswith("_")}, None
+
+
+def best_time(function: Callable[[Dict[str, Any]], Any], items: List[Dict[str, Any]], repeat: int) -> float:
+    """Best wall time of loading all items, in seconds."""
+    timings = []
+    for _ in range(repeat):
+        # Each load receives a fresh copy, because before_marshmallow() may change the dict.
+        copies = [dict(item, json=dict(item), errors=None) for item in items]
+        start = time.perf_counter()
+        for data in copies:
+            function(data)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    """Compare both paths on the same corpus, after checking that they return the same results."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    create_app(TestConfig).app_context().push()
+    spider = SpiderMixin()
+    items = apartment_items(args.items)
+
+    loader = ApartmentLoader(spider)
+    for item in items:
+        expected = schema_load(spider, dict(item, json=dict(item), errors=None))
+        actual = loader.load(dict(item, json=dict(item), errors=None))
+        assert actual == expected, "Different results for {}:\n{}\n{}".format(item["url"], expected, actual)
+
+    schema_seconds = best_time(lambda data: schema_load(spider, data), items, args.repeat)
+    loader_seconds = best_time(loader.load, items, args.repeat)
+    print("{} items, best of {}".format(len(items), args.repeat))
+    print("ApartmentSchema per item: {:8.1f} µs/item".format(schema_seconds / len(items) * 1e6))
+    print("ApartmentLoader:          {:8.1f} µs/item".format(loader_seconds / len(items) * 1e6))
+    print("Speedup:                  {:8.1f}x".format(schema_seconds / loader_seconds))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+"""Benchmark: parse recorded exposé pages with each spider callback, without network.
+
+Every page in ``benchmarks/fixtures`` is wrapped in a Scrapy response and sent to the callback that handles it
+on the live site; chained requests to pages that also have a fixture (e.g. the Akelius map) are followed.
+The callback must return one item with all the fields of its ``@scrapes`` contract (or the fields listed here,
+for items finished by chained requests); then the time and the peak traced memory per item are measured.
+
+Save the results of a run with ``--save baseline.json``; later runs with ``--compare baseline.json``
+show the change in time per page, so a slow XPath shows up as a regression number.
+
+Usage: ``python -m benchmarks.bench_parse [--pages 200] [--repeat 3] [--spider immo_welt] [--save|--compare FILE]``
+"""
+import argparse
+import json
+import os
+import time
+import tracemalloc
+from functools import partial
+from typing import Callable, Dict, List, NamedTuple, Optional, Type
+
+from scrapy import Request, Spider
+from scrapy.http import HtmlResponse
+from scrapy.utils.spider import iterate_spider_output
+
+from tegenaria.items import ApartmentItem
+from tegenaria.spiders.akelius import AkeliusSpider
+from tegenaria.spiders.berlinovo import BerlinovoSpider
+from tegenaria.spiders.city_wohnen import CityWohnenSpider
+from tegenaria.spiders.immo_net import ImmoNetSpider
+from tegenaria.spiders.immo_welt import ImmoWeltSpider
+from tegenaria.spiders.immobilien_scout_24 import ImmobilienScout24Spider
+from tegenaria.spiders.merkur import MerkurSpider
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+class Page(NamedTuple):
+    """A recorded page, the URL it was served from and the spider callback that parses it."""
+
+    spider_class: Type[Spider]
+    callback: str
+    url: str
+    fixture: str
+    scrapes: Optional[List[str]] = None
+
+
+PAGES = [
+    Page(ImmoWeltSpider, "parse_item", "https://www.immowelt.de/expose/2GT7W4N", "immo_welt_expose.html"),
+    Page(ImmoNetSpider, "parse_item", "https://www.immonet.de/angebot/32437621", "immo_net_angebot.html"),
+    Page(
+        MerkurSpider,
+        "parse_item",
+        "http://www.merkur-berlin.de/?page_id=39&showExpose=1&exposeID=84857B0AD5B146159C73D483F5299839",
+        "merkur_expose.html",
+    ),
+    Page(
+        BerlinovoSpider,
+        "parse_furnished",
+        "https://www.berlinovo.de/en/apartment/2-room-suite-house-heinrich-heine-stra-e-18-24-berlin-mitte",
+        "berlinovo_apartment.html",
+    ),
+    Page(
+        BerlinovoSpider,
+        "parse_regular",
+        "https://www.berlinovo.de/en/wohnung/3-zimmer-wohnung-berlin-kaulsdorf-feldberger-ring-44-zu-vermieten",
+        "berlinovo_wohnung.html",
+    ),
+    Page(
+        CityWohnenSpider,
+        "parse_item",
+        "https://www.city-wohnen.de/eng/berlin/32638-moeblierte-wohnung-berlin-friedrichshain-gruenberger-strasse",
+        "city_wohnen_flat.html",
+    ),
+    Page(
+        AkeliusSpider,
+        "parse_item",
+        "https://www.akelius.de/en/search/apartments/osten/berlin/2.7037.16",
+        "akelius_apartment.html",
+        ["url", "title", "warm_rent_price", "size", "availability", "cold_rent_price", "description", "address"],
+    ),
+    Page(
+        ImmobilienScout24Spider,
+        "parse_item",
+        "https://www.immobilienscout24.de/expose/93354819",
+        "immobilien_scout_24_expose.html",
+    ),
+]
+
+
+# Pages requested by the callbacks above, to finish their items.
+FOLLOW_FIXTURES = {
+    "https://www.akelius.de/en/search/apartments/osten/berlin/2.7037.16/karte": "akelius_apartment_karte.html"
+}
+
+
+def read_fixture(name: str) -> bytes:
+    """Content of a fixture file."""
+    with open(os.path.join(FIXTURES_DIR, name), "rb") as handle:
+        return handle.read()
+
+
+def contract_fields(callback: Callable) -> List[str]:
+    """Fields listed on the ``@scrapes`` lines of a callback docstring."""
+    fields = []  # type: List[str]
+    for line in (callback.__doc__ or "").splitlines():
+        words = line.split()
+        if words and words[0] == "@scrapes":
+            fields.extend(words[1:])
+    return fields
+
+
+def parse_page(spider: Spider, callback: Callable, url: str, body: bytes) -> list:
+    """Parse one page with a fresh response, as Scrapy would after downloading it, and the pages it chains to."""
+    response = HtmlResponse(url=url, body=body, encoding="utf-8")
+    output = []
+    for value in iterate_spider_output(callback(response)):
+        if isinstance(value, Request) and value.url in FOLLOW_FIXTURES:
+            follow_callback = partial(value.callback, **value.cb_kwargs)
+            output.extend(parse_page(spider, follow_callback, value.url, read_fixture(FOLLOW_FIXTURES[value.url])))
+        else:
+            output.append(value)
+    return output
+
+
+def check_page(page: Page, spider: Spider, body: bytes):
+    """Make sure the fixture still produces a complete item, otherwise the timing is meaningless."""
+    callback = getattr(spider, page.callback)
+    output = parse_page(spider, callback, page.url, body)
+    items = [value for value in output if isinstance(value, ApartmentItem)]
+    assert len(items) == 1, "{}: expected one item, got {!r}".format(page.fixture, output)
+    missing = [field for field in page.scrapes or contract_fields(callback) if not items[0].get(field)]
+    assert not missing, "{}: fields not scraped: {}".format(page.fixture, ", ".join(missing))
+
+
+def measure(page: Page, pages: int, repeat: int):
+    """Best time per page, and peak traced memory per page.
+
+    :return: Seconds per page and bytes per page.
+    """
+    spider = page.spider_class()
+    callback = getattr(spider, page.callback)
+    body = read_fixture(page.fixture)
+    check_page(page, spider, body)
+
+    best = None  # type: Optional[float]
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(pages):
+            parse_page(spider, callback, page.url, body)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    # Memory is traced separately: tracing slows everything down and would distort the timing.
+    tracemalloc.start()
+    peaks = []
+    for _ in range(min(pages, 20)):
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        parse_page(spider, callback, page.url, body)
+        _, peak = tracemalloc.get_traced_memory()
+        peaks.append(peak - before)
+    tracemalloc.stop()
+    return best / pages, sorted(peaks)[len(peaks) // 2]
+
+
+def main():
+    """Check every fixture, then time the callbacks."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pages", type=int, default=200, help="Pages parsed per repetition")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--spider", action="append", help="Only these spiders (name); can be repeated")
+    parser.add_argument("--save", help="Save the seconds per page of each callback to this JSON file")
+    parser.add_argument("--compare", help="Compare with a JSON file saved before")
+    args = parser.parse_args()
+
+    baseline = {}  # type: Dict[str, float]
+    if args.compare:
+        with open(args.compare) as handle:
+            baseline = json.load(handle)
+
+    print("{} pages per fixture, best of {}; memory is the median peak per page".format(args.pages, args.repeat))
+    print(
+        "{:22} {:16} {:>9} {:>9} {:>10} {:>8}".format("Spider", "Callback", "items/s", "ms/page", "KiB/page", "change")
+    )
+    results = {}  # type: Dict[str, float]
+    for page in PAGES:
+        if args.spider and page.spider_class.name not in args.spider:
+            continue
+        seconds, memory = measure(page, args.pages, args.repeat)
+        key = "{}.{}".format(page.spider_class.name, page.callback)
+        results[key] = seconds
+        change = "{:+7.1f}%".format((seconds / baseline[key] - 1) * 100) if key in baseline else ""
+        print(
+            "{:22} {:16} {:9.0f} {:9.3f} {:10.1f} {:>8}".format(
+                page.spider_class.name, page.callback, 1 / seconds, seconds * 1000, memory / 1024, change
+            )
+        )
+
+    if args.save:
+        with open(args.save, "w") as handle:
+            json.dump(results, handle, indent=2, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""Synthetic but realistic data to feed the benchmarks."""
+import random
+from typing import Dict, List
+
+STREETS = ["Karl-Marx-Allee", "Sonnenallee", "Kastanienallee", "Boxhagener Str.", "Hermannstr.", "Greifswalder Str."]
+NEIGHBORHOODS = ["Friedrichshain", "Neukölln", "Prenzlauer Berg", "Kreuzberg", "Mitte", "Wedding", "Pankow"]
+WORDS = (
+    "Wohnung Balkon Altbau saniert hell ruhig Lage Küche Bad Dielen Aufzug Keller Innenhof Nähe U-Bahn "
+    "Einbauküche Fußbodenheizung Wannenbad Gäste-WC Parkett Stuck Fenster Süden Garten Dachterrasse"
+).split()
+
+
+def text(rng: random.Random, words: int) -> str:
+    """Random German-like text."""
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def price(rng: random.Random, low: float, high: float) -> str:
+    """A price as it comes out of the item loader (already cleaned)."""
+    value = round(rng.uniform(low, high), rng.choice([0, 2]))
+    return "{:.2f}".format(value).rstrip("0").rstrip(".") if rng.random() < 0.7 else "{:.2f}".format(value)
+
+
+def apartment_items(count: int, seed: int = 42) -> List[Dict[str, str]]:
+    """Scraped apartments as dicts, after the item loader; about 1 in 10 has an invalid field."""
+    rng = random.Random(seed)
+    items = []
+    for number in range(count):
+        cold = float(price(rng, 300, 1800))
+        item = {
+            "url": "https://www.immowelt.de/expose/{:07X}".format(number),
+            "title": text(rng, 8),
+            "address": "{} {}, {} Berlin".format(rng.choice(STREETS), rng.randint(1, 200), rng.randint(10115, 14199)),
+            "neighborhood": rng.choice(NEIGHBORHOODS),
+            "rooms": rng.choice(["1", "1.5", "2", "2.5", "3", "4"]),
+            "size": price(rng, 25, 140),
+            "cold_rent_price": "{:.2f}".format(cold),
+            "warm_rent_price": "{:.2f}".format(cold * 1.3),
+            "additional_price": price(rng, 50, 300),
+            "heating_price": price(rng, 30, 150),
+            "description": text(rng, 120),
+            "equipment": text(rng, 40),
+            "location": text(rng, 50),
+        }
+        if rng.random() < 0.5:
+            item["availability"] = "2020-{:02d}-{:02d}".format(rng.randint(1, 12), rng.randint(1, 28))
+        if rng.random() < 0.1:
+            item[rng.choice(["availability", "rooms", "warm_rent_price"])] = rng.choice(["ab sofort", "", "k.A."])
+        items.append(item)
+    return items
@@ -0,0 +1,112 @@
+"""Local stand-in for the Google Maps Distance Matrix API, to measure ``flask distance`` offline.
+
+Every element is found, with a distance and a duration derived from the addresses;
+each request waits a fixed latency, like a round trip to Google.
+
+Usage: ``python -m benchmarks.fake_distance_matrix [--port 8765] [--latency 0.2]``, then
+``GOOGLE_MATRIX_BASE_URL=http://localhost:8765 GOOGLE_MATRIX_API_KEYS=AIza-local flask distance``
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List
+from urllib.parse import parse_qs, urlparse
+from zlib import crc32
+
+MATRIX_PATH = "/maps/api/distancematrix/json"
+
+
+def fake_matrix(origins: List[str], destinations: List[str]) -> Dict[str, Any]:
+    """A Distance Matrix result with a fake element for each origin and destination."""
+    rows = []
+    for origin in origins:
+        elements = []
+        for destination in destinations:
+            meters = 1000 + crc32("{}|{}".format(origin, destination).encode()) % 20000
+            seconds = meters // 5
+            elements.append(
+                {
+                    "status": "OK",
+                    "distance": {"text": "{:.1f} km".format(meters / 1000), "value": meters},
+                    "duration": {"text": "{} mins".format(seconds // 60), "value": seconds},
+                }
+            )
+        rows.append({"elements": elements})
+    return {"status": "OK", "origin_addresses": origins, "destination_addresses": destinations, "rows": rows}
+
+
+class FakeMatrixHandler(BaseHTTPRequestHandler):
+    """Answer Distance Matrix requests after the latency of the server."""
+
+    def do_GET(self):
+        """Return a fake matrix for the origins and destinations of the query."""
+        url = urlparse(self.path)
+        if url.path != MATRIX_PATH:
+            self.send_error(404)
+            return
+        query = parse_qs(url.query)
+        origins = query.get("origins", [""])[0].split("|")
+        destinations = query.get("destinations", [""])[0].split("|")
+        self.server.count(len(origins) * len(destinations))
+        time.sleep(self.server.latency)
+
+        body = json.dumps(fake_matrix(origins, destinations)).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        """Don't log every request."""
+
+
+class FakeMatrixServer(ThreadingHTTPServer):
+    """HTTP server that counts the requests and elements it answered."""
+
+    daemon_threads = True
+
+    def __init__(self, port: int = 0, latency: float = 0.2):
+        """Listen on localhost; port 0 picks a free port."""
+        super().__init__(("127.0.0.1", port), FakeMatrixHandler)
+        self.latency = latency
+        self.requests = 0
+        self.elements = 0
+        self.lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        """URL to be used as ``GOOGLE_MATRIX_BASE_URL``."""
+        return "http://127.0.0.1:{}".format(self.server_address[1])
+
+    def count(self, elements: int):
+        """Count one request."""
+        with self.lock:
+            self.requests += 1
+            self.elements += elements
+
+    def start(self) -> "FakeMatrixServer":
+        """Serve on a background thread."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+def main():
+    """Serve until interrupted."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds to answer each request")
+    args = parser.parse_args()
+
+    server = FakeMatrixServer(args.port, args.latency)
+    print("Distance Matrix stand-in on {}".format(server.base_url))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,22 @@
+"""Content hash and last seen date of apartments.
+
+Create Date: 2026-10-18 10:12:41.503117
+"""
+import sqlalchemy as sa
+from alembic import op
+
+revision = "5b1e6f3c9a2d"
+down_revision = "2a4073217d5d"
+
+
+def upgrade():
+    """Apply changes to a database (create tables, columns, etc.)."""
+    op.add_column("apartment", sa.Column("content_hash", sa.String(length=32), nullable=True))
+    op.add_column("apartment", sa.Column("seen_at", sa.DateTime(), nullable=True))
+    op.execute("UPDATE apartment SET seen_at = updated_at")
+
+
+def downgrade():
+    """Reverse actions performed during upgrade."""
+    op.drop_column("apartment", "seen_at")
+    op.drop_column("apartment", "content_hash")
@@ -0,0 +1,38 @@
+"""Crawl runs, and the runs that saw and deactivated each apartment.
+
+Create Date: 2026-10-18 13:02:17.264810
+"""
+import sqlalchemy as sa
+from alembic import op
+
+revision = "7d3e9b2c4f1a"
+down_revision = "5b1e6f3c9a2d"
+
+
+def upgrade():
+    """Apply changes to a database (create tables, columns, etc.)."""
+    op.create_table(
+        "crawl_run",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("spider", sa.String(), nullable=False),
+        sa.Column("shard", sa.String(), nullable=True),
+        sa.Column("started_at", sa.DateTime(), nullable=False),
+        sa.Column("finished_at", sa.DateTime(), nullable=True),
+        sa.Column("reason", sa.String(), nullable=True),
+        sa.Column("complete", sa.Boolean(), nullable=False),
+        sa.Column("deactivated", sa.Integer(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.add_column("apartment", sa.Column("last_run_id", sa.Integer(), nullable=True))
+    op.add_column("apartment", sa.Column("deactivated_run_id", sa.Integer(), nullable=True))
+    op.create_foreign_key("apartment_last_run_id_fkey", "apartment", "crawl_run", ["last_run_id"], ["id"])
+    op.create_foreign_key("apartment_deactivated_run_id_fkey", "apartment", "crawl_run", ["deactivated_run_id"], ["id"])
+
+
+def downgrade():
+    """Reverse actions performed during upgrade."""
+    op.drop_constraint("apartment_deactivated_run_id_fkey", "apartment", type_="foreignkey")
+    op.drop_constraint("apartment_last_run_id_fkey", "apartment", type_="foreignkey")
+    op.drop_column("apartment", "deactivated_run_id")
+    op.drop_column("apartment", "last_run_id")
+    op.drop_table("crawl_run")
@@ -0,0 +1,33 @@
+"""Distance cache, shared by apartments at the same address.
+
+Create Date: 2026-10-18 13:24:08.918342
+"""
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+revision = "9c4a1e7d2b60"
+down_revision = "7d3e9b2c4f1a"
+
+
+def upgrade():
+    """Apply changes to a database (create tables, columns, etc.)."""
+    op.create_table(
+        "distance_cache",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("origin", sa.String(), nullable=False),
+        sa.Column("destination", sa.String(), nullable=False),
+        sa.Column("mode", sa.String(), nullable=False),
+        sa.Column("arrival_slot", sa.String(), nullable=False),
+        sa.Column("meters", sa.Integer(), nullable=False),
+        sa.Column("minutes", sa.Integer(), nullable=False),
+        sa.Column("json", postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+        sa.Column("fetched_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("origin", "destination", "mode", "arrival_slot"),
+    )
+
+
+def downgrade():
+    """Reverse actions performed during upgrade."""
+    op.drop_table("distance_cache")
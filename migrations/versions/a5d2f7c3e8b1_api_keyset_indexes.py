@@ -0,0 +1,29 @@
+"""Indexes for the keyset pages of the JSON API.
+
+Create Date: 2026-10-18 18:51:09.226847
+"""
+import sqlalchemy as sa
+from alembic import op
+
+revision = "a5d2f7c3e8b1"
+down_revision = "f3b8d6a2c4e9"
+
+
+def upgrade():
+    """Apply changes to a database (create tables, columns, etc.)."""
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_apartment_active_warm_rent_price_id",
+            "apartment",
+            ["warm_rent_price", "id"],
+            postgresql_where=sa.text("active IS true"),
+            postgresql_concurrently=True,
+        )
+        op.create_index("ix_distance_apartment_id", "distance", ["apartment_id"], postgresql_concurrently=True)
+
+
+def downgrade():
+    """Reverse actions performed during upgrade."""
+    with op.get_context().autocommit_block():
+        op.drop_index("ix_distance_apartment_id", table_name="distance", postgresql_concurrently=True)
+        op.drop_index("ix_apartment_active_warm_rent_price_id", table_name="apartment", postgresql_concurrently=True)
@@ -0,0 +1,30 @@
+"""Centroids to estimate distances offline, and provisional distances.
+
+Create Date: 2026-10-18 13:41:52.530716
+"""
+import sqlalchemy as sa
+from alembic import op
+
+revision = "b2f5d8e3a7c1"
+down_revision = "9c4a1e7d2b60"
+
+
+def upgrade():
+    """Apply changes to a database (create tables, columns, etc.)."""
+    op.create_table(
+        "centroid",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("kind", sa.String(), nullable=False),
+        sa.Column("key", sa.String(), nullable=False),
+        sa.Column("latitude", sa.Float(), nullable=False),
+        sa.Column("longitude", sa.Float(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("kind", "key"),
+    )
+    op.add_column("distance", sa.Column("provisional", sa.Boolean(), nullable=False, server_default=sa.false()))
+
+
+def downgrade():
+    """Reverse actions performed during upgrade."""
+    op.drop_column("distance", "provisional")
+    op.drop_table("centroid")
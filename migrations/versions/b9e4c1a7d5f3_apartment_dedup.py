@@ -0,0 +1,33 @@
+"""Canonical listing of duplicate apartments, and MinHash signatures.
+
+Create Date: 2026-10-18 19:37:52.611430
+"""
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+revision = "b9e4c1a7d5f3"
+down_revision = "a5d2f7c3e8b1"
+
+
+def upgrade():
+    """Apply changes to a database (create tables, columns, etc.)."""
+    op.add_column("apartment", sa.Column("canonical_id", sa.Integer(), nullable=True))
+    op.create_foreign_key("apartment_canonical_id_fkey", "apartment", "apartment", ["canonical_id"], ["id"])
+    op.create_index("ix_apartment_canonical_id", "apartment", ["canonical_id"])
+    op.create_table(
+        "apartment_signature",
+        sa.Column("apartment_id", sa.Integer(), nullable=False),
+        sa.Column("content_hash", sa.String(length=32), nullable=True),
+        sa.Column("signature", postgresql.ARRAY(sa.BigInteger()), nullable=False),
+        sa.ForeignKeyConstraint(["apartment_id"], ["apartment.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("apartment_id"),
+    )
+
+
+def downgrade():
+    """Reverse actions performed during upgrade."""
+    op.drop_table("apartment_signature")
+    op.drop_index("ix_apartment_canonical_id", table_name="apartment")
+    op.drop_constraint("apartment_canonical_id_fkey", "apartment", type_="foreignkey")
+    op.drop_column("apartment", "canonical_id")
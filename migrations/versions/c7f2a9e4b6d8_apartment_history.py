@@ -0,0 +1,46 @@
+"""Append-only history of the changed prices, availability and activity of apartments.
+
+Create Date: 2026-10-18 21:12:40.318274
+"""
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+revision = "c7f2a9e4b6d8"
+down_revision = "b9e4c1a7d5f3"
+
+
+def upgrade():
+    """Apply changes to a database (create tables, columns, etc.)."""
+    op.create_table(
+        "apartment_history",
+        sa.Column("id", sa.BigInteger(), nullable=False),
+        sa.Column("apartment_id", sa.Integer(), nullable=False),
+        sa.Column("run_id", sa.Integer(), nullable=True),
+        sa.Column("observed_at", sa.DateTime(), nullable=False),
+        sa.Column("changes", postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+        sa.ForeignKeyConstraint(["apartment_id"], ["apartment.id"], ondelete="CASCADE"),
+        sa.ForeignKeyConstraint(["run_id"], ["crawl_run.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "ix_apartment_history_apartment_id_observed_at", "apartment_history", ["apartment_id", "observed_at"]
+    )
+    # The current values of the existing apartments are their first observation.
+    op.execute(
+        """
+        INSERT INTO apartment_history (apartment_id, run_id, observed_at, changes)
+        SELECT id, last_run_id, coalesce(seen_at, updated_at, now()), jsonb_strip_nulls(jsonb_build_object(
+            'cold_rent_price', cold_rent_price, 'warm_rent_price', warm_rent_price,
+            'additional_price', additional_price, 'heating_price', heating_price,
+            'rooms', rooms, 'size', size, 'availability', availability, 'active', active
+        ))
+        FROM apartment
+        """
+    )
+
+
+def downgrade():
+    """Reverse actions performed during upgrade."""
+    op.drop_index("ix_apartment_history_apartment_id_observed_at", table_name="apartment_history")
+    op.drop_table("apartment_history")
@@ -0,0 +1,42 @@
+"""Apartment/pin rows with their distances, for the admin list.
+
+Create Date: 2026-10-18 14:05:33.102947
+"""
+import sqlalchemy as sa
+from alembic import op
+
+revision = "c8e1f4a9d3b5"
+down_revision = "b2f5d8e3a7c1"
+
+
+def upgrade():
+    """Apply changes to a database (create tables, columns, etc.)."""
+    op.create_table(
+        "apartment_pin",
+        sa.Column("apartment_id", sa.Integer(), nullable=False),
+        sa.Column("pin_id", sa.Integer(), nullable=False),
+        sa.Column("pin_address", sa.String(), nullable=True),
+        sa.Column("minutes", sa.Integer(), nullable=True),
+        sa.Column("meters", sa.Integer(), nullable=True),
+        sa.Column("provisional", sa.Boolean(), nullable=False),
+        sa.ForeignKeyConstraint(["apartment_id"], ["apartment.id"], ondelete="CASCADE"),
+        sa.ForeignKeyConstraint(["pin_id"], ["pin.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("apartment_id", "pin_id"),
+    )
+    op.create_index("ix_apartment_pin_pin_id_minutes", "apartment_pin", ["pin_id", "minutes"])
+    op.execute(
+        """
+        INSERT INTO apartment_pin (apartment_id, pin_id, pin_address, minutes, meters, provisional)
+        SELECT DISTINCT ON (a.id, p.id) a.id, p.id, p.address, d.minutes, d.meters, coalesce(d.provisional, false)
+        FROM apartment a
+        JOIN pin p ON true
+        LEFT JOIN distance d ON d.apartment_id = a.id AND d.pin_id = p.id
+        ORDER BY a.id, p.id, d.provisional, d.updated_at DESC
+        """
+    )
+
+
+def downgrade():
+    """Reverse actions performed during upgrade."""
+    op.drop_index("ix_apartment_pin_pin_id_minutes", table_name="apartment_pin")
+    op.drop_table("apartment_pin")
@@ -0,0 +1,26 @@
+"""Cached exact counts of the admin list.
+
+Create Date: 2026-10-18 16:42:10.518306
+"""
+import sqlalchemy as sa
+from alembic import op
+
+revision = "d4b7e2f9a1c6"
+down_revision = "c8e1f4a9d3b5"
+
+
+def upgrade():
+    """Apply changes to a database (create tables, columns, etc.)."""
+    op.create_table(
+        "cached_count",
+        sa.Column("name", sa.String(), nullable=False),
+        sa.Column("value", sa.BigInteger(), nullable=False),
+        sa.Column("counted_at", sa.DateTime(), nullable=False),
+        sa.Column("stale", sa.Boolean(), nullable=False),
+        sa.PrimaryKeyConstraint("name"),
+    )
+
+
+def downgrade():
+    """Reverse actions performed during upgrade."""
+    op.drop_table("cached_count")
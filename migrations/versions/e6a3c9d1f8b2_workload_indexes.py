@@ -0,0 +1,65 @@
+"""Indexes for the link checker, the distance calculator and the admin search.
+
+Built concurrently, so crawls can keep writing apartments and distances meanwhile.
+
+Create Date: 2026-10-18 17:20:44.730115
+"""
+import sqlalchemy as sa
+from alembic import op
+
+revision = "e6a3c9d1f8b2"
+down_revision = "d4b7e2f9a1c6"
+
+SEARCHABLE_COLUMNS = ("address", "neighborhood", "comments", "description", "equipment", "location", "other")
+
+
+def upgrade():
+    """Apply changes to a database (create tables, columns, etc.)."""
+    # Keep one distance per apartment and pin: the one shown on the admin list (see ApartmentPin.refresh_statement).
+    op.execute(
+        """
+        DELETE FROM distance d
+        USING (
+            SELECT id, row_number() OVER (
+                PARTITION BY pin_id, apartment_id ORDER BY provisional, updated_at DESC, id DESC
+            ) AS position
+            FROM distance
+        ) ranked
+        WHERE d.id = ranked.id AND ranked.position > 1
+        """
+    )
+    with op.get_context().autocommit_block():
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        op.create_index(
+            "ix_apartment_active_last_seen",
+            "apartment",
+            [sa.text("coalesce(seen_at, updated_at)")],
+            postgresql_where=sa.text("active IS true"),
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            "ix_distance_pin_id_apartment_id",
+            "distance",
+            ["pin_id", "apartment_id"],
+            unique=True,
+            postgresql_concurrently=True,
+        )
+        for name in SEARCHABLE_COLUMNS:
+            op.create_index(
+                "ix_apartment_{}_trgm".format(name),
+                "apartment",
+                [name],
+                postgresql_using="gin",
+                postgresql_ops={name: "gin_trgm_ops"},
+                postgresql_concurrently=True,
+            )
+
+
+def downgrade():
+    """Reverse actions performed during upgrade."""
+    with op.get_context().autocommit_block():
+        for name in SEARCHABLE_COLUMNS:
+            op.drop_index("ix_apartment_{}_trgm".format(name), table_name="apartment", postgresql_concurrently=True)
+        op.drop_index("ix_distance_pin_id_apartment_id", table_name="distance", postgresql_concurrently=True)
+        op.drop_index("ix_apartment_active_last_seen", table_name="apartment", postgresql_concurrently=True)
+    # The pg_trgm extension is left installed: other database objects might use it.
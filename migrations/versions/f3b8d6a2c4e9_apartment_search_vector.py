@@ -0,0 +1,43 @@
+"""Weighted full text search column of the apartments, with a GIN index.
+
+The generated column rewrites the apartment table while it's added.
+
+Create Date: 2026-10-18 18:03:27.904512
+"""
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+revision = "f3b8d6a2c4e9"
+down_revision = "e6a3c9d1f8b2"
+
+SEARCH_VECTOR_SQL = (
+    "setweight(to_tsvector('german', coalesce(title, '')), 'A')"
+    " || setweight(to_tsvector('german', coalesce(comments, '')), 'A')"
+    " || setweight(to_tsvector('german', coalesce(description, '')), 'B')"
+    " || setweight(to_tsvector('german', coalesce(equipment, '')), 'C')"
+    " || setweight(to_tsvector('german', coalesce(location, '')), 'C')"
+    " || setweight(to_tsvector('german', coalesce(other, '')), 'D')"
+)
+
+
+def upgrade():
+    """Apply changes to a database (create tables, columns, etc.)."""
+    op.add_column(
+        "apartment",
+        sa.Column("search_vector", postgresql.TSVECTOR(), sa.Computed(SEARCH_VECTOR_SQL, persisted=True)),
+    )
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_apartment_search_vector",
+            "apartment",
+            ["search_vector"],
+            postgresql_using="gin",
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade():
+    """Reverse actions performed during upgrade."""
+    op.drop_index("ix_apartment_search_vector", table_name="apartment")
+    op.drop_column("apartment", "search_vector")
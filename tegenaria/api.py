@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""Read-only JSON API for active apartments and their distances.
+
+Pages are ordered by warm rent (apartments without one last) and ID, with a keyset cursor instead of an offset:
+each page reads only its own rows, however deep it is.
+
+- ``GET /api/apartments?fields=title,warm_rent_price,distances&limit=100&cursor=...``:
+  a JSON page, with the cursor of the next page;
+- ``GET /api/apartments?format=ndjson`` (or ``Accept: application/x-ndjson``):
+  all apartments after the cursor, one JSON object per line.
+"""
+import base64
+import binascii
+import json
+from decimal import Decimal, InvalidOperation
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from flask import Blueprint, Response, abort, jsonify, make_response, request, stream_with_context
+from sqlalchemy import tuple_
+
+from tegenaria.database import db
+from tegenaria.generic import json_value
+from tegenaria.models import Apartment, Distance
+from tegenaria.settings import API_MAX_PAGE_SIZE, API_PAGE_SIZE, API_STREAM_BATCH_SIZE
+
+NDJSON_MIMETYPE = "application/x-ndjson"
+# Apartment columns that can be chosen with ``fields``, plus the distances to the pins.
+FIELDS = (
+    "id",
+    "url",
+    "title",
+    "address",
+    "neighborhood",
+    "rooms",
+    "size",
+    "cold_rent_price",
+    "warm_rent_price",
+    "additional_price",
+    "heating_price",
+    "availability",
+    "description",
+    "equipment",
+    "location",
+    "other",
+    "comments",
+    "created_at",
+    "updated_at",
+    "distances",
+)
+DEFAULT_FIELDS = (
+    "id",
+    "url",
+    "title",
+    "address",
+    "neighborhood",
+    "rooms",
+    "size",
+    "cold_rent_price",
+    "warm_rent_price",
+    "availability",
+    "updated_at",
+    "distances",
+)
+
+# Warm rent and ID of the last apartment of a page.
+Cursor = Tuple[Optional[Decimal], int]
+
+blueprint = Blueprint("api", __name__, url_prefix="/api")
+
+
+def bad_request(message: str):
+    """Stop the request with a JSON error."""
+    abort(make_response(jsonify(error=message), 400))
+
+
+def encode_cursor(cursor: Cursor) -> str:
+    """Opaque string of a cursor, safe in URLs."""
+    price, apartment_id = cursor
+    data = json.dumps([None if price is None else str(price), apartment_id])
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip("=")
+
+
+def decode_cursor(value: str) -> Cursor:
+    """Cursor from the string made by :func:`encode_cursor`.
+
+    :raise ValueError: If the string is not a valid cursor.
+    """
+    try:
+        price, apartment_id = json.loads(base64.urlsafe_b64decode(value + "=" * (-len(value) % 4)))
+        return (None if price is None else Decimal(price)), int(apartment_id)
+    except (binascii.Error, UnicodeDecodeError, TypeError, InvalidOperation, ValueError) as err:
+        raise ValueError("Invalid cursor: {}".format(value)) from err
+
+
+def parse_fields(value: Optional[str]) -> List[str]:
+    """Fields chosen in a comma separated list; the ID is always included.
+
+    :raise ValueError: If a field is unknown.
+    """
+    if not value:
+        return list(DEFAULT_FIELDS)
+    fields = [field.strip() for field in value.split(",") if field.strip()]
+    unknown = [field for field in fields if field not in FIELDS]
+    if unknown:
+        raise ValueError("Unknown fields: {}".format(", ".join(unknown)))
+    return ["id"] + [field for field in fields if field != "id"]
+
+
+def fetch_page(fields: List[str], cursor: Optional[Cursor], limit: int) -> List[Any]:
+    """Active apartments after a cursor, ordered by warm rent and ID.
+
+    Apartments with a warm rent come first, with a row comparison on the index of (warm_rent_price, id);
+    the ones without come after them, by ID.
+    """
+    columns = [Apartment.id, Apartment.warm_rent_price] + [
+        getattr(Apartment, field) for field in fields if field not in ("id", "warm_rent_price", "distances")
+    ]
+    query = db.session.query(*columns).filter(Apartment.active.is_(True))
+
+    rows = []  # type: List[Any]
+    after_id = 0
+    if cursor is None or cursor[0] is not None:
+        priced = query.filter(Apartment.warm_rent_price.isnot(None))
+        if cursor is not None:
+            priced = priced.filter(tuple_(Apartment.warm_rent_price, Apartment.id) > tuple_(*cursor))
+        rows = priced.order_by(Apartment.warm_rent_price, Apartment.id).limit(limit).all()
+    else:
+        after_id = cursor[1]
+    if len(rows) < limit:
+        unpriced = query.filter(Apartment.warm_rent_price.is_(None), Apartment.id > after_id)
+        rows += unpriced.order_by(Apartment.id).limit(limit - len(rows)).all()
+    return rows
+
+
+def fetch_distances(apartment_ids: List[int]) -> Dict[int, List[Dict[str, Any]]]:
+    """Distances of some apartments to the pins, by apartment ID."""
+    distances = {}  # type: Dict[int, List[Dict[str, Any]]]
+    if not apartment_ids:
+        return distances
+    query = (
+        db.session.query(
+            Distance.apartment_id, Distance.pin_id, Distance.meters, Distance.minutes, Distance.provisional
+        )
+        .filter(Distance.apartment_id.in_(apartment_ids))
+        .order_by(Distance.apartment_id, Distance.pin_id)
+    )
+    for apartment_id, pin_id, meters, minutes, provisional in query:
+        distances.setdefault(apartment_id, []).append(
+            {"pin_id": pin_id, "meters": meters, "minutes": minutes, "provisional": provisional}
+        )
+    return distances
+
+
+def serialize(rows: List[Any], fields: List[str]) -> List[Dict[str, Any]]:
+    """Apartments with the chosen fields."""
+    distances = fetch_distances([row.id for row in rows]) if "distances" in fields else {}
+    items = []
+    for row in rows:
+        values = row._asdict()
+        item = {field: json_value(values[field]) for field in fields if field != "distances"}
+        if "distances" in fields:
+            item["distances"] = distances.get(row.id, [])
+        items.append(item)
+    return items
+
+
+def stream(fields: List[str], cursor: Optional[Cursor]) -> Iterator[str]:
+    """All apartments after a cursor as JSON lines, reading one batch at a time."""
+    while True:
+        rows = fetch_page(fields, cursor, API_STREAM_BATCH_SIZE)
+        for item in serialize(rows, fields):
+            yield json.dumps(item, ensure_ascii=False) + "\n"
+        if len(rows) < API_STREAM_BATCH_SIZE:
+            return
+        cursor = rows[-1].warm_rent_price, rows[-1].id
+
+
+@blueprint.route("/apartments")
+def apartments():
+    """List active apartments and their distances, one page at a time or streamed as NDJSON."""
+    try:
+        fields = parse_fields(request.args.get("fields"))
+        cursor = decode_cursor(request.args["cursor"]) if request.args.get("cursor") else None
+    except ValueError as err:
+        bad_request(str(err))
+
+    if request.args.get("format") == "ndjson" or request.accept_mimetypes.best == NDJSON_MIMETYPE:
+        return Response(stream_with_context(stream(fields, cursor)), mimetype=NDJSON_MIMETYPE)
+
+    limit = request.args.get("limit", API_PAGE_SIZE, type=int)
+    if not 0 < limit <= API_MAX_PAGE_SIZE:
+        bad_request("The limit must be between 1 and {}".format(API_MAX_PAGE_SIZE))
+    rows = fetch_page(fields, cursor, limit)
+    next_cursor = encode_cursor((rows[-1].warm_rent_price, rows[-1].id)) if len(rows) == limit else None
+    return jsonify(apartments=serialize(rows, fields), next_cursor=next_cursor)
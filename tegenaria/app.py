@@ -5,7 +5,7 @@ from flask_admin import Admin
 from flask_admin.base import AdminIndexView
 from flask_admin.contrib.sqla import ModelView
 
-from tegenaria import commands
+from tegenaria import api, commands
 from tegenaria.extensions import db, debug_toolbar, migrate
 from tegenaria.models import Apartment, Opinion, Pin
 from tegenaria.settings import ProdConfig
@@ -23,6 +23,7 @@ def create_app(config_object=ProdConfig):
     app.config.from_object(config_object)
     register_extensions(app)
     register_admin(app)
+    register_blueprints(app)
     register_errorhandlers(app)
     register_shellcontext(app)
     register_commands(app)
@@ -51,6 +52,12 @@ def register_admin(app):
     return None
 
 
+def register_blueprints(app):
+    """Register Flask blueprints."""
+    app.register_blueprint(api.blueprint)
+    return None
+
+
 def register_errorhandlers(app):
     """Register error handlers."""
 
@@ -81,5 +88,9 @@ def register_commands(app):
     app.cli.add_command(commands.clean)
     app.cli.add_command(commands.urls)
     app.cli.add_command(commands.distance)
+    app.cli.add_command(commands.centroids)
+    app.cli.add_command(commands.export)
+    app.cli.add_command(commands.dedup)
     app.cli.add_command(commands.vacuum)
     app.cli.add_command(commands.crawl)
+    app.cli.add_command(commands.replay)
@@ -4,7 +4,7 @@ import os
 from glob import glob
 from subprocess import call
 
-from click import argument, command, echo, option
+from click import Choice, ClickException, DateTime, Path, argument, command, echo, option
 from flask import current_app
 from flask.cli import with_appcontext
 from plumbum import RETCODE, local
@@ -129,10 +129,66 @@ def urls(url, order):
 
 
 @command()
+@option("-o", "--offline", default=False, is_flag=True, help="Only estimate the missing distances from centroids")
 @with_appcontext
-def distance():
+def distance(offline):
     """Calculate distances."""
-    DistanceCalculator().calculate()
+    DistanceCalculator().calculate(offline=offline)
+
+
+@command()
+@argument("csv_file", type=Path(exists=True, dir_okay=False))
+@with_appcontext
+def centroids(csv_file):
+    """Import postcode and street centroids, used to estimate distances offline.
+
+    The CSV file has the columns postcode, street (empty for a whole postcode area), latitude and longitude.
+    """
+    from tegenaria.extensions import db
+    from tegenaria.geo import read_centroids
+    from tegenaria.models import Centroid
+
+    rows = list({(row["kind"], row["key"]): row for row in read_centroids(csv_file)}.values())
+    for start in range(0, len(rows), 1000):
+        db.session.execute(Centroid.upsert_statement(rows[start : start + 1000]))
+    db.session.commit()
+    echo("{} centroids imported".format(len(rows)))
+
+
+@command()
+@argument("output", type=Path(dir_okay=False, writable=True))
+@option("-f", "--format", "format_", type=Choice(["csv", "jsonl", "parquet"]), default="csv", help="File format")
+@option("-s", "--since", type=DateTime(), default=None, help="Only rows changed since this date (incremental export)")
+@option("-c", "--chunk-size", default=None, type=int, help="Rows read and written at a time")
+@with_appcontext
+def export(output, format_, since, chunk_size):
+    """Export apartments and their distances, one row per apartment and pin.
+
+    Parquet files need pyarrow (``poetry install -E parquet``).
+    """
+    from tegenaria.export import EXPORT_CHUNK_SIZE, export_apartments
+
+    try:
+        stats = export_apartments(output, format_, since, chunk_size or EXPORT_CHUNK_SIZE)
+    except ImportError as err:
+        raise ClickException(str(err))
+    echo("{} rows exported to {}".format(stats["rows"], output))
+    if stats["last_change"] is not None:
+        echo("Next incremental export: --since '{:%Y-%m-%d %H:%M:%S}'".format(stats["last_change"]))
+
+
+@command()
+@with_appcontext
+def dedup():
+    """Find the same apartment listed on different portals; only its canonical listing gets distances and is listed.
+
+    Run it after crawling, before "flask distance".
+    """
+    from tegenaria.utils import deduplicate_apartments
+
+    stats = deduplicate_apartments()
+    for key, value in sorted(stats.items()):
+        echo("{}: {}".format(key, value))
 
 
 @command()
@@ -145,7 +201,14 @@ def vacuum():
 
 @command()
 @argument("spiders", nargs=-1)
-def crawl(spiders):
+@option(
+    "-p",
+    "--processes",
+    default=1,
+    type=int,
+    help="Crawl in worker processes; with more processes than spiders, each spider is split in shards",
+)
+def crawl(spiders, processes):
     """Crawl the desired spiders.
 
     Type the name or part of the name of the spider.
@@ -154,11 +217,41 @@ def crawl(spiders):
     """
     settings = get_project_settings()
     loader = SpiderLoader(settings)
+    spider_names = [
+        spider_name
+        for spider_name in loader.list()
+        if not spiders or any(part for part in spiders if part in spider_name)
+    ]
+
+    if processes > 1:
+        from tegenaria.workers import crawl_in_processes
+
+        for spider_name, stats in sorted(crawl_in_processes(spider_names, processes).items()):
+            echo(spider_name)
+            for key, value in sorted(stats.items()):
+                echo("  {}: {}".format(key, value))
+        return
 
     process = CrawlerProcess(settings)
-    for spider_name in loader.list():
-        if not spiders or any(part for part in spiders if part in spider_name):
-            process.crawl(spider_name)
+    for spider_name in spider_names:
+        process.crawl(spider_name)
 
     # The script will block here until the crawling is finished
     process.start()
+
+
+@command()
+@argument("spider")
+@option("-p", "--processes", default=os.cpu_count(), type=int, help="Worker processes (default: number of CPUs)")
+@option("-c", "--chunk-size", default=500, type=int, help="Cached responses sent to a worker at a time")
+@option("-f", "--force", default=False, is_flag=True, help="Save apartments even if their content didn't change")
+def replay(spider, processes, chunk_size, force):
+    """Parse the HTTP cache of a spider again and save the apartments, without network.
+
+    Use it after fixing a parser, instead of crawling the whole site again.
+    """
+    from tegenaria.replay import replay_cache
+
+    stats = replay_cache(spider, processes, chunk_size=chunk_size, force=force)
+    for key, value in sorted(stats.items()):
+        echo("{}: {}".format(key, value))
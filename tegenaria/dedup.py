@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""Find the same listing on different portals: MinHash signatures and locality-sensitive hashing (LSH).
+
+Each apartment is a set of features: word 3-grams of its description, its street and postcode, size and rooms.
+The MinHash signature of the set estimates the Jaccard similarity between two apartments.
+Signatures are split in bands; apartments with an identical band land in the same LSH bucket and become candidates,
+so each apartment is only compared with a few others instead of all of them.
+Candidates that are similar enough, with the same rooms and about the same size, are grouped;
+the oldest apartment of a group is the canonical listing, the others point to it.
+"""
+import random
+import re
+from collections import defaultdict
+from decimal import Decimal
+from hashlib import blake2b
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from tegenaria.geo import centroid_keys
+
+# Hashes are permuted modulo a Mersenne prime, which fits the bigint array of the signatures.
+MERSENNE_PRIME = (1 << 61) - 1
+NUM_PERMUTATIONS = 64
+# 16 bands of 4 rows: apartments with a similarity of 0.5 have a 64% chance to share a bucket, 0.8 has 99.9%.
+LSH_BANDS = 16
+LSH_ROWS = NUM_PERMUTATIONS // LSH_BANDS
+WORD_REGEX = re.compile(r"\w+")
+SHINGLE_SIZE = 3
+# Two listings of the same apartment can round the size differently.
+SIZE_TOLERANCE = Decimal("0.05")
+
+
+def make_permutations(count: int, seed: int) -> List[Tuple[int, int]]:
+    """Random ``a * x + b`` permutations of the hashes."""
+    generator = random.Random(seed)
+    return [(generator.randrange(1, MERSENNE_PRIME), generator.randrange(0, MERSENNE_PRIME)) for _ in range(count)]
+
+
+# Fixed seed: signatures are stored, and must be comparable with the ones computed later.
+PERMUTATIONS = make_permutations(NUM_PERMUTATIONS, seed=24)
+
+
+class Listing(NamedTuple):
+    """What is compared between apartments."""
+
+    signature: List[int]
+    size: Optional[Decimal]
+    rooms: Optional[Decimal]
+
+
+def features(
+    description: Optional[str], address: Optional[str], size: Optional[Decimal], rooms: Optional[Decimal]
+) -> Set[str]:
+    """Features of an apartment: word 3-grams of the description, street and postcode, size and rooms.
+
+    >>> sorted(features("Helle Wohnung mit Balkon", "Karl-Marx-Straße 5, 12043 Berlin", Decimal("65.5"), Decimal(2)))
+    ... # doctest: +NORMALIZE_WHITESPACE
+    ['helle wohnung mit', 'location:postcode:12043', 'location:street:karl marx str 12043', 'rooms:2',
+     'size:66', 'wohnung mit balkon']
+    """
+    words = WORD_REGEX.findall((description or "").casefold())
+    result = {" ".join(words[start : start + SHINGLE_SIZE]) for start in range(max(1, len(words) - SHINGLE_SIZE + 1))}
+    result.discard("")
+    result.update("location:{}:{}".format(kind, key) for kind, key in centroid_keys(address or ""))
+    if size:
+        result.add("size:{}".format(round(size)))
+    if rooms:
+        result.add("rooms:{:f}".format(rooms.normalize()))
+    return result
+
+
+def minhash(items: Iterable[str]) -> List[int]:
+    """Signature of a set with MinHash: for each permutation, the minimum of the permuted hashes.
+
+    An empty set has an empty signature, which matches nothing.
+    """
+    hashes = [int.from_bytes(blake2b(item.encode(), digest_size=8).digest(), "big") for item in items]
+    if not hashes:
+        return []
+    return [min((a * value + b) % MERSENNE_PRIME for value in hashes) for a, b in PERMUTATIONS]
+
+
+def similarity(signature1: List[int], signature2: List[int]) -> float:
+    """Estimated Jaccard similarity of two sets: the fraction of equal values in their signatures."""
+    if not signature1 or len(signature1) != len(signature2):
+        return 0.0
+    return sum(1 for value1, value2 in zip(signature1, signature2) if value1 == value2) / len(signature1)
+
+
+def same_apartment(listing1: Listing, listing2: Listing, threshold: float) -> bool:
+    """Similar listings with the same rooms and about the same size; unknown values don't count."""
+    if listing1.rooms and listing2.rooms and listing1.rooms != listing2.rooms:
+        return False
+    if listing1.size and listing2.size:
+        if abs(listing1.size - listing2.size) > SIZE_TOLERANCE * max(listing1.size, listing2.size):
+            return False
+    return similarity(listing1.signature, listing2.signature) >= threshold
+
+
+class LshIndex:
+    """Buckets of signatures by band; signatures sharing a bucket are candidate duplicates."""
+
+    def __init__(self):
+        """Init instance."""
+        self.buckets = [defaultdict(list) for _ in range(LSH_BANDS)]  # type: List[Dict[tuple, List[int]]]
+
+    def add(self, key: int, signature: List[int]) -> Set[int]:
+        """Add a signature.
+
+        :return: Keys of the signatures already added that share a bucket with this one.
+        """
+        candidates = set()  # type: Set[int]
+        if len(signature) != NUM_PERMUTATIONS:
+            return candidates
+        for band, buckets in enumerate(self.buckets):
+            bucket = buckets[tuple(signature[band * LSH_ROWS : (band + 1) * LSH_ROWS])]
+            candidates.update(bucket)
+            bucket.append(key)
+        return candidates
+
+
+def group_duplicates(listings: Dict[int, Listing], threshold: float) -> Dict[int, int]:
+    """Group the listings of the same apartment.
+
+    :param listings: Listings by apartment ID.
+    :return: The canonical ID of each duplicate, the lowest ID of its group; canonical listings are not included.
+    """
+    parents = {}  # type: Dict[int, int]
+
+    def root(key: int) -> int:
+        """First ID of the group of a listing."""
+        while parents.get(key, key) != key:
+            key = parents[key]
+        return key
+
+    index = LshIndex()
+    for key in sorted(listings):
+        for candidate in index.add(key, listings[key].signature):
+            if same_apartment(listings[key], listings[candidate], threshold):
+                root1, root2 = root(key), root(candidate)
+                if root1 != root2:
+                    parents[max(root1, root2)] = min(root1, root2)
+    return {key: root(key) for key in parents}
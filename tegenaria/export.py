@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""Export apartments and their distances to CSV, JSON lines or Parquet files.
+
+Rows are read through a server-side cursor and written one chunk at a time, so memory doesn't grow with the table.
+Parquet needs the optional ``pyarrow`` package (``poetry install -E parquet``).
+"""
+import csv
+import json
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import BigInteger, Boolean, Date, DateTime, Float, Integer, Numeric, or_, select
+from sqlalchemy.sql import ColumnElement
+from sqlalchemy.types import TypeEngine
+
+from tegenaria.database import db
+from tegenaria.generic import json_value
+from tegenaria.models import Apartment, Distance
+from tegenaria.settings import EXPORT_CHUNK_SIZE
+
+APARTMENT_COLUMNS = (
+    "id",
+    "url",
+    "active",
+    "title",
+    "address",
+    "neighborhood",
+    "rooms",
+    "size",
+    "cold_rent_price",
+    "warm_rent_price",
+    "additional_price",
+    "heating_price",
+    "availability",
+    "description",
+    "equipment",
+    "location",
+    "other",
+    "comments",
+    "created_at",
+    "updated_at",
+    "seen_at",
+)
+
+
+def export_statement(since: Optional[datetime] = None):
+    """Build the query of apartments joined with their distances, one row per apartment and pin.
+
+    :param since: Only rows whose apartment or distance changed since this date, for incremental exports.
+    """
+    apartment, distance = Apartment.__table__, Distance.__table__
+    columns = [apartment.c[name] for name in APARTMENT_COLUMNS] + [
+        distance.c.pin_id,
+        distance.c.meters,
+        distance.c.minutes,
+        distance.c.provisional,
+        distance.c.updated_at.label("distance_updated_at"),
+    ]
+    query = select(columns).select_from(apartment.outerjoin(distance, distance.c.apartment_id == apartment.c.id))
+    if since is not None:
+        query = query.where(or_(apartment.c.updated_at >= since, distance.c.updated_at >= since))
+    return query.order_by(apartment.c.id, distance.c.pin_id)
+
+
+class CsvWriter:
+    """CSV file with a header; decimals keep all their digits, dates are in ISO 8601."""
+
+    def __init__(self, path: str, columns: List[ColumnElement]):
+        """Open the file and write the header."""
+        self.file = open(path, "w", newline="", encoding="utf-8")
+        self.writer = csv.writer(self.file)
+        self.writer.writerow([column.name for column in columns])
+
+    def write(self, rows: List[Any]):
+        """Write a chunk of rows."""
+        self.writer.writerows(
+            ["" if value is None else value.isoformat() if isinstance(value, date) else value for value in row]
+            for row in rows
+        )
+
+    def close(self):
+        """Close the file."""
+        self.file.close()
+
+
+class JsonLinesWriter:
+    """One JSON object per line, with the same values as the JSON API."""
+
+    def __init__(self, path: str, columns: List[ColumnElement]):
+        """Open the file."""
+        self.file = open(path, "w", encoding="utf-8")
+        self.names = [column.name for column in columns]
+
+    def write(self, rows: List[Any]):
+        """Write a chunk of rows."""
+        for row in rows:
+            item = {name: json_value(value) for name, value in zip(self.names, row)}
+            self.file.write(json.dumps(item, ensure_ascii=False) + "\n")
+
+    def close(self):
+        """Close the file."""
+        self.file.close()
+
+
+class ParquetWriter:
+    """Parquet file with typed columns (decimals, dates, timestamps); each chunk is a row group."""
+
+    def __init__(self, path: str, columns: List[ColumnElement]):
+        """Build the Arrow schema from the column types, and open the file."""
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError as err:
+            raise ImportError("Parquet export needs pyarrow: poetry install -E parquet") from err
+
+        self.pyarrow = pyarrow
+        self.schema = pyarrow.schema([(column.name, self.arrow_type(column.type)) for column in columns])
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+
+    def arrow_type(self, column_type: TypeEngine):
+        """Arrow type of a SQLAlchemy column type."""
+        pyarrow = self.pyarrow
+        if isinstance(column_type, Numeric) and not isinstance(column_type, Float):
+            return pyarrow.decimal128(column_type.precision or 38, column_type.scale or 0)
+        if isinstance(column_type, Float):
+            return pyarrow.float64()
+        if isinstance(column_type, DateTime):
+            return pyarrow.timestamp("us")
+        if isinstance(column_type, Date):
+            return pyarrow.date32()
+        if isinstance(column_type, Boolean):
+            return pyarrow.bool_()
+        if isinstance(column_type, BigInteger):
+            return pyarrow.int64()
+        if isinstance(column_type, Integer):
+            return pyarrow.int32()
+        return pyarrow.string()
+
+    def write(self, rows: List[Any]):
+        """Write a chunk of rows as one row group."""
+        arrays = [
+            self.pyarrow.array([row[index] for row in rows], type=field.type) for index, field in enumerate(self.schema)
+        ]
+        self.writer.write_table(self.pyarrow.Table.from_arrays(arrays, schema=self.schema))
+
+    def close(self):
+        """Write the footer and close the file."""
+        self.writer.close()
+
+
+WRITERS = {"csv": CsvWriter, "jsonl": JsonLinesWriter, "parquet": ParquetWriter}
+
+
+def export_apartments(
+    path: str, format_: str, since: Optional[datetime] = None, chunk_size: int = EXPORT_CHUNK_SIZE
+) -> Dict[str, Any]:
+    """Export apartments and distances to a file.
+
+    :param format_: One of the keys of :data:`WRITERS`.
+    :param since: Only rows changed since this date.
+    :return: Number of rows, and the latest change exported (the ``since`` of the next incremental export).
+    """
+    statement = export_statement(since)
+    writer = WRITERS[format_](path, list(statement.c))
+    stats = {"rows": 0, "last_change": None}  # type: Dict[str, Any]
+    connection = db.session.connection().execution_options(stream_results=True)
+    result = connection.execute(statement)
+    try:
+        while True:
+            rows = result.fetchmany(chunk_size)
+            if not rows:
+                break
+            writer.write(rows)
+            stats["rows"] += len(rows)
+            for row in rows:
+                for change in (row.updated_at, row.distance_updated_at):
+                    if change is not None and (stats["last_change"] is None or change > stats["last_change"]):
+                        stats["last_change"] = change
+    finally:
+        result.close()
+        writer.close()
+    return stats
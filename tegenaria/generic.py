@@ -1,5 +1,7 @@
 """Generic utilities that can be reused by other projects."""
 import re
+from datetime import date
+from decimal import Decimal
 from getpass import getpass
 from typing import Any, Optional
 
@@ -11,6 +13,9 @@ from markupsafe import Markup
 from sqlalchemy import Column
 
 FIELDS_REGEX = re.compile(r"{([^}]+)}")
+ADDRESS_STREET_REGEX = re.compile(r"strasse\b")
+ADDRESS_SEPARATORS_REGEX = re.compile(r"[\W_]+")
+ADDRESS_IGNORED_WORDS = {"deutschland", "germany"}
 
 
 def read_from_keyring(project_name, key, secret=True, always_ask=False):
@@ -46,11 +51,30 @@ def render_link(url: str, text: str = None, target: Optional[str] = "_blank", ti
     )
 
 
+def normalize_address(address: str) -> str:
+    """Normalize an address to compare it with others: case, "Straße"/"Str.", punctuation and country are ignored.
+
+    >>> normalize_address("Karl-Marx-Straße 5, 12043 Berlin, Deutschland")
+    'karl marx str 5 12043 berlin'
+    """
+    text = ADDRESS_STREET_REGEX.sub("str", address.casefold())
+    return " ".join(word for word in ADDRESS_SEPARATORS_REGEX.split(text) if word and word not in ADDRESS_IGNORED_WORDS)
+
+
 def when_none(value: Any, something: Any = "") -> str:
     """Return something when the value is None. Default: empty string."""
     return something if value is None else value
 
 
+def json_value(value: Any) -> Any:
+    """Convert a column value to JSON: decimals to numbers, dates and datetimes to ISO 8601 strings."""
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
 def add_mandatory_column(
     table_name: str,
     column_name: str,
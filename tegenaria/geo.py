@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""Offline distances: addresses located on postcode and street centroids, and a transit time model.
+
+Used to fill provisional distances when no Google Maps API key is left;
+the model is calibrated on the distances already returned by Google.
+"""
+import csv
+import re
+from math import asin, cos, radians, sin, sqrt
+from statistics import median
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from tegenaria.generic import normalize_address
+
+EARTH_RADIUS_METERS = 6371008.8
+POSTCODE_REGEX = re.compile(r"\b(\d{5})\b")
+# House number at the end of a normalized street: "5", "5a", "5 7"
+HOUSE_NUMBER_REGEX = re.compile(r"(\s+\d+\w?)+$")
+# Calibration needs enough Google distances to be better than the default model.
+MIN_CALIBRATION_SAMPLES = 20
+
+CentroidKey = Tuple[str, str]
+
+
+class Point(NamedTuple):
+    """Latitude and longitude, in degrees."""
+
+    latitude: float
+    longitude: float
+
+
+def centroid_keys(address: str) -> List[CentroidKey]:
+    """Keys of the centroids that can locate an address, the most precise first.
+
+    >>> centroid_keys("Karl-Marx-Straße 5a, 12043 Berlin")
+    [('street', 'karl marx str 12043'), ('postcode', '12043')]
+    """
+    match = POSTCODE_REGEX.search(address)
+    if not match:
+        return []
+    postcode = match.group(1)
+    street = HOUSE_NUMBER_REGEX.sub("", normalize_address(address[: match.start()].split(",")[0]))
+    keys = [("street", "{} {}".format(street, postcode))] if street else []
+    keys.append(("postcode", postcode))
+    return keys
+
+
+def street_key(street: str, postcode: str) -> str:
+    """Key of a street centroid, as built by :func:`centroid_keys`."""
+    return "{} {}".format(HOUSE_NUMBER_REGEX.sub("", normalize_address(street)), postcode)
+
+
+def read_centroids(path: str) -> Iterator[Dict[str, Any]]:
+    """Read centroids from a CSV file with the columns postcode, street, latitude and longitude.
+
+    Rows with an empty street are the centroids of whole postcode areas.
+    They can be computed from an OpenStreetMap extract of the city, for instance.
+    """
+    with open(path, newline="", encoding="utf-8") as handle:
+        for row in csv.DictReader(handle):
+            postcode, street = row["postcode"].strip(), (row.get("street") or "").strip()
+            yield {
+                "kind": "street" if street else "postcode",
+                "key": street_key(street, postcode) if street else postcode,
+                "latitude": float(row["latitude"]),
+                "longitude": float(row["longitude"]),
+            }
+
+
+def haversine_matrix(origins: List[Point], destinations: List[Point]) -> List[List[float]]:
+    """Great-circle distances in meters, from each origin (rows) to each destination (columns).
+
+    Radians and cosines are computed once per point, so each pair only costs a few multiplications and one asin.
+    """
+    destination_rows = [(radians(point.latitude), radians(point.longitude)) for point in destinations]
+    destination_rows = [(latitude, longitude, cos(latitude)) for latitude, longitude in destination_rows]
+    matrix = []
+    for origin in origins:
+        latitude1, longitude1 = radians(origin.latitude), radians(origin.longitude)
+        cos1 = cos(latitude1)
+        row = []
+        for latitude2, longitude2, cos2 in destination_rows:
+            half = sin((latitude2 - latitude1) / 2) ** 2 + cos1 * cos2 * sin((longitude2 - longitude1) / 2) ** 2
+            row.append(2 * EARTH_RADIUS_METERS * asin(min(1.0, sqrt(half))))
+        matrix.append(row)
+    return matrix
+
+
+class TransitModel(NamedTuple):
+    """Route length and travel time from the straight line distance.
+
+    The default values are typical for Berlin public transport: routes 35% longer than the straight line,
+    8 minutes to walk and wait, and 25 km/h on the way.
+    """
+
+    detour: float = 1.35
+    fixed_minutes: float = 8.0
+    minutes_per_km: float = 2.4
+
+    def estimate(self, straight_meters: float) -> Tuple[int, int]:
+        """Meters and minutes of a route."""
+        meters = straight_meters * self.detour
+        return round(meters), round(self.fixed_minutes + self.minutes_per_km * meters / 1000)
+
+
+def calibrate(samples: List[Tuple[float, int, int]], default: TransitModel = TransitModel()) -> TransitModel:
+    """Fit the transit model on real routes: median detour, and a least squares line of minutes by route length.
+
+    :param samples: Straight line meters, route meters and minutes of routes returned by Google.
+    :return: The calibrated model, or the default one if there are not enough samples.
+    """
+    samples = [sample for sample in samples if sample[0] > 0 and sample[1] > 0]
+    if len(samples) < MIN_CALIBRATION_SAMPLES:
+        return default
+
+    detour = median(meters / straight for straight, meters, _ in samples)
+    kilometers = [meters / 1000 for _, meters, _ in samples]
+    minutes = [minutes for _, _, minutes in samples]
+    mean_km, mean_minutes = sum(kilometers) / len(samples), sum(minutes) / len(samples)
+    variance = sum((km - mean_km) ** 2 for km in kilometers)
+    if not variance:
+        return default
+    slope = sum((km - mean_km) * (value - mean_minutes) for km, value in zip(kilometers, minutes)) / variance
+    intercept = mean_minutes - slope * mean_km
+    if slope <= 0 or intercept < 0:
+        return default
+    return TransitModel(detour, intercept, slope)
+
+
+class DistanceEstimator:
+    """Estimate distances between addresses located on centroids."""
+
+    def __init__(self, centroids: Dict[CentroidKey, Point], model: TransitModel = TransitModel()):
+        """Init instance."""
+        self.centroids = centroids
+        self.model = model
+
+    def locate(self, address: str) -> Optional[Point]:
+        """Centroid of the street or of the postcode of an address, or None if neither is known."""
+        for key in centroid_keys(address):
+            point = self.centroids.get(key)
+            if point is not None:
+                return point
+        return None
+
+    def straight_distances(self, origins: Dict[str, str], destinations: Dict[int, str]) -> Dict[Tuple[str, int], float]:
+        """Straight line meters between each located origin and destination.
+
+        :param origins: Addresses by key.
+        :param destinations: Addresses by ID.
+        """
+        located_origins = [(key, self.locate(address)) for key, address in origins.items()]
+        located_origins = [(key, point) for key, point in located_origins if point is not None]
+        located_destinations = [(key, self.locate(address)) for key, address in destinations.items()]
+        located_destinations = [(key, point) for key, point in located_destinations if point is not None]
+
+        matrix = haversine_matrix([point for _, point in located_origins], [point for _, point in located_destinations])
+        return {
+            (origin_key, destination_key): meters
+            for (origin_key, _), row in zip(located_origins, matrix)
+            for (destination_key, _), meters in zip(located_destinations, row)
+        }
+
+    def estimate(self, origins: Dict[str, str], destinations: Dict[int, str]) -> Dict[Tuple[str, int], Tuple[int, int]]:
+        """Meters and minutes from each located origin to each located destination."""
+        return {
+            key: self.model.estimate(meters) for key, meters in self.straight_distances(origins, destinations).items()
+        }
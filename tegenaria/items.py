@@ -5,34 +5,79 @@ Define here the models for your scraped items.
 See documentation in:
 http://doc.scrapy.org/en/latest/topics/items.html
 """
+import json
 import re
+from hashlib import blake2b
+from typing import Iterable, List, Optional
 
 from scrapy import Field, Item
 from scrapy.loader.processors import Join, MapCompose
 
-REGEX_DIGITS_SEPARATORS_ONLY = re.compile(r"[\d,.]+")
-REGEX_DECIMAL_POINT = re.compile(r"^[\d,]+\.\d{1,2}$")
-REGEX_DECIMAL_COMMA = re.compile(r"^[\d.]+,\d{1,2}$")
-REGEX_GROUP_OF_THREE_COMMA = re.compile(r"^\d+(,\d{3})+$")
-REGEX_GROUP_OF_THREE_POINT = re.compile(r"^\d+(.\d{3})+$")
+REGEX_NOT_DIGITS_SEPARATORS = re.compile(r"[^\d,.]+")
+# One pass to extract the number and find its format, when there is only one run of digits and separators.
+# Group "point": decimal point (1,000.50) or groups of three with commas (1,000).
+# Group "comma": decimal comma (1.000,50) or groups of three with points (1.000).
+# Group "other": anything else made of digits and separators, kept as is.
+REGEX_NUMBER = re.compile(
+    r"[^\d,.]*(?:(?P<point>[\d,]+\.\d{1,2}|\d+(?:,\d{3})+)|(?P<comma>[\d.]+,\d{1,2}|\d+(?:\.\d{3})+)"
+    r"|(?P<other>[\d,.]*))[^\d,.]*"
+)
+# Separates values when a whole column is cleaned at once; it is removed from the values themselves.
+COLUMN_SEPARATOR = "\x00"
+REGEX_NOT_DIGITS_SEPARATORS_COLUMN = re.compile(r"[^\d,.\x00]+")
 
 
-def clean_number(value: str) -> str:
-    """Clean a numeric value, fix the decimal separator, remove any extra chars."""
-    digits_separators = REGEX_DIGITS_SEPARATORS_ONLY.findall(value)
-    value = "".join(digits_separators)
-
-    if REGEX_DECIMAL_POINT.match(value) or REGEX_GROUP_OF_THREE_COMMA.match(value):
+def format_number(match) -> str:
+    """Fix the decimal separator of a number matched by ``REGEX_NUMBER``, and remove zero decimals."""
+    number_format = match.lastgroup
+    value = match.group(number_format)
+    if number_format == "point":
         value = value.replace(",", "")
-    elif REGEX_DECIMAL_COMMA.match(value) or REGEX_GROUP_OF_THREE_POINT.match(value):
+    elif number_format == "comma":
         value = value.replace(".", "").replace(",", ".")
 
-    for ending in (".00", ".0"):
-        if value.endswith(ending):
-            value = value[0 : -len(ending)]
+    if value.endswith(".00"):
+        value = value[:-3]
+    if value.endswith(".0"):
+        value = value[:-2]
     return value
 
 
+def clean_number(value: str) -> str:
+    """Clean a numeric value, fix the decimal separator, remove any extra chars."""
+    match = REGEX_NUMBER.fullmatch(value)
+    if match is None:
+        # More than one run of digits and separators: join them first.
+        match = REGEX_NUMBER.fullmatch(REGEX_NOT_DIGITS_SEPARATORS.sub("", value))
+    return format_number(match)
+
+
+def clean_numbers(values: Iterable[Optional[str]]) -> List[Optional[str]]:
+    """Clean a whole column of numeric values at once, e.g. to reprocess the ``json`` payloads stored in the database.
+
+    Repeated values (very common for prices, sizes and rooms) are cleaned only once,
+    and the extra chars of all distinct values are removed in one regex call.
+    None values are kept as None.
+    """
+    values = list(values)
+    distinct = list({value for value in values if value is not None})
+    joined = COLUMN_SEPARATOR.join(distinct)
+    if joined.count(COLUMN_SEPARATOR) == max(len(distinct) - 1, 0):
+        stripped = REGEX_NOT_DIGITS_SEPARATORS_COLUMN.sub("", joined).split(COLUMN_SEPARATOR)
+        cleaned = {value: format_number(REGEX_NUMBER.fullmatch(number)) for value, number in zip(distinct, stripped)}
+    else:
+        # A value has the separator itself: clean one by one.
+        cleaned = {value: clean_number(value) for value in distinct}
+    return [None if value is None else cleaned[value] for value in values]
+
+
+def content_hash(item: Item) -> str:
+    """Stable hash of the scraped fields of an item, independent of key order and surrounding whitespace."""
+    normalized = {key: value.strip() if isinstance(value, str) else value for key, value in dict(item).items()}
+    serialized = json.dumps(normalized, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return blake2b(serialized.encode(), digest_size=16).hexdigest()
+
+
 class ApartmentItem(Item):
     """An apartment item."""
 
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+Define your spider middlewares here.
+
+See: http://scrapy.readthedocs.org/en/latest/topics/spider-middleware.html
+"""
+from typing import Optional, Tuple
+from zlib import crc32
+
+from scrapy import Request
+
+from tegenaria.spiders import SpiderMixin
+
+
+def parse_shard(shard: Optional[str]) -> Optional[Tuple[int, int]]:
+    """Parse a shard spider argument like "0/4" (the first of four shards).
+
+    :return: The shard index and the number of shards, or None if the crawl is not sharded.
+    """
+    if not shard:
+        return None
+    index, count = (int(part) for part in shard.split("/"))
+    if not 0 <= index < count:
+        raise ValueError("Invalid shard {!r}: the index must be between 0 and {}".format(shard, count - 1))
+    return index, count
+
+
+def in_shard(url: str, index: int, count: int) -> bool:
+    """Return True if the URL belongs to the shard; the same URL always goes to the same shard."""
+    return crc32(url.encode()) % count == index
+
+
+class ShardMiddleware(object):
+    """Split the item pages of a spider between crawl processes, with the ``shard`` spider argument.
+
+    Every shard crawls the list pages, but only follows the item pages (and keeps the items) with URLs
+    in its own shard, so each apartment is scraped and saved by exactly one process.
+    Spiders without the argument are not affected.
+    """
+
+    def __init__(self, stats):
+        """Constructor."""
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        """Create the middleware with the stats of the crawler."""
+        return cls(crawler.stats)
+
+    def process_start_requests(self, start_requests, spider: SpiderMixin):
+        """Some spiders start directly on item pages."""
+        return self.filter(start_requests, spider)
+
+    def process_spider_output(self, response, result, spider: SpiderMixin):
+        """Drop item pages and items from other shards."""
+        return self.filter(result, spider)
+
+    @staticmethod
+    def is_item_page(url: str, spider: SpiderMixin) -> bool:
+        """Return True if the URL is an item page; start and list pages are never sharded, even with items on them."""
+        if url in getattr(spider, "start_urls", []):
+            return False
+        callback = spider.item_callback(url)
+        return callback is not None and callback != getattr(spider, "parse", None)
+
+    def filter(self, result, spider: SpiderMixin):
+        """Yield the requests and items of this shard."""
+        shard = parse_shard(getattr(spider, "shard", None))
+        if shard is None:
+            yield from result
+            return
+
+        for output in result:
+            if isinstance(output, Request):
+                if self.is_item_page(output.url, spider) and not in_shard(output.url, *shard):
+                    self.stats.inc_value("shard/dropped_requests", spider=spider)
+                    continue
+            elif output.get("url") and not in_shard(output["url"], *shard):
+                self.stats.inc_value("shard/dropped_items", spider=spider)
+                continue
+            yield output
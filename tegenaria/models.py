@@ -1,9 +1,30 @@
 # -*- coding: utf-8 -*-
 """SQLAlchemy models."""
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import Computed, and_, case, literal, null, or_, select, true
 from sqlalchemy.dialects import postgresql
 from sqlalchemy.sql.functions import func
 
 from tegenaria.database import Column, Model, SurrogatePK, db, reference_column, relationship
+from tegenaria.generic import json_value
+from tegenaria.geo import Point
+
+# Text search configuration of the apartment texts, and the weight of each column in the ranking.
+SEARCH_CONFIG = "german"
+SEARCH_WEIGHTS = (
+    ("title", "A"),
+    ("comments", "A"),
+    ("description", "B"),
+    ("equipment", "C"),
+    ("location", "C"),
+    ("other", "D"),
+)
+SEARCH_VECTOR_SQL = " || ".join(
+    "setweight(to_tsvector('{}', coalesce({}, '')), '{}')".format(SEARCH_CONFIG, column, weight)
+    for column, weight in SEARCH_WEIGHTS
+)
 
 
 class Apartment(SurrogatePK, Model):
@@ -37,9 +58,20 @@ class Apartment(SurrogatePK, Model):
 
     json = db.Column(postgresql.JSONB(none_as_null=True), nullable=False)
     errors = db.Column(postgresql.JSONB(none_as_null=True))
+    # Hash of the scraped item, to skip writes when nothing changed.
+    content_hash = Column(db.String(32))
 
     created_at = Column(db.DateTime, default=func.now())
     updated_at = Column(db.DateTime, onupdate=func.now(), default=func.now())
+    # Last time a spider scraped this apartment, even if nothing changed.
+    seen_at = Column(db.DateTime, default=func.now())
+    # Weighted words of the texts, computed by the database on every write.
+    search_vector = Column(postgresql.TSVECTOR, Computed(SEARCH_VECTOR_SQL, persisted=True))
+    # Last crawl that saw this apartment, and the complete crawl that didn't see it anymore and deactivated it.
+    last_run_id = reference_column("crawl_run", True)
+    deactivated_run_id = reference_column("crawl_run", True)
+    # The same listing on another portal, found by "flask dedup"; None for canonical listings.
+    canonical_id = reference_column("apartment", True, index=True)
 
     distances = relationship("Distance")
 
@@ -56,6 +88,132 @@ class Apartment(SurrogatePK, Model):
         """
         return cls.query.filter_by(url=url).first() or Apartment()
 
+    @classmethod
+    def in_domains(cls, domains: Iterable[str]):
+        """Filter apartments with URLs from any of these domains."""
+        return or_(*[cls.url.contains(domain) for domain in domains])
+
+    @classmethod
+    def full_text(cls, search: str):
+        """Condition and rank of a full text search, with the syntax of web search engines (quotes, "or", "-").
+
+        :return: A tuple with the ``@@`` condition and the ``ts_rank_cd()`` expression.
+        """
+        query = func.websearch_to_tsquery(SEARCH_CONFIG, search)
+        return cls.search_vector.op("@@")(query), func.ts_rank_cd(cls.search_vector, query)
+
+    @classmethod
+    def upsert_statement(cls, rows: List[Dict[str, Any]], insert_only: Iterable[str] = ()):
+        """Build one ``INSERT ... ON CONFLICT (url) DO UPDATE`` statement for many apartments.
+
+        All rows must have the same keys.
+        Scraped columns that come empty (None) keep the value already stored in the database,
+        the same way a partial schema load would leave them untouched.
+        Rows without ``seen_at`` are seen now; rows with it (e.g. replayed from the HTTP cache)
+        never move the date back.
+        Rows with ``last_run_id`` were seen by a crawl, so they are not deactivated by a previous one anymore.
+
+        :param rows: Dicts with column names and values.
+        :param insert_only: Columns written for new apartments only; existing ones keep their value.
+        """
+        table = cls.__table__
+        statement = postgresql.insert(table).values(rows)
+        update = {"updated_at": func.now(), "seen_at": func.now()}
+        if "last_run_id" in rows[0]:
+            update["deactivated_run_id"] = null()
+        for key in rows[0].keys():
+            if key == "url" or key in insert_only:
+                continue
+            if key == "seen_at":
+                update[key] = func.greatest(statement.excluded[key], table.c[key])
+            elif key in ("json", "errors"):
+                update[key] = statement.excluded[key]
+            else:
+                update[key] = func.coalesce(statement.excluded[key], table.c[key])
+        return statement.on_conflict_do_update(index_elements=[table.c.url], set_=update)
+
+    @classmethod
+    def upsert_previous_statement(
+        cls, rows: List[Dict[str, Any]], columns: Iterable[str], insert_only: Iterable[str] = ()
+    ):
+        """Build the upsert of :meth:`upsert_statement`, also returning the values of some columns before it.
+
+        Each saved apartment has its ``id``, ``url`` and ``content_hash``, then ``previous_id`` and
+        ``previous_<column>`` (all None for new apartments).
+        Both parts of the statement see the table as it was before it started, so the previous values are
+        read in the same round trip as the upsert.
+        """
+        table = cls.__table__
+        columns = list(columns)
+        previous = (
+            select([table.c.id] + [table.c[column] for column in columns])
+            .where(table.c.url.in_([row["url"] for row in rows]))
+            .cte("previous")
+        )
+        saved = (
+            cls.upsert_statement(rows, insert_only)
+            .returning(table.c.id, table.c.url, table.c.content_hash)
+            .cte("saved")
+        )
+        return select(
+            [saved.c.id, saved.c.url, saved.c.content_hash, previous.c.id.label("previous_id")]
+            + [previous.c[column].label("previous_" + column) for column in columns]
+        ).select_from(saved.outerjoin(previous, previous.c.id == saved.c.id))
+
+    @classmethod
+    def mark_seen(cls, ids: List[int], run_id: Optional[int] = None):
+        """Mark apartments as seen now, without moving ``updated_at``.
+
+        :param ids: IDs of the apartments.
+        :param run_id: The crawl that saw them; apartments it finds again after a sweep are active again.
+        """
+        values = {cls.seen_at: func.now(), cls.updated_at: cls.updated_at}
+        if run_id is not None:
+            values[cls.last_run_id] = run_id
+            values[cls.active] = case([(cls.deactivated_run_id.isnot(None), True)], else_=cls.active)
+            values[cls.deactivated_run_id] = None
+        cls.query.filter(cls.id.in_(ids)).update(values, synchronize_session=False)
+
+    @classmethod
+    def sweep(cls, domains: Iterable[str], run_id: int) -> int:
+        """Deactivate the active apartments of these domains that were not seen by a crawl, with one UPDATE.
+
+        :return: Number of deactivated apartments.
+        """
+        return cls.query.filter(
+            cls.in_domains(domains),
+            cls.active.is_(True),
+            or_(cls.last_run_id.is_(None), cls.last_run_id != run_id),
+        ).update({cls.active: False, cls.deactivated_run_id: run_id}, synchronize_session=False)
+
+
+# Text columns searched with ``ILIKE '%term%'`` on the admin list, backed by trigram indexes.
+SEARCHABLE_COLUMNS = ("address", "neighborhood", "comments", "description", "equipment", "location", "other")
+
+# Active apartments not seen lately, checked by "flask vacuum" (the same expression as the query).
+db.Index(
+    "ix_apartment_active_last_seen",
+    func.coalesce(Apartment.seen_at, Apartment.updated_at),
+    postgresql_where=Apartment.active.is_(True),
+)
+db.Index("ix_apartment_search_vector", Apartment.search_vector, postgresql_using="gin")
+# Keyset pages of the JSON API.
+db.Index(
+    "ix_apartment_active_warm_rent_price_id",
+    Apartment.warm_rent_price,
+    Apartment.id,
+    postgresql_where=Apartment.active.is_(True),
+)
+TRIGRAM_INDEXES = [
+    db.Index(
+        "ix_apartment_{}_trgm".format(name),
+        getattr(Apartment, name),
+        postgresql_using="gin",
+        postgresql_ops={name: "gin_trgm_ops"},
+    )
+    for name in SEARCHABLE_COLUMNS
+]
+
 
 class Opinion(SurrogatePK, Model):
     """An opinion about an apartment."""
@@ -82,6 +240,13 @@ class Distance(SurrogatePK, Model):
     """Distance from a pin to an apartment."""
 
     __tablename__ = "distance"
+    # One distance per apartment and pin; also the lookup of the missing distances of each pin.
+    __table_args__ = (
+        db.Index("ix_distance_pin_id_apartment_id", "pin_id", "apartment_id", unique=True),
+        # Distances of some apartments, e.g. a page of the JSON API.
+        db.Index("ix_distance_apartment_id", "apartment_id"),
+        {"extend_existing": True},
+    )
 
     apartment_id = reference_column("apartment")
     apartment = relationship("Apartment")
@@ -95,9 +260,360 @@ class Distance(SurrogatePK, Model):
     # Google Matrix JSON
     json = db.Column(postgresql.JSONB(none_as_null=True), nullable=False)
     updated_at = Column(db.DateTime, nullable=False, onupdate=func.now(), default=func.now())
+    # Estimated offline from centroids, until Google Maps replaces it.
+    provisional = Column(db.Boolean, nullable=False, default=False)
 
     def __repr__(self):
         """Represent the object as a unique string."""
         return "<Distance('{}' to '{}', {}m / {} min.)>".format(
             self.apartment.address, self.pin.address, self.meters, self.minutes
         )
+
+
+class ApartmentPin(Model):
+    """Each apartment with each pin, and the distance between them if it's known: the rows of the admin list.
+
+    Kept up to date by :meth:`refresh` when apartments, pins or distances are saved,
+    instead of joining every apartment with every pin and their distances on each page load.
+    """
+
+    __tablename__ = "apartment_pin"
+    __table_args__ = (db.Index("ix_apartment_pin_pin_id_minutes", "pin_id", "minutes"), {"extend_existing": True})
+
+    apartment_id = Column(db.ForeignKey("apartment.id", ondelete="CASCADE"), primary_key=True)
+    pin_id = Column(db.ForeignKey("pin.id", ondelete="CASCADE"), primary_key=True)
+    pin_address = Column(db.String())
+    minutes = Column(db.Integer())
+    meters = Column(db.Integer())
+    provisional = Column(db.Boolean, nullable=False, default=False)
+
+    def __repr__(self):
+        """Represent the object as a unique string."""
+        return "<ApartmentPin({} to {}: {}m / {} min.)>".format(
+            self.apartment_id, self.pin_id, self.meters, self.minutes
+        )
+
+    @classmethod
+    def refresh_statement(cls, apartment_ids: Optional[Iterable[int]] = None, pin_ids: Optional[Iterable[int]] = None):
+        """Build one ``INSERT ... SELECT ... ON CONFLICT DO UPDATE`` statement for the rows of some apartments or pins.
+
+        Without IDs, all rows are refreshed.
+        If an apartment has many distances to the same pin, the latest one from Google Maps is used.
+        """
+        query = (
+            select(
+                [
+                    Apartment.id,
+                    Pin.id,
+                    Pin.address,
+                    Distance.minutes,
+                    Distance.meters,
+                    func.coalesce(Distance.provisional, False),
+                ]
+            )
+            .select_from(
+                Apartment.__table__.join(Pin.__table__, true()).outerjoin(
+                    Distance.__table__, and_(Distance.apartment_id == Apartment.id, Distance.pin_id == Pin.id)
+                )
+            )
+            .distinct(Apartment.id, Pin.id)
+            .order_by(Apartment.id, Pin.id, Distance.provisional, Distance.updated_at.desc())
+        )
+        if apartment_ids is not None:
+            query = query.where(Apartment.id.in_(list(apartment_ids)))
+        if pin_ids is not None:
+            query = query.where(Pin.id.in_(list(pin_ids)))
+
+        table = cls.__table__
+        columns = ["apartment_id", "pin_id", "pin_address", "minutes", "meters", "provisional"]
+        statement = postgresql.insert(table).from_select(columns, query)
+        return statement.on_conflict_do_update(
+            index_elements=[table.c.apartment_id, table.c.pin_id],
+            set_={key: statement.excluded[key] for key in columns[2:]},
+        )
+
+    @classmethod
+    def refresh(cls, apartment_ids: Optional[Iterable[int]] = None, pin_ids: Optional[Iterable[int]] = None):
+        """Insert or update the rows of some apartments or pins, without committing."""
+        if apartment_ids is not None:
+            apartment_ids = list(apartment_ids)
+            if not apartment_ids:
+                return
+        db.session.execute(cls.refresh_statement(apartment_ids, pin_ids))
+
+
+class ApartmentSignature(Model):
+    """MinHash signature of an apartment, to find the same listing on other portals (see :mod:`tegenaria.dedup`)."""
+
+    __tablename__ = "apartment_signature"
+
+    apartment_id = Column(db.ForeignKey("apartment.id", ondelete="CASCADE"), primary_key=True)
+    # Content hash of the apartment when the signature was computed.
+    content_hash = Column(db.String(32))
+    signature = Column(postgresql.ARRAY(db.BigInteger), nullable=False)
+
+    def __repr__(self):
+        """Represent the object as a unique string."""
+        return "<ApartmentSignature({}: {})>".format(self.apartment_id, self.content_hash)
+
+    @classmethod
+    def upsert_statement(cls, rows: List[Dict[str, Any]]):
+        """Build one ``INSERT ... ON CONFLICT (apartment_id) DO UPDATE`` statement for many signatures."""
+        table = cls.__table__
+        statement = postgresql.insert(table).values(rows)
+        return statement.on_conflict_do_update(
+            index_elements=[table.c.apartment_id],
+            set_={"content_hash": statement.excluded.content_hash, "signature": statement.excluded.signature},
+        )
+
+
+# Apartment columns whose changes are kept in the history.
+HISTORY_COLUMNS = (
+    "cold_rent_price",
+    "warm_rent_price",
+    "additional_price",
+    "heating_price",
+    "rooms",
+    "size",
+    "availability",
+    "active",
+)
+
+
+class ApartmentHistory(Model):
+    """Fields of an apartment that changed when it was observed, e.g. a new price, or deactivated by a sweep.
+
+    Append-only: one narrow row per apartment and observation, with only the changed fields as a JSON object,
+    instead of a copy of the apartment. The first row of a new apartment has all its known values.
+    """
+
+    __tablename__ = "apartment_history"
+    # Time series of one apartment, e.g. its prices over the last months.
+    __table_args__ = (
+        db.Index("ix_apartment_history_apartment_id_observed_at", "apartment_id", "observed_at"),
+        {"extend_existing": True},
+    )
+
+    id = Column(db.BigInteger, primary_key=True)
+    apartment_id = Column(db.ForeignKey("apartment.id", ondelete="CASCADE"), nullable=False)
+    # The crawl that observed the changes; None outside of crawls (replays, link checks).
+    run_id = reference_column("crawl_run", True)
+    observed_at = Column(db.DateTime, nullable=False, default=func.now())
+    changes = Column(postgresql.JSONB, nullable=False)
+
+    def __repr__(self):
+        """Represent the object as a unique string."""
+        return "<ApartmentHistory({}: {} {})>".format(self.apartment_id, self.observed_at, self.changes)
+
+    @staticmethod
+    def changed_fields(previous: Optional[Dict[str, Any]], current: Dict[str, Any]) -> Dict[str, Any]:
+        """History columns whose current value differs from the previous one, as JSON values.
+
+        Empty values don't overwrite the stored ones (see :meth:`Apartment.upsert_statement`), so they are not changes.
+
+        :param previous: Values before the save, or None for a new apartment.
+        """
+        return {
+            key: json_value(current[key])
+            for key in HISTORY_COLUMNS
+            if current.get(key) is not None and (previous is None or previous.get(key) != current[key])
+        }
+
+    @classmethod
+    def entry(
+        cls,
+        apartment_id: int,
+        previous: Optional[Dict[str, Any]],
+        current: Dict[str, Any],
+        run_id: Optional[int] = None,
+        observed_at: Optional[datetime] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """Row of the history of a saved apartment, or None if no history column changed.
+
+        :param observed_at: When the values were scraped; now by default.
+        """
+        changes = cls.changed_fields(previous, current)
+        if not changes:
+            return None
+        return {
+            "apartment_id": apartment_id,
+            "run_id": run_id,
+            "observed_at": observed_at or func.now(),
+            "changes": changes,
+        }
+
+    @classmethod
+    def insert_statement(cls, rows: List[Dict[str, Any]]):
+        """Build one ``INSERT`` statement for many rows made by :meth:`entry`."""
+        return postgresql.insert(cls.__table__).values(rows)
+
+    @classmethod
+    def record_statement(cls, condition, changes: Dict[str, Any], run_id: Optional[int] = None):
+        """Build one ``INSERT ... SELECT`` statement with the same changes for the apartments matching a condition."""
+        table = cls.__table__
+        query = select(
+            [Apartment.id, literal(run_id, db.Integer), func.now(), literal(changes, postgresql.JSONB)]
+        ).where(condition)
+        return table.insert().from_select(["apartment_id", "run_id", "observed_at", "changes"], query)
+
+
+class DistanceCache(SurrogatePK, Model):
+    """Distance between two normalized addresses, shared by all apartments in the same building.
+
+    Keyed by origin (apartment address), destination (pin address), travel mode and arrival slot.
+    """
+
+    __tablename__ = "distance_cache"
+    __table_args__ = (
+        db.UniqueConstraint("origin", "destination", "mode", "arrival_slot"),
+        {"extend_existing": True},
+    )
+
+    origin = Column(db.String(), nullable=False)
+    destination = Column(db.String(), nullable=False)
+    mode = Column(db.String(), nullable=False)
+    # Day type and time of the arrival, e.g. "weekday 09:00".
+    arrival_slot = Column(db.String(), nullable=False)
+
+    meters = Column(db.Integer(), nullable=False)
+    minutes = Column(db.Integer(), nullable=False)
+    # Google Matrix JSON
+    json = db.Column(postgresql.JSONB(none_as_null=True), nullable=False)
+    fetched_at = Column(db.DateTime, nullable=False, default=func.now())
+
+    def __repr__(self):
+        """Represent the object as a unique string."""
+        return "<DistanceCache('{}' to '{}', {}m / {} min.)>".format(
+            self.origin, self.destination, self.meters, self.minutes
+        )
+
+    @classmethod
+    def fresh(
+        cls, origins: List[str], mode: str, arrival_slot: str, fetched_since: datetime
+    ) -> Dict[Tuple[str, str], "DistanceCache"]:
+        """Cached distances from these origins fetched since a date, by origin and destination."""
+        if not origins:
+            return {}
+        query = cls.query.filter(
+            cls.origin.in_(origins),
+            cls.mode == mode,
+            cls.arrival_slot == arrival_slot,
+            cls.fetched_at >= fetched_since,
+        )
+        return {(entry.origin, entry.destination): entry for entry in query}
+
+    @classmethod
+    def upsert_statement(cls, rows: List[Dict[str, Any]]):
+        """Build one ``INSERT ... ON CONFLICT DO UPDATE`` statement that saves (or refreshes) many distances.
+
+        :param rows: Dicts with origin, destination, mode, arrival_slot, meters, minutes and json.
+        """
+        table = cls.__table__
+        statement = postgresql.insert(table).values(rows)
+        update = {key: statement.excluded[key] for key in ("meters", "minutes", "json")}
+        update["fetched_at"] = func.now()
+        return statement.on_conflict_do_update(
+            index_elements=[table.c.origin, table.c.destination, table.c.mode, table.c.arrival_slot], set_=update
+        )
+
+
+class Centroid(SurrogatePK, Model):
+    """Center of a postcode area or of a street, to locate addresses offline (see :mod:`tegenaria.geo`)."""
+
+    __tablename__ = "centroid"
+    __table_args__ = (db.UniqueConstraint("kind", "key"), {"extend_existing": True})
+
+    # "postcode" or "street"
+    kind = Column(db.String(), nullable=False)
+    # The postcode, or the normalized street name and the postcode.
+    key = Column(db.String(), nullable=False)
+    latitude = Column(db.Float(), nullable=False)
+    longitude = Column(db.Float(), nullable=False)
+
+    def __repr__(self):
+        """Represent the object as a unique string."""
+        return "<Centroid({} {}: {}, {})>".format(self.kind, self.key, self.latitude, self.longitude)
+
+    @classmethod
+    def points(cls) -> Dict[Tuple[str, str], Point]:
+        """All centroids, by kind and key."""
+        query = db.session.query(cls.kind, cls.key, cls.latitude, cls.longitude)
+        return {(kind, key): Point(latitude, longitude) for kind, key, latitude, longitude in query}
+
+    @classmethod
+    def upsert_statement(cls, rows: List[Dict[str, Any]]):
+        """Build one ``INSERT ... ON CONFLICT (kind, key) DO UPDATE`` statement for many centroids."""
+        table = cls.__table__
+        statement = postgresql.insert(table).values(rows)
+        return statement.on_conflict_do_update(
+            index_elements=[table.c.kind, table.c.key],
+            set_={"latitude": statement.excluded.latitude, "longitude": statement.excluded.longitude},
+        )
+
+
+class CrawlRun(SurrogatePK, Model):
+    """One crawl of a spider (or of a shard of it).
+
+    Every apartment it sees is stamped with the run.
+    After a complete run, the active apartments of the spider that were not stamped are deactivated.
+    """
+
+    __tablename__ = "crawl_run"
+
+    spider = Column(db.String(), nullable=False)
+    # Shard argument, e.g. "0/4"; a sharded run only sees part of the site.
+    shard = Column(db.String())
+    started_at = Column(db.DateTime, nullable=False, default=func.now())
+    finished_at = Column(db.DateTime)
+    # Close reason given by Scrapy: "finished", "shutdown", "closespider_timeout", etc.
+    reason = Column(db.String())
+    complete = Column(db.Boolean, nullable=False, default=False)
+    # Apartments deactivated after this run (None if there was no sweep).
+    deactivated = Column(db.Integer())
+
+    def __repr__(self):
+        """Represent the object as a unique string."""
+        return "<CrawlRun({}: {} {} {})>".format(self.id, self.spider, self.started_at, self.reason)
+
+
+class CachedCount(Model):
+    """Exact result of an expensive count, reused until it's too old or the counted rows change."""
+
+    __tablename__ = "cached_count"
+
+    name = Column(db.String(), primary_key=True)
+    value = Column(db.BigInteger(), nullable=False)
+    counted_at = Column(db.DateTime, nullable=False, default=func.now())
+    # Rows were written after the count.
+    stale = Column(db.Boolean, nullable=False, default=False)
+
+    def __repr__(self):
+        """Represent the object as a unique string."""
+        return "<CachedCount({}: {} at {})>".format(self.name, self.value, self.counted_at)
+
+    @classmethod
+    def fresh(cls, name: str, max_age: timedelta) -> Optional[int]:
+        """The count, unless it's stale, older than the max age or missing."""
+        query = db.session.query(cls.value).filter(
+            cls.name == name, cls.stale.is_(False), cls.counted_at >= func.now() - max_age
+        )
+        return query.scalar()
+
+    @classmethod
+    def store_statement(cls, name: str, value: int):
+        """Build one ``INSERT ... ON CONFLICT (name) DO UPDATE`` statement that saves a new count."""
+        statement = postgresql.insert(cls.__table__).values(name=name, value=value, counted_at=func.now(), stale=False)
+        return statement.on_conflict_do_update(
+            index_elements=[cls.__table__.c.name],
+            set_={"value": statement.excluded.value, "counted_at": statement.excluded.counted_at, "stale": False},
+        )
+
+    @classmethod
+    def invalidate_statement(cls):
+        """Build the statement that marks all counts as stale; counts that already are stale are not rewritten."""
+        return cls.__table__.update().where(cls.stale.is_(False)).values(stale=True)
+
+    @classmethod
+    def invalidate(cls):
+        """Mark all counts as stale, without committing: apartments were added, deactivated or reactivated."""
+        db.session.execute(cls.invalidate_statement())
@@ -5,56 +5,601 @@ Define your item pipelines here.
 Don't forget to add your pipeline to the ITEM_PIPELINES setting
 See: http://doc.scrapy.org/en/latest/topics/item-pipeline.html
 """
+import logging
+import sys
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict, deque
+from hashlib import blake2b
+from typing import Any, Deque, Dict, Iterable, List, Optional, Set, Tuple
+from urllib.parse import urlparse
+
 from flask import current_app
 from flask.helpers import get_debug_flag
+from scrapy import signals
 from scrapy.exceptions import CloseSpider, DropItem
+from sqlalchemy import and_, or_
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.sql.functions import func
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred, succeed
+from twisted.internet.task import LoopingCall
+from twisted.internet.threads import deferToThreadPool
+from twisted.python.threadpool import ThreadPool
 
 from tegenaria.app import create_app
 from tegenaria.extensions import db
-from tegenaria.models import Apartment
-from tegenaria.schemas import ApartmentSchema
+from tegenaria.items import content_hash
+from tegenaria.models import HISTORY_COLUMNS, Apartment, ApartmentHistory, ApartmentPin, CachedCount, CrawlRun
+from tegenaria.schemas import ApartmentLoader
 from tegenaria.settings import DevConfig, ProdConfig
 from tegenaria.spiders import SpiderMixin
 
+LOGGER = logging.getLogger(__name__)
+
+# Columns filled by the spiders; the others are managed by the database, by crawl runs or by the user on the admin.
+MANAGED_COLUMNS = (
+    "id",
+    "opinion_id",
+    "created_at",
+    "updated_at",
+    "seen_at",
+    "last_run_id",
+    "deactivated_run_id",
+    "search_vector",
+    "canonical_id",
+)
+SCRAPED_COLUMNS = tuple(column.key for column in Apartment.__table__.columns if column.key not in MANAGED_COLUMNS)
+
+# Stats of problems that leave listings unscraped: a crawl with any of them is not complete.
+INCOMPLETE_RUN_STATS = ("apartment/failed", "retry/max_reached", "httperror/response_ignored_count")
+
+
+def is_complete_run(reason: str, shard: Optional[str], stats: Dict[str, Any]) -> bool:
+    """Return True if a crawl saw every listing of its site, so the ones it didn't see are gone.
+
+    The crawl must finish by itself, not be sharded, and have no failed requests, spider exceptions or failed saves.
+    """
+    if reason != "finished" or shard:
+        return False
+    return not any(
+        value for key, value in stats.items() if key in INCOMPLETE_RUN_STATS or key.startswith("spider_exceptions/")
+    )
+
+
+class ApartmentIndex(object):
+    """Compact in-memory index of apartment URLs, IDs and content hashes, to avoid one SELECT per scraped item.
+
+    URLs and content hashes are stored as 64-bit digests; an unknown content hash is stored as zero.
+    The rows loaded from the database are kept in three sorted arrays (24 bytes per apartment);
+    apartments inserted afterwards go to a small dict.
+    """
+
+    def __init__(self, domains: Iterable[str]):
+        """Init instance.
+
+        :param domains: Only URLs from these domains are indexed.
+        """
+        self.domains = tuple(domains)
+        self.keys = array("Q")
+        self.ids = array("q")
+        self.hashes = array("Q")
+        self.added = {}  # type: Dict[int, Tuple[int, int]]
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        """Number of apartments in the index."""
+        return len(self.keys) + len(self.added)
+
+    @staticmethod
+    def digest(url: str) -> int:
+        """Digest of a URL, as a 64-bit unsigned integer."""
+        return int.from_bytes(blake2b(url.encode(), digest_size=8).digest(), "big")
+
+    @staticmethod
+    def hash_digest(hex_hash: Optional[str]) -> int:
+        """Digest of a content hash (first 64 bits), or zero if there is no hash."""
+        return int(hex_hash[:16], 16) if hex_hash else 0
+
+    def load(self):
+        """Load all apartments from the indexed domains."""
+        if not self.domains:
+            return
+        query = db.session.query(Apartment.url, Apartment.id, Apartment.content_hash).filter(
+            Apartment.in_domains(self.domains)
+        )
+        rows = sorted(
+            (self.digest(url), apartment_id, self.hash_digest(hex_hash))
+            for url, apartment_id, hex_hash in query.yield_per(10000)
+        )
+        self.keys = array("Q", (row[0] for row in rows))
+        self.ids = array("q", (row[1] for row in rows))
+        self.hashes = array("Q", (row[2] for row in rows))
+        self.added.clear()
+
+    def covers(self, url: str) -> bool:
+        """Return True if the URL belongs to one of the indexed domains."""
+        host = urlparse(url).hostname or ""
+        return any(host == domain or host.endswith("." + domain) for domain in self.domains)
+
+    def get(self, url: str) -> Optional[Tuple[int, int]]:
+        """Return the ID and the content hash digest of the apartment with this URL, or None if it's not indexed."""
+        key = self.digest(url)
+        found = self.added.get(key)
+        if found is None:
+            position = bisect_left(self.keys, key)
+            if position < len(self.keys) and self.keys[position] == key:
+                found = self.ids[position], self.hashes[position]
+
+        if found is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return found
+
+    def add(self, url: str, apartment_id: int, hex_hash: Optional[str]):
+        """Add a newly saved apartment to the index, or update its content hash."""
+        self.added[self.digest(url)] = apartment_id, self.hash_digest(hex_hash)
+
+    def memory_size(self) -> int:
+        """Approximate memory used by the index, in bytes."""
+        return (
+            sys.getsizeof(self.keys)
+            + sys.getsizeof(self.ids)
+            + sys.getsizeof(self.hashes)
+            + sys.getsizeof(self.added)
+            + sum(sys.getsizeof(key) + sys.getsizeof(value) for key, value in self.added.items())
+        )
+
+    def report(self, stats, spider):
+        """Set the index size, memory and hit rate on the crawl stats."""
+        lookups = self.hits + self.misses
+        stats.set_value("apartment_index/size", len(self), spider=spider)
+        stats.set_value("apartment_index/memory_bytes", self.memory_size(), spider=spider)
+        stats.set_value("apartment_index/hits", self.hits, spider=spider)
+        stats.set_value("apartment_index/misses", self.misses, spider=spider)
+        stats.set_value("apartment_index/hit_rate", round(self.hits / lookups, 4) if lookups else 0.0, spider=spider)
+
 
 class ApartmentPipeline(object):
-    """Clean and save an apartment to the database."""
+    """Clean and save an apartment to the database.
+
+    Each crawl is recorded as a :class:`CrawlRun`, and stamps the apartments it sees.
+    With ``APARTMENT_SWEEP``, a complete run then deactivates the apartments of its domains that it didn't see,
+    unless they are more than ``APARTMENT_SWEEP_MAX_FRACTION`` of the active ones (e.g. a broken list page).
+    Changed prices, availability and activity are appended to the :class:`ApartmentHistory`.
+    """
+
+    # Record a crawl run and stamp the seen apartments with it.
+    tracks_runs = True
 
-    def __init__(self):
+    def __init__(self, settings, stats):
         """Constructor."""
         config = DevConfig if get_debug_flag() else ProdConfig
-        self.app = current_app or create_app(config)
+        # The real app object, not the proxy: the app context is also pushed from other threads.
+        self.app = current_app._get_current_object() if current_app else create_app(config)
         self.app.app_context().push()
+        self.settings = settings
+        self.stats = stats
+        self.index = ApartmentIndex([])
+        self.loader = None  # type: Optional[ApartmentLoader]
+        self.force_write = settings.getbool("APARTMENT_FORCE_WRITE")
+        self.seen_ids = []  # type: List[int]
+        self.seen_batch_size = settings.getint("APARTMENT_BATCH_SIZE", 500)
+        self.run_id = None  # type: Optional[int]
 
-    def process_item(self, item, spider: SpiderMixin):
-        """Process an item through the pipeline."""
-        try:
-            schema = ApartmentSchema()
-            schema.context["spider"] = spider
+    @classmethod
+    def from_crawler(cls, crawler):
+        """Create the pipeline with the settings and stats of the crawler."""
+        pipeline = cls(crawler.settings, crawler.stats)
+        crawler.signals.connect(pipeline.spider_closed, signal=signals.spider_closed)
+        return pipeline
 
-            json_data = dict(item)
-            json_data["json"] = dict(item)
-            json_data["errors"] = None
+    def open_spider(self, spider: SpiderMixin):
+        """Start a crawl run and load the URL index for the domains of the spider."""
+        if self.tracks_runs:
+            run = CrawlRun.create(spider=spider.name, shard=getattr(spider, "shard", None))
+            self.run_id = run.id
+            self.stats.set_value("crawl_run/id", run.id, spider=spider)
+        self.index = ApartmentIndex(getattr(spider, "allowed_domains", None) or [])
+        self.index.load()
+        self.index.report(self.stats, spider)
 
-            apartment = Apartment.get_or_create(item["url"])
-            result = schema.load(json_data, instance=apartment)
-            if result.errors:
-                # Apply all valid fields to the new instance.
-                for key, value in result.data.items():
-                    setattr(apartment, key, value)
+    def spider_closed(self, spider: SpiderMixin, reason: str):
+        """Finish the crawl run; after a complete run, deactivate the apartments it didn't see.
 
-                # Save the errors and continue.
-                apartment.errors = result.errors
+        Runs after :meth:`close_spider`, when every seen apartment is already stamped.
+        """
+        if self.run_id is None:
+            return
+        run = CrawlRun.query.get(self.run_id)
+        run.finished_at = func.now()
+        run.reason = reason
+        run.complete = is_complete_run(reason, run.shard, self.stats.get_stats(spider))
+        if run.complete and self.settings.getbool("APARTMENT_SWEEP"):
+            run.deactivated = self.sweep(spider)
+        db.session.commit()
+        self.run_id = None
 
-                db.session.add(apartment)
-            else:
-                # On success, we will have a model instance on `result.data`.
-                db.session.add(result.data)
+    def sweep(self, spider: SpiderMixin) -> Optional[int]:
+        """Deactivate the active apartments of the spider domains not seen by this run.
 
-            db.session.commit()
+        :return: Number of deactivated apartments, or None if too many were missing and nothing was changed.
+        """
+        domains = getattr(spider, "allowed_domains", None) or []
+        if not domains:
+            return None
+        in_domains = Apartment.query.filter(Apartment.in_domains(domains), Apartment.active.is_(True))
+        active = in_domains.count()
+        missing = in_domains.filter(or_(Apartment.last_run_id.is_(None), Apartment.last_run_id != self.run_id)).count()
+        max_fraction = self.settings.getfloat("APARTMENT_SWEEP_MAX_FRACTION", 0.5)
+        if active and missing / active > max_fraction:
+            LOGGER.warning(
+                "Not deactivating %d of %d active apartments: more than %.0f%% were not seen by run %d",
+                missing,
+                active,
+                max_fraction * 100,
+                self.run_id,
+            )
+            self.stats.set_value("crawl_run/sweep_skipped", missing, spider=spider)
+            return None
+
+        deactivated = Apartment.sweep(domains, self.run_id)
+        db.session.execute(
+            ApartmentHistory.record_statement(
+                Apartment.deactivated_run_id == self.run_id, {"active": False}, self.run_id
+            )
+        )
+        CachedCount.invalidate()
+        LOGGER.info("Deactivated %d apartments not seen by run %d", deactivated, self.run_id)
+        self.stats.set_value("crawl_run/deactivated", deactivated, spider=spider)
+        return deactivated
+
+    def close_spider(self, spider: SpiderMixin):
+        """Save the pending "last seen" dates and report the final index stats."""
+        self.flush_seen()
+        self.index.report(self.stats, spider)
+
+    def process_item(self, item, spider: SpiderMixin):
+        """Process an item through the pipeline."""
+        try:
+            hex_hash = content_hash(item)
+            if self.is_unchanged(item["url"], hex_hash):
+                self.stats.inc_value("apartment/unchanged", spider=spider)
+            else:
+                self.save_item(item, hex_hash, spider)
         except DropItem:
             raise
         except Exception as err:
             spider.shutdown_message = str(err)
             raise CloseSpider("[{}] {}".format(self.__class__.__name__, spider.shutdown_message))
         return item
+
+    def load_item(self, item, spider: SpiderMixin) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+        """Validate an item with the loader compiled for the spider.
+
+        :return: A dict with the valid fields, and a dict with the validation errors (or None if there were none).
+        """
+        if self.loader is None or self.loader.spider is not spider:
+            self.loader = ApartmentLoader(spider)
+
+        json_data = dict(item)
+        json_data["json"] = dict(item)
+        json_data["errors"] = None
+
+        data, errors = self.loader.load(json_data)
+        return {key: value for key, value in data.items() if key in SCRAPED_COLUMNS}, errors
+
+    def is_unchanged(self, url: str, hex_hash: str) -> bool:
+        """Return True if the apartment is already saved with the same content; then only mark it as seen."""
+        if self.force_write or not self.index.covers(url):
+            return False
+        found = self.index.get(url)
+        if found is None or found[1] != self.index.hash_digest(hex_hash):
+            return False
+
+        self.seen_ids.append(found[0])
+        if len(self.seen_ids) >= self.seen_batch_size:
+            self.flush_seen()
+        return True
+
+    def flush_seen(self):
+        """Save the "last seen" date of unchanged apartments, with one UPDATE."""
+        if not self.seen_ids:
+            return
+        if self.run_id is not None:
+            # Apartments deactivated by a previous sweep are active again.
+            reactivated = and_(Apartment.id.in_(self.seen_ids), Apartment.deactivated_run_id.isnot(None))
+            db.session.execute(ApartmentHistory.record_statement(reactivated, {"active": True}, self.run_id))
+        Apartment.mark_seen(self.seen_ids, self.run_id)
+        db.session.commit()
+        self.seen_ids = []
+
+    def get_or_create(self, url: str) -> Apartment:
+        """Get an apartment using the URL index; only query by URL if the domain is not indexed."""
+        if not self.index.covers(url):
+            return Apartment.get_or_create(url)
+
+        found = self.index.get(url)
+        if found is None:
+            return Apartment()
+
+        apartment = Apartment.query.get(found[0])
+        if apartment is None or apartment.url != url:
+            # Deleted meanwhile, or a digest collision: ask the database.
+            return Apartment.get_or_create(url)
+        return apartment
+
+    def save_item(self, item, hex_hash: str, spider: SpiderMixin):
+        """Save one apartment and its history, and commit."""
+        data, errors = self.load_item(item, spider)
+        apartment = self.get_or_create(item["url"])
+        previous = None if apartment.id is None else {key: getattr(apartment, key) for key in HISTORY_COLUMNS}
+        for key, value in data.items():
+            setattr(apartment, key, value)
+        apartment.errors = errors
+        apartment.content_hash = hex_hash
+        apartment.seen_at = func.now()
+        if self.run_id is not None:
+            apartment.last_run_id = self.run_id
+            if apartment.deactivated_run_id is not None:
+                # Deactivated by a previous sweep, but back on the site.
+                apartment.deactivated_run_id = None
+                apartment.active = True if data.get("active") is None else data["active"]
+
+        is_new = apartment.id is None
+        db.session.add(apartment)
+        db.session.flush()
+        entry = ApartmentHistory.entry(
+            apartment.id, previous, {key: getattr(apartment, key) for key in HISTORY_COLUMNS}, self.run_id
+        )
+        if entry:
+            db.session.execute(ApartmentHistory.insert_statement([entry]))
+        db.session.commit()
+        if is_new:
+            ApartmentPin.refresh([apartment.id])
+            CachedCount.invalidate()
+            db.session.commit()
+        self.index.add(apartment.url, apartment.id, hex_hash)
+        self.stats.inc_value("apartment/saved", spider=spider)
+
+
+class BulkApartmentPipeline(ApartmentPipeline):
+    """Buffer valid apartments and save them with one ``INSERT ... ON CONFLICT (url) DO UPDATE`` per batch.
+
+    The upsert also returns the previous history columns; the changed ones are saved with one more INSERT.
+
+    A batch is flushed when it has ``APARTMENT_BATCH_SIZE`` rows, every ``APARTMENT_BATCH_INTERVAL`` seconds
+    and when the spider is closed.
+    If the batch fails, its rows are saved one by one, so a bad row doesn't drop the others.
+    """
+
+    # Columns of the rows written for new apartments only.
+    insert_only_columns = ()  # type: Tuple[str, ...]
+
+    def __init__(self, settings, stats):
+        """Constructor."""
+        super().__init__(settings, stats)
+        self.batch_size = settings.getint("APARTMENT_BATCH_SIZE", 500)
+        self.batch_interval = settings.getfloat("APARTMENT_BATCH_INTERVAL", 30.0)
+        self.rows = OrderedDict()  # type: Dict[str, Dict[str, Any]]
+        self.spider = None  # type: Optional[SpiderMixin]
+        self.flush_task = LoopingCall(self.flush)
+
+    def open_spider(self, spider: SpiderMixin):
+        """Load the URL index and start flushing the buffer periodically."""
+        super().open_spider(spider)
+        self.spider = spider
+        self.flush_task.start(self.batch_interval, now=False).addErrback(self.flush_stopped)
+
+    def flush_stopped(self, failure):
+        """Log the error that stopped the periodic flush; the buffer is still flushed when it's full."""
+        LOGGER.error("Periodic flush of apartments stopped: %s", failure.getTraceback())
+        self.stats.inc_value("apartment/flush_stopped", spider=self.spider)
+
+    def close_spider(self, spider: SpiderMixin):
+        """Stop the periodic flush and save the remaining rows."""
+        if self.flush_task.running:
+            self.flush_task.stop()
+        self.flush()
+        super().close_spider(spider)
+
+    def build_row(self, item, hex_hash: str, spider: SpiderMixin) -> Dict[str, Any]:
+        """Validate an item and return the row to be saved; all rows have the same keys."""
+        data, errors = self.load_item(item, spider)
+        row = {key: data.get(key) for key in SCRAPED_COLUMNS}
+        row["errors"] = errors
+        row["content_hash"] = hex_hash
+        if row["active"] is None:
+            # A listing that was just scraped is active, unless the spider says otherwise.
+            row["active"] = True
+        if self.tracks_runs:
+            row["last_run_id"] = self.run_id
+        return row
+
+    def save_item(self, item, hex_hash: str, spider: SpiderMixin):
+        """Add the apartment to the buffer, and flush it when it is full."""
+        row = self.build_row(item, hex_hash, spider)
+
+        # The same URL twice in one statement is not allowed by ON CONFLICT; the last item wins.
+        self.rows.pop(row["url"], None)
+        self.rows[row["url"]] = row
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Save all buffered rows in one statement, and the "last seen" dates of unchanged rows in another.
+
+        Database errors are logged, never raised: this also runs periodically, and the loop must keep running.
+        """
+        try:
+            self.flush_seen()
+        except SQLAlchemyError as err:
+            db.session.rollback()
+            # Only the "last seen" dates are lost; the apartments are marked as seen on the next crawl.
+            LOGGER.error("Last seen dates of %d apartments could not be saved: %s", len(self.seen_ids), err)
+            self.stats.inc_value("apartment/seen_failed", spider=self.spider)
+            self.seen_ids = []
+        if not self.rows:
+            return
+        rows = list(self.rows.values())
+        self.rows.clear()
+
+        try:
+            self.upsert(rows)
+        except SQLAlchemyError as err:
+            db.session.rollback()
+            LOGGER.error("Batch of %d apartments failed, saving one by one: %s", len(rows), err)
+            self.stats.inc_value("apartment/batch_failed", spider=self.spider)
+            self.flush_one_by_one(rows)
+            return
+
+        self.stats.inc_value("apartment/batches", spider=self.spider)
+        self.stats.inc_value("apartment/saved", len(rows), spider=self.spider)
+
+    def upsert(self, rows):
+        """Insert or update the rows and their history, and keep the URL index up to date with the returned IDs."""
+        saved = list(
+            db.session.execute(Apartment.upsert_previous_statement(rows, HISTORY_COLUMNS, self.insert_only_columns))
+        )
+        # New apartments appear on the admin list with all pins.
+        ApartmentPin.refresh(row.id for row in saved)
+        if saved:
+            self.save_history(rows, saved)
+            # New or reactivated apartments change the admin list count.
+            CachedCount.invalidate()
+        db.session.commit()
+        for row in saved:
+            self.index.add(row.url, row.id, row.content_hash)
+
+    def save_history(self, rows: List[Dict[str, Any]], saved: List[Any]):
+        """Save the changed history columns of the saved rows, with one INSERT."""
+        rows_by_url = {row["url"]: row for row in rows}
+        entries = []
+        for apartment in saved:
+            previous = None
+            row = rows_by_url[apartment.url]
+            if apartment.previous_id is not None:
+                previous = {key: apartment["previous_" + key] for key in HISTORY_COLUMNS}
+                row = {key: value for key, value in row.items() if key not in self.insert_only_columns}
+            entry = ApartmentHistory.entry(apartment.id, previous, row, self.run_id, row.get("seen_at"))
+            if entry:
+                entries.append(entry)
+        if entries:
+            db.session.execute(ApartmentHistory.insert_statement(entries))
+
+    def flush_one_by_one(self, rows):
+        """Save each row in its own statement, skipping the ones that fail."""
+        for row in rows:
+            try:
+                self.upsert([row])
+            except SQLAlchemyError as err:
+                db.session.rollback()
+                LOGGER.error("Apartment %s could not be saved: %s", row["url"], err)
+                self.stats.inc_value("apartment/failed", spider=self.spider)
+            else:
+                self.stats.inc_value("apartment/saved", spider=self.spider)
+
+
+class ThreadedApartmentPipeline(ApartmentPipeline):
+    """Save apartments on a writer thread, so slow commits don't block downloads and parsing on the reactor.
+
+    Items wait in a bounded queue of ``APARTMENT_WRITER_QUEUE_SIZE`` items.
+    While the queue has room, :meth:`process_item` queues the item and returns at once, so Scrapy goes on parsing.
+    When it's full, it returns a Deferred that only fires when the item enters the queue:
+    Scrapy keeps items in its scraper slot and stops feeding new responses (backpressure).
+    Items that failed to save are logged; the pipeline sets ``shutdown_message``, which closes the spider.
+
+    There is only one writer thread: the SQLAlchemy session, the URL index and the buffer of seen IDs
+    are used by one thread at a time, and apartments are committed in the order they were scraped.
+    """
+
+    def __init__(self, settings, stats):
+        """Constructor."""
+        super().__init__(settings, stats)
+        self.queue_size = settings.getint("APARTMENT_WRITER_QUEUE_SIZE", 100)
+        self.thread_pool = ThreadPool(minthreads=1, maxthreads=1, name="apartment-writer")
+        # Saves queued on the writer thread, and items waiting for room in the queue (in scraping order).
+        self.pending = set()  # type: Set[Deferred]
+        self.waiting = deque()  # type: Deque[Tuple[Deferred, Any, SpiderMixin]]
+        self.drained = []  # type: List[Deferred]
+
+    def open_spider(self, spider: SpiderMixin):
+        """Load the URL index and start the writer thread."""
+        super().open_spider(spider)
+        self.thread_pool.start()
+
+    def close_spider(self, spider: SpiderMixin):
+        """Wait for the queued items, then finish the spider on the writer thread and stop it."""
+        waiting = self.drain()
+        waiting.addCallback(lambda _: self.in_thread(super(ThreadedApartmentPipeline, self).close_spider, spider))
+        waiting.addBoth(self.stop_thread_pool)
+        return waiting
+
+    def drain(self) -> Deferred:
+        """Return a Deferred that fires when every queued or waiting item is saved."""
+        if not self.pending and not self.waiting:
+            return succeed(None)
+        deferred = Deferred()
+        self.drained.append(deferred)
+        return deferred
+
+    def stop_thread_pool(self, result):
+        """Stop the writer thread and pass the result along."""
+        self.thread_pool.stop()
+        return result
+
+    def in_thread(self, function, *args):
+        """Run a function on the writer thread, inside an app context."""
+
+        def run():
+            with self.app.app_context():
+                return function(*args)
+
+        return deferToThreadPool(reactor, self.thread_pool, run)
+
+    def process_item(self, item, spider: SpiderMixin):
+        """Queue the item to be saved on the writer thread; wait for room if the queue is full."""
+        if len(self.pending) < self.queue_size and not self.waiting:
+            self.enqueue(item, spider)
+            return succeed(item)
+
+        deferred = Deferred()
+        self.waiting.append((deferred, item, spider))
+        self.stats.inc_value("apartment_writer/waited", spider=spider)
+        return deferred
+
+    def enqueue(self, item, spider: SpiderMixin):
+        """Send an item to the writer thread."""
+        deferred = self.in_thread(super().process_item, item, spider)
+        self.pending.add(deferred)
+        self.report_queue(spider)
+
+        def failed(failure):
+            self.stats.inc_value("apartment_writer/failed", spider=spider)
+            LOGGER.error("Apartment %s could not be saved: %s", item.get("url"), failure.getErrorMessage())
+
+        def done(_):
+            self.pending.discard(deferred)
+            self.report_queue(spider)
+            self.next_item()
+
+        deferred.addErrback(failed).addBoth(done)
+
+    def next_item(self):
+        """Move the first waiting item to the queue, or fire the drain Deferreds when everything is saved."""
+        if self.waiting and len(self.pending) < self.queue_size:
+            waiting, item, spider = self.waiting.popleft()
+            self.enqueue(item, spider)
+            waiting.callback(item)
+        elif not self.pending and not self.waiting:
+            drained, self.drained = self.drained, []
+            for deferred in drained:
+                deferred.callback(None)
+
+    def report_queue(self, spider: SpiderMixin):
+        """Report the current and the maximum queue depth."""
+        depth = len(self.pending)
+        self.stats.set_value("apartment_writer/queue_depth", depth, spider=spider)
+        self.stats.max_value("apartment_writer/queue_depth_max", depth, spider=spider)
@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+"""Replay the HTTP cache: parse the cached responses of a spider again and save the items, without network.
+
+After a parser fix, every apartment can be extracted again from the responses already stored by
+``HTTPCACHE_ENABLED``, instead of crawling the whole site again at ``DOWNLOAD_DELAY``.
+The cache entries are split in chunks and parsed by a pool of worker processes;
+each worker has its own spider and :class:`ReplayApartmentPipeline`, and saves apartments in batches.
+"""
+import gzip
+import logging
+import multiprocessing
+import os
+import pickle
+from datetime import datetime
+from functools import partial
+from glob import glob
+from time import time
+from typing import Any, Dict, Iterator, List, Optional
+
+from scrapy import Request
+from scrapy.crawler import Crawler
+from scrapy.exceptions import DropItem, IgnoreRequest
+from scrapy.http import Headers, Response
+from scrapy.item import Item
+from scrapy.responsetypes import responsetypes
+from scrapy.settings import Settings
+from scrapy.spiderloader import SpiderLoader
+from scrapy.utils.project import data_path, get_project_settings
+from scrapy.utils.request import request_fingerprint
+from scrapy.utils.spider import iterate_spider_output
+from twisted.python.failure import Failure
+from w3lib.http import headers_raw_to_dict
+
+from tegenaria.pipelines import BulkApartmentPipeline
+from tegenaria.spiders import SpiderMixin
+
+LOGGER = logging.getLogger(__name__)
+
+# Requests yielded by a replayed callback are followed in the cache up to this depth (e.g. a map page).
+MAX_FOLLOW_DEPTH = 3
+
+
+class ReplayApartmentPipeline(BulkApartmentPipeline):
+    """Save replayed apartments in batches, keeping the date they were really seen.
+
+    An apartment is only as recent as its cached response: ``seen_at`` comes from the cache timestamp,
+    so replaying old responses doesn't keep removed apartments alive.
+    A replay is not a crawl run: it neither stamps apartments nor deactivates the ones it didn't see,
+    and it doesn't reactivate the ones deactivated by sweeps or the link checker.
+    """
+
+    tracks_runs = False
+    insert_only_columns = ("active",)
+
+    def __init__(self, settings, stats):
+        """Constructor."""
+        super().__init__(settings, stats)
+        self.seen_at = None  # type: Optional[datetime]
+
+    def build_row(self, item, hex_hash: str, spider: SpiderMixin) -> Dict[str, Any]:
+        """Add the date of the cached response to the row."""
+        row = super().build_row(item, hex_hash, spider)
+        row["seen_at"] = self.seen_at
+        return row
+
+    def flush_seen(self):
+        """Unchanged apartments were not seen again: a cached response is not a new visit."""
+        self.seen_ids = []
+
+
+class CacheReader(object):
+    """Read responses stored by Scrapy's ``FilesystemCacheStorage``."""
+
+    def __init__(self, settings: Settings):
+        """Use the same cache directory, expiration and compression as the crawl."""
+        self.cache_dir = data_path(settings["HTTPCACHE_DIR"])
+        self.expiration_secs = settings.getint("HTTPCACHE_EXPIRATION_SECS")
+        self.open = gzip.open if settings.getbool("HTTPCACHE_GZIP") else open
+
+    def entries(self, spider_name: str) -> List[str]:
+        """Directories of all cached responses of a spider."""
+        pattern = os.path.join(self.cache_dir, spider_name, "*", "*", "pickled_meta")
+        return sorted(os.path.dirname(path) for path in glob(pattern))
+
+    def read_meta(self, path: str) -> Optional[Dict[str, Any]]:
+        """Metadata of a cached response, or None if it expired."""
+        meta_path = os.path.join(path, "pickled_meta")
+        if 0 < self.expiration_secs < time() - os.stat(meta_path).st_mtime:
+            return None
+        with self.open(meta_path, "rb") as handle:
+            return pickle.load(handle)
+
+    def read_response(self, path: str, meta: Dict[str, Any], request: Optional[Request] = None) -> Response:
+        """Build the response stored in a cache directory, attached to its request (or to a new one)."""
+        with self.open(os.path.join(path, "response_body"), "rb") as handle:
+            body = handle.read()
+        with self.open(os.path.join(path, "response_headers"), "rb") as handle:
+            headers = Headers(headers_raw_to_dict(handle.read()))
+        url = meta.get("response_url") or meta["url"]
+        response_class = responsetypes.from_args(headers=headers, url=url)
+        if request is None:
+            request = Request(meta["url"], method=meta.get("method", "GET"))
+        return response_class(url=url, headers=headers, status=meta["status"], body=body, request=request)
+
+    def request_path(self, spider_name: str, request: Request) -> str:
+        """Directory where the response of a request would be cached."""
+        key = request_fingerprint(request)
+        return os.path.join(self.cache_dir, spider_name, key[0:2], key)
+
+
+class ReplayWorker(object):
+    """Parse cached responses with one spider and save the items; one instance per worker process."""
+
+    def __init__(self, spider_name: str, settings: Settings):
+        """Create the spider and the pipeline, and load the URL index of the spider domains."""
+        crawler = Crawler(SpiderLoader.from_settings(settings).load(spider_name), settings)
+        self.stats = crawler.stats
+        self.spider = crawler.spidercls.from_crawler(crawler)
+        self.cache = CacheReader(settings)
+        self.pipeline = ReplayApartmentPipeline.from_crawler(crawler)
+        self.pipeline.open_spider(self.spider)
+        # The index stats of each worker would be added together; only the replay and save counters are reported.
+        self.stats.clear_stats()
+
+    def replay(self, paths: List[str]) -> Dict[str, float]:
+        """Replay some cache entries, save the remaining items and return the stats of this chunk."""
+        for path in paths:
+            self.replay_entry(path)
+        self.pipeline.flush()
+
+        chunk_stats = {
+            key: value for key, value in self.stats.get_stats().items() if isinstance(value, (int, float))
+        }  # type: Dict[str, float]
+        self.stats.clear_stats()
+        return chunk_stats
+
+    def replay_entry(self, path: str):
+        """Parse one cached response with the spider callback for its URL."""
+        meta = self.cache.read_meta(path)
+        if meta is None:
+            self.stats.inc_value("replay/expired")
+            return
+        if meta["status"] != 200:
+            self.stats.inc_value("replay/status_{}".format(meta["status"]))
+            return
+
+        response = self.cache.read_response(path, meta)
+        callback = self.spider.item_callback(response.url)
+        if callback is None:
+            self.stats.inc_value("replay/no_callback")
+            return
+
+        self.stats.inc_value("replay/responses")
+        self.pipeline.seen_at = datetime.fromtimestamp(meta["timestamp"])
+        for item in self.parse(callback, response, {}, 0):
+            try:
+                self.pipeline.process_item(item, self.spider)
+            except DropItem:
+                self.stats.inc_value("replay/dropped")
+            else:
+                self.stats.inc_value("replay/items")
+
+    def parse(self, callback, response, kwargs: Dict[str, Any], depth: int) -> Iterator[Item]:
+        """Items from a callback, following its requests that have a cached response (e.g. a map page).
+
+        Requests handled by the default callbacks are links to other pages, which are replayed on their own.
+        Requests that are not cached go to their errback, if any.
+        """
+        for output in iterate_spider_output(callback(response, **kwargs)):
+            if isinstance(output, Item):
+                yield output
+                continue
+            if not isinstance(output, Request) or not self.follows(output) or depth >= MAX_FOLLOW_DEPTH:
+                continue
+
+            path = self.cache.request_path(self.spider.name, output)
+            meta = self.cache.read_meta(path) if os.path.exists(os.path.join(path, "pickled_meta")) else None
+            if meta is None:
+                self.stats.inc_value("replay/not_cached")
+                if output.errback:
+                    # Like a failed download: the errback can still return what the spider already has.
+                    failure = Failure(IgnoreRequest("Not in the HTTP cache"))
+                    failure.request = output
+                    yield from self.parse(output.errback, failure, {}, depth + 1)
+                continue
+            follow_response = self.cache.read_response(path, meta, output)
+            yield from self.parse(output.callback, follow_response, output.cb_kwargs, depth + 1)
+
+    def follows(self, request: Request) -> bool:
+        """Return True if a request has its own callback, and is not a link followed by the default callbacks."""
+        if request.callback is None:
+            return False
+        return request.callback not in (self.spider.parse, getattr(self.spider, "_callback", None))
+
+
+_worker = None  # type: Optional[ReplayWorker]
+
+
+def replay_chunk(spider_name: str, settings_dict: Dict[str, Any], paths: List[str]) -> Dict[str, float]:
+    """Replay a chunk of cache entries on the worker of this process, creating it on the first chunk.
+
+    The worker is not created by a pool initializer: errors there (e.g. no database) would restart the process
+    forever, while errors here are raised on the main process.
+    """
+    global _worker
+    if _worker is None:
+        settings = get_project_settings()
+        settings.setdict(settings_dict, priority="cmdline")
+        _worker = ReplayWorker(spider_name, settings)
+    return _worker.replay(paths)
+
+
+def replay_cache(spider_name: str, processes: int, chunk_size: int = 500, force: bool = False) -> Dict[str, float]:
+    """Replay all cached responses of a spider in a pool of worker processes.
+
+    :param spider_name: Name of the spider.
+    :param processes: Number of worker processes.
+    :param chunk_size: Cache entries sent to a worker at a time; the worker saves its items after each chunk.
+    :param force: Save apartments even if their content didn't change.
+    :return: The stats of all workers added together.
+    """
+    settings = get_project_settings()
+    paths = CacheReader(settings).entries(spider_name)
+    LOGGER.info("Replaying %d cached responses of %s with %d processes", len(paths), spider_name, processes)
+    settings_dict = {"APARTMENT_FORCE_WRITE": force, "APARTMENT_BATCH_SIZE": chunk_size}
+
+    totals = {"replay/cached": len(paths)}  # type: Dict[str, float]
+    # Spawn fresh processes, instead of forking database connections and the Twisted reactor.
+    context = multiprocessing.get_context("spawn")
+    pool = context.Pool(processes)
+    try:
+        chunks = [paths[start : start + chunk_size] for start in range(0, len(paths), chunk_size)]
+        for chunk_stats in pool.imap_unordered(partial(replay_chunk, spider_name, settings_dict), chunks):
+            for key, value in chunk_stats.items():
+                totals[key] = totals.get(key, 0) + value
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    return totals
@@ -1,6 +1,9 @@
 """Marshmallow schemas."""
-from typing import Any, Dict
+from datetime import date
+from decimal import Decimal, InvalidOperation
+from typing import Any, Callable, Dict, Optional, Tuple
 
+from marshmallow import ValidationError, fields
 from marshmallow.decorators import pre_load
 from marshmallow_sqlalchemy import ModelSchema
 
@@ -17,9 +20,116 @@ class ApartmentSchema(ModelSchema):
 
         model = Apartment
         sqla_session = db.session
+        # Computed by the database.
+        exclude = ("search_vector",)
 
     @pre_load
-    def clean_item(self, data: Dict[str, Any]):
+    def clean_item(self, data: Dict[str, Any], **kwargs):
         """Clean the item before loading schema on Marshmallow."""
         spider = self.context["spider"]  # type: SpiderMixin
         return spider.before_marshmallow(data)
+
+
+class ApartmentLoader(object):
+    """Load scraped apartments into dicts, with the same coercion and errors as :class:`ApartmentSchema`.
+
+    The fields of the schema are compiled once into plain converter functions,
+    instead of building a schema and a model instance for every item.
+    Values that the fast converters don't handle go to the Marshmallow field itself,
+    so results and error messages are the same.
+    """
+
+    def __init__(self, spider: SpiderMixin):
+        """Compile the schema fields for a spider."""
+        self.spider = spider
+        schema = ApartmentSchema()
+        self.unknown_message = schema.error_messages["unknown"]
+        self.converters = {
+            name: self.compile_field(field) for name, field in schema.load_fields.items()
+        }  # type: Dict[str, Callable[[Any], Any]]
+        self.required = {
+            name: field.error_messages["required"] for name, field in schema.load_fields.items() if field.required
+        }  # type: Dict[str, str]
+
+    @staticmethod
+    def compile_field(field: fields.Field) -> Callable[[Any], Any]:
+        """Return a function that deserializes one value of the field, or raises :class:`ValidationError`."""
+        if field.validators:
+            return field.deserialize
+
+        if isinstance(field, fields.String):
+
+            def convert(value):
+                return value if type(value) is str else field.deserialize(value)
+
+        elif isinstance(field, fields.Decimal):
+            places, rounding = field.places, field.rounding
+
+            def convert(value):
+                if type(value) in (str, int, float):
+                    try:
+                        number = Decimal(str(value))
+                    except InvalidOperation:
+                        number = None
+                    if number is not None and number.is_finite():
+                        return number if places is None else number.quantize(places, rounding=rounding)
+                return field.deserialize(value)
+
+        elif isinstance(field, fields.Boolean):
+            truthy, falsy = field.truthy, field.falsy
+
+            def convert(value):
+                if type(value) in (str, int, bool):
+                    if value in truthy:
+                        return True
+                    if value in falsy:
+                        return False
+                return field.deserialize(value)
+
+        elif isinstance(field, fields.Date):
+
+            def convert(value):
+                if type(value) is str and len(value) == 10:
+                    try:
+                        return date.fromisoformat(value)
+                    except ValueError:
+                        pass
+                return field.deserialize(value)
+
+        elif type(field) is fields.Raw:
+
+            def convert(value):
+                return value if value is not None else field.deserialize(value)
+
+        else:
+            return field.deserialize
+
+        if not field.allow_none:
+            return convert
+
+        def convert_or_none(value):
+            return None if value is None else convert(value)
+
+        return convert_or_none
+
+    def load(self, data: Dict[str, Any]) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+        """Clean the item with the spider, then deserialize it.
+
+        :return: A dict with the valid fields, and a dict with the validation errors (or None if there were none).
+        """
+        data = self.spider.before_marshmallow(data)
+        valid = {}
+        errors = {}
+        for key, value in data.items():
+            convert = self.converters.get(key)
+            if convert is None:
+                errors[key] = [self.unknown_message]
+                continue
+            try:
+                valid[key] = convert(value)
+            except ValidationError as err:
+                errors[key] = err.messages
+        for key, message in self.required.items():
+            if key not in data:
+                errors[key] = [message]
+        return valid, errors or None
@@ -57,6 +57,34 @@ class TestConfig(Config):
 
 
 GOOGLE_MATRIX_API_KEYS = config("GOOGLE_MATRIX_API_KEYS", cast=config.list, default=[])  # type: List[str]
+# Another URL for a local stand-in of the Distance Matrix API, e.g. "python -m benchmarks.fake_distance_matrix".
+GOOGLE_MATRIX_BASE_URL = config("GOOGLE_MATRIX_BASE_URL", default="https://maps.googleapis.com")
+# Distance Matrix requests sent at the same time by "flask distance".
+DISTANCE_MATRIX_WORKERS = config("DISTANCE_MATRIX_WORKERS", cast=int, default=4)
+# Days a distance between two addresses is reused before it's requested again.
+DISTANCE_CACHE_DAYS = config("DISTANCE_CACHE_DAYS", cast=int, default=90)
+
+# Link checker of "flask vacuum": threads, requests at a time and seconds between requests to each site.
+LINK_CHECK_WORKERS = config("LINK_CHECK_WORKERS", cast=int, default=32)
+LINK_CHECK_DOMAIN_CONCURRENCY = config("LINK_CHECK_DOMAIN_CONCURRENCY", cast=int, default=4)
+LINK_CHECK_DOMAIN_DELAY = config("LINK_CHECK_DOMAIN_DELAY", cast=float, default=0.1)
+LINK_CHECK_TIMEOUT = config("LINK_CHECK_TIMEOUT", cast=float, default=10.0)
+# Apartments read from the database, checked and deactivated at a time.
+LINK_CHECK_BATCH_SIZE = config("LINK_CHECK_BATCH_SIZE", cast=int, default=1000)
+
+# Seconds the exact count of the unfiltered admin list is reused; crawls and link checks expire it sooner.
+ADMIN_COUNT_MAX_AGE = config("ADMIN_COUNT_MAX_AGE", cast=int, default=600)
+# Filtered admin lists are counted exactly up to this many rows; larger ones show the planner estimate.
+ADMIN_COUNT_CAP = config("ADMIN_COUNT_CAP", cast=int, default=1000)
+
+# Apartments per page of the JSON API, by default and at most, and per query when streaming NDJSON.
+API_PAGE_SIZE = config("API_PAGE_SIZE", cast=int, default=100)
+API_MAX_PAGE_SIZE = config("API_MAX_PAGE_SIZE", cast=int, default=1000)
+API_STREAM_BATCH_SIZE = config("API_STREAM_BATCH_SIZE", cast=int, default=1000)
+# Rows fetched from the server-side cursor and written at a time by "flask export" (a row group in Parquet files).
+EXPORT_CHUNK_SIZE = config("EXPORT_CHUNK_SIZE", cast=int, default=10000)
+# Estimated similarity of two listings from which "flask dedup" considers them the same apartment.
+DEDUP_SIMILARITY = config("DEDUP_SIMILARITY", cast=float, default=0.7)
 
 BOT_NAME = "tegenaria"
 
@@ -70,7 +98,10 @@ NEWSPIDER_MODULE = "tegenaria.spiders"
 # USER_AGENT = 'tegenaria (+http://www.yourdomain.com)'
 
 # Configure maximum concurrent requests performed by Scrapy (default: 16)
-CONCURRENT_REQUESTS = 1
+# The limit of each site comes from the adaptive throttle below.
+CONCURRENT_REQUESTS = 16
+# Concurrency of a site when the crawl starts; the adaptive throttle raises it up to ADAPTIVE_MAX_CONCURRENCY.
+CONCURRENT_REQUESTS_PER_DOMAIN = 1
 
 # Configure a delay for requests for the same website (default: 0)
 # See http://scrapy.readthedocs.org/en/latest/topics/settings.html#download-delay
@@ -95,9 +126,10 @@ DOWNLOAD_DELAY = config("DOWNLOAD_DELAY", cast=float, default=0.5)
 
 # Enable or disable spider middlewares
 # See http://scrapy.readthedocs.org/en/latest/topics/spider-middleware.html
-# SPIDER_MIDDLEWARES = {
-#    'tegenaria.middlewares.MyCustomSpiderMiddleware': 543,
-# }
+SPIDER_MIDDLEWARES = {
+    # Only active with the "shard" spider argument, e.g.: "flask crawl --processes 4"
+    "tegenaria.middlewares.ShardMiddleware": 543,
+}
 
 # Enable or disable downloader middlewares
 # See http://scrapy.readthedocs.org/en/latest/topics/downloader-middleware.html
@@ -107,9 +139,11 @@ DOWNLOAD_DELAY = config("DOWNLOAD_DELAY", cast=float, default=0.5)
 
 # Enable or disable extensions
 # See http://scrapy.readthedocs.org/en/latest/topics/extensions.html
-# EXTENSIONS = {
-#    'scrapy.telnet.TelnetConsole': None,
-# }
+EXTENSIONS = {
+    # Replaced by the adaptive throttle, which also changes the concurrency of each site.
+    "scrapy.extensions.throttle.AutoThrottle": None,
+    "tegenaria.throttle.AdaptiveThrottle": 0,
+}
 
 # Configure item pipelines
 # See http://scrapy.readthedocs.org/en/latest/topics/item-pipeline.html
@@ -117,16 +151,41 @@ ITEM_PIPELINES = {
     "tegenaria.pipelines.ApartmentPipeline": 300,
 }
 
+# Used by "tegenaria.pipelines.BulkApartmentPipeline", which can replace the pipeline above
+# to save apartments in batches instead of one commit per item.
+APARTMENT_BATCH_SIZE = config("APARTMENT_BATCH_SIZE", cast=int, default=500)
+# Maximum seconds an apartment waits in the buffer before it is saved.
+APARTMENT_BATCH_INTERVAL = config("APARTMENT_BATCH_INTERVAL", cast=float, default=30.0)
+# Save apartments even when their content hash didn't change (e.g.: after fixing a spider's before_marshmallow()).
+APARTMENT_FORCE_WRITE = config("APARTMENT_FORCE_WRITE", cast=config.boolean, default=False)
+# Used by "tegenaria.pipelines.ThreadedApartmentPipeline": items queued for the writer thread;
+# when the queue is full, Scrapy waits before processing more items.
+APARTMENT_WRITER_QUEUE_SIZE = config("APARTMENT_WRITER_QUEUE_SIZE", cast=int, default=100)
+# After a complete crawl, deactivate the apartments of the spider that were not seen,
+# unless they are more than this fraction of its active apartments.
+APARTMENT_SWEEP = config("APARTMENT_SWEEP", cast=config.boolean, default=True)
+APARTMENT_SWEEP_MAX_FRACTION = config("APARTMENT_SWEEP_MAX_FRACTION", cast=float, default=0.5)
+
 # Enable and configure the AutoThrottle extension (disabled by default)
 # See http://doc.scrapy.org/en/latest/topics/autothrottle.html
 # NOTE: AutoThrottle will honour the standard settings for concurrency and delay
-# AUTOTHROTTLE_ENABLED=True
+# These are the defaults of "tegenaria.throttle.AdaptiveThrottle";
+# each spider can have its own profile on "custom_settings" (see the Merkur and Immobilien Scout 24 spiders).
+AUTOTHROTTLE_ENABLED = True
 # The initial download delay
-# AUTOTHROTTLE_START_DELAY=5
+AUTOTHROTTLE_START_DELAY = 1.0
 # The maximum download delay to be set in case of high latencies
-# AUTOTHROTTLE_MAX_DELAY=60
+AUTOTHROTTLE_MAX_DELAY = 60.0
+# Requests in parallel to each site when the crawl starts
+AUTOTHROTTLE_TARGET_CONCURRENCY = 1.0
 # Enable showing throttling stats for every response received:
 # AUTOTHROTTLE_DEBUG=False
+# Maximum requests in parallel to each site
+ADAPTIVE_MAX_CONCURRENCY = config("ADAPTIVE_MAX_CONCURRENCY", cast=int, default=2)
+# Healthy responses in a row before one more request in parallel is allowed
+ADAPTIVE_WINDOW = 20
+# Slower responses (in seconds) halve the concurrency, as errors on RETRY_HTTP_CODES do
+ADAPTIVE_MAX_LATENCY = 5.0
 
 # Enable and configure HTTP caching (disabled by default)
 # See http://scrapy.readthedocs.org/en/latest/topics/downloader-middleware.html#httpcache-middleware-settings
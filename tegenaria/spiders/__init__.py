@@ -3,7 +3,7 @@ This package will contain the spiders of your Scrapy project.
 
 Please refer to the documentation for information on how to create and manage your spiders.
 """
-from typing import Any, Dict
+from typing import Any, Callable, Dict, Optional
 
 from scrapy.exceptions import CloseSpider
 
@@ -24,3 +24,14 @@ class SpiderMixin:
         """
         if self.shutdown_message:
             raise CloseSpider(self.shutdown_message)
+
+    def item_callback(self, url: str) -> Optional[Callable]:
+        """Return the callback that parses items from this URL, or None if the page has no items (e.g. a list page).
+
+        Used to replay the HTTP cache without crawling, and to split item pages between crawl shards.
+        By default, the callback of the first crawl rule that extracts links like this URL.
+        """
+        for rule in getattr(self, "_rules", []):
+            if rule.callback and rule.link_extractor.matches(url):
+                return rule.callback
+        return None
@@ -2,8 +2,8 @@
 """Apartments from the Akelius real estate agency."""
 import re
 
-import requests
 from lxml import etree
+from scrapy import Request
 from scrapy.linkextractors import LinkExtractor
 from scrapy.loader import ItemLoader
 from scrapy.spiders import CrawlSpider, Rule
@@ -20,7 +20,12 @@ class AkeliusSpider(CrawlSpider, SpiderMixin):
     allowed_domains = ["akelius.de"]
     start_urls = ["https://www.akelius.de/en/search/apartments/osten/berlin/list"]
 
-    rules = (Rule(LinkExtractor(allow=r"berlin/[0-9\.]+", process_value=url_query_cleaner), callback="parse_item"),)
+    rules = (
+        Rule(
+            LinkExtractor(allow=r"berlin/[0-9\.]+", deny=r"/karte$", process_value=url_query_cleaner),
+            callback="parse_item",
+        ),
+    )
 
     ADDRESS_REGEX = re.compile(r'<div class="g-map-marker".+<p>.+</div>.+infowindow', re.DOTALL)
 
@@ -42,12 +47,18 @@ class AkeliusSpider(CrawlSpider, SpiderMixin):
         for request in super().parse(response):
             yield request
 
+    def item_callback(self, url: str):
+        """The list pages also have items (the number of rooms)."""
+        if url in self.start_urls:
+            return self.parse
+        return super().item_callback(url)
+
     def parse_item(self, response):
-        """Parse a page with an apartment.
+        """Parse a page with an apartment, then request its map to get the address.
 
         @url https://www.akelius.de/en/search/apartments/osten/berlin/2.7037.16
-        @returns items 1 1
-        @scrapes url title warm_rent_price size availability cold_rent_price description address
+        @returns items 0 0
+        @returns requests 1 1
         """
         self.shutdown_on_error()
         item = ItemLoader(ApartmentItem(), response=response)
@@ -69,14 +80,26 @@ class AkeliusSpider(CrawlSpider, SpiderMixin):
             "description", '//h3[starts-with(normalize-space(.), "Building")]/following-sibling::div//span/text()'
         )
 
-        # The map is shown with JavaScript; get the HTML
-        # and use a regex to extract the part of the script with the address.
-        map_response = requests.get(response.url + "/karte")
-        if map_response.status_code == 200:
-            html_string = "".join(self.ADDRESS_REGEX.findall(map_response.text))
+        # The map is shown with JavaScript on another page; the item is finished there.
+        yield Request(
+            response.url + "/karte",
+            callback=self.parse_map,
+            errback=self.map_failed,
+            cb_kwargs={"item": item.load_item()},
+        )
+
+    def parse_map(self, response, item: ApartmentItem):
+        """Add the address from the map page to the item.
 
-            # Extract the address from the HTML.
+        The map is shown with JavaScript; use a regex to extract the part of the script with the address HTML.
+        """
+        html_string = "".join(self.ADDRESS_REGEX.findall(response.text))
+        if html_string:
             root = etree.fromstring(html_string, etree.HTMLParser())
-            item.add_value("address", ", ".join(root.xpath("//p/text()")))
+            item["address"] = ", ".join(root.xpath("//p/text()"))
+        yield item
 
-        return item.load_item()
+    def map_failed(self, failure):
+        """Keep the item without the address when the map page can't be downloaded."""
+        self.logger.warning("Map not available: %s", failure.request.url)
+        yield failure.request.cb_kwargs["item"]
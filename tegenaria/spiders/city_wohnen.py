@@ -1,11 +1,11 @@
 # -*- coding: utf-8 -*-
 """Furnished apartments from City Wohnen."""
+import json
 import re
 from datetime import datetime
-from typing import Any, Dict
+from typing import Any, Dict, Set
 from urllib.parse import unquote_plus
 
-import requests
 from scrapy import Request
 from scrapy.linkextractors import LinkExtractor
 from scrapy.loader import ItemLoader
@@ -22,15 +22,15 @@ class CityWohnenSpider(CrawlSpider, SpiderMixin):
     name = "city_wohnen"
     allowed_domains = ["city-wohnen.de"]
 
-    MAX_RECORDS = 300
-    start_urls = (
-        # This link shows an empty page...
-        # 'https://www.city-wohnen.de/eng/berlin/furnished-flats/flat-search/'
-        # ... because the actual results are loaded by an AJAX call.
+    # This link shows an empty page...
+    # 'https://www.city-wohnen.de/eng/berlin/furnished-flats/flat-search/'
+    # ... because the actual results are loaded by an AJAX call.
+    SEARCH_URL = (
         "https://www.city-wohnen.de/rpc.php?pageid=401&action=services&service=ciwo_search&cmd=search&"
         "filters=city%3Dberlin%26date_from%3D%26room_count%3D1%26rent_amount_min%3D0%26rent_amount_max%3D4375%26"
-        "person_count%3D1&order=available_from&page_nr=1&page_size={}".format(MAX_RECORDS),
+        "person_count%3D1&order=available_from&page_nr={page}&page_size={page_size}"
     )
+    PAGE_SIZE = 50
 
     URL_REGEX = r"/eng/berlin/[0-9]+[a-z-]+"
     rules = (Rule(LinkExtractor(allow=URL_REGEX, process_value=url_query_cleaner), callback="parse_item", follow=True),)
@@ -41,18 +41,44 @@ class CityWohnenSpider(CrawlSpider, SpiderMixin):
         "address": re.compile(r".+/maps/search/(?P<address>.+)/@[0-9.,]+"),
     }
 
+    def __init__(self, *args, **kwargs):
+        """Init instance."""
+        super().__init__(*args, **kwargs)
+        self.found_links = set()  # type: Set[str]
+
     def start_requests(self):
-        """Parse the results from the hidden AJAX call, and start requests to parse the ads.
+        """Start with the first page of the hidden AJAX search."""
+        yield self.search_request(1)
+
+    def search_request(self, page: int) -> Request:
+        """Request a page of the AJAX search results."""
+        return Request(
+            self.SEARCH_URL.format(page=page, page_size=self.PAGE_SIZE),
+            callback=self.parse_search,
+            cb_kwargs={"page": page},
+        )
+
+    def parse_search(self, response, page: int):
+        """Parse a page of results from the AJAX call: request the next page, and the ads on this one.
+
+        The next page is requested first, so it downloads while the ads are being crawled.
+        A page with fewer ads than the page size is the last one.
 
-        @url https://www.city-wohnen.de
+        @url https://www.city-wohnen.de/rpc.php?pageid=401&action=services&service=ciwo_search&cmd=search&filters=city%3Dberlin%26date_from%3D%26room_count%3D1%26rent_amount_min%3D0%26rent_amount_max%3D4375%26person_count%3D1&order=available_from&page_nr=1&page_size=50
+        @cb_kwargs {"page": 1}
         @returns items 0 0
-        @returns requests 1 200
+        @returns requests 1 51
         """
-        for url in self.start_urls:
-            response = requests.get(url)
-            results = response.json().get("results")
-            for link in re.compile(self.URL_REGEX).findall(results):
-                yield Request("https://www.city-wohnen.de{}".format(link), callback=self.parse_item)
+        results = json.loads(response.text).get("results") or ""
+        links = sorted(set(re.compile(self.URL_REGEX).findall(results)))
+        new_links = [link for link in links if link not in self.found_links]
+        self.found_links.update(new_links)
+
+        # Stop if the page only repeats ads, in case the search ignores the page number.
+        if len(links) >= self.PAGE_SIZE and new_links:
+            yield self.search_request(page + 1)
+        for link in new_links:
+            yield Request(response.urljoin(link), callback=self.parse_item)
 
     def parse_item(self, response):
         """Parse a page with an apartment.
@@ -27,6 +27,8 @@ class ImmobilienScout24Spider(Spider, SpiderMixin):
 
     name = "immobilien_scout_24"
     allowed_domains = ["immobilienscout24.de"]
+    # Blocks crawlers quickly: one request at a time, and slowly.
+    custom_settings = {"DOWNLOAD_DELAY": 2.0, "AUTOTHROTTLE_START_DELAY": 5.0, "ADAPTIVE_MAX_CONCURRENCY": 1}
     start_urls = (
         # TODO: get this from .env or from spider arguments
         "https://www.immobilienscout24.de/Suche/S-T/Wohnung-Miete/Fahrzeitsuche/Berlin/10178/228300/2512424"
@@ -101,6 +103,10 @@ class ImmobilienScout24Spider(Spider, SpiderMixin):
         )
         yield item.load_item()
 
+    def item_callback(self, url: str):
+        """Ads are requested by ID from the search results and from e-mails, not by crawl rules."""
+        return self.parse_item if REGEX.search(url) else None
+
     def before_marshmallow(self, data: Dict[str, Any]) -> Dict[str, Any]:
         """Clean the item before loading schema on Marshmallow."""
         # Warm rent can have additional notes to the right.
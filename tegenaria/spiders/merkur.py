@@ -21,6 +21,13 @@ class MerkurSpider(CrawlSpider, SpiderMixin):
 
     name = "merkur"
     allowed_domains = ["merkur-berlin.de"]
+    # A small site that answers fast and never rate limited us: start faster, allow more requests in parallel.
+    custom_settings = {
+        "DOWNLOAD_DELAY": 0.1,
+        "AUTOTHROTTLE_START_DELAY": 0.25,
+        "AUTOTHROTTLE_TARGET_CONCURRENCY": 2.0,
+        "ADAPTIVE_MAX_CONCURRENCY": 8,
+    }
     start_urls = [
         # Mietwohnungen on the left menu
         "http://www.merkur-berlin.de/?page_id=39"
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""Adaptive concurrency per site, on top of Scrapy's AutoThrottle."""
+from math import ceil
+from typing import Dict
+from weakref import WeakKeyDictionary
+
+from scrapy.extensions.throttle import AutoThrottle
+
+
+class SlotState(object):
+    """Target concurrency of a download slot, and the responses counted since it last changed."""
+
+    def __init__(self, target: float):
+        """Init instance."""
+        self.target = target
+        self.healthy = 0
+
+
+class AdaptiveThrottle(AutoThrottle):
+    """AutoThrottle that also adapts the concurrency of each site (download slot), within a per-spider profile.
+
+    The profile is given by the settings of the spider (``custom_settings``):
+    ``DOWNLOAD_DELAY`` (minimum delay), ``AUTOTHROTTLE_START_DELAY``, ``AUTOTHROTTLE_MAX_DELAY``,
+    ``AUTOTHROTTLE_TARGET_CONCURRENCY`` (start concurrency) and ``ADAPTIVE_MAX_CONCURRENCY``.
+
+    Additive increase, multiplicative decrease: after ``ADAPTIVE_WINDOW`` healthy responses in a row,
+    the target concurrency grows by one; a response with one of the ``RETRY_HTTP_CODES`` (e.g. 429, 503)
+    or slower than ``ADAPTIVE_MAX_LATENCY`` seconds halves it.
+    The delay is then adjusted like AutoThrottle does, to keep the target number of requests of the slot in parallel.
+
+    The current limits of each slot are kept in the crawl stats, under ``throttle/<slot>/``.
+    """
+
+    def __init__(self, crawler):
+        """Read the profile from the settings of the crawler."""
+        super().__init__(crawler)
+        settings = crawler.settings
+        self.start_concurrency = self.target_concurrency
+        self.max_concurrency = max(settings.getint("ADAPTIVE_MAX_CONCURRENCY", 1), 1)
+        self.window = settings.getint("ADAPTIVE_WINDOW", 20)
+        self.max_latency = settings.getfloat("ADAPTIVE_MAX_LATENCY", 5.0)
+        self.overload_statuses = set(int(status) for status in settings.getlist("RETRY_HTTP_CODES"))
+        self.states = {}  # type: Dict[str, SlotState]
+        # Target of each download slot object, for the delay; slots removed by the downloader are dropped.
+        self.slot_targets = WeakKeyDictionary()  # type: WeakKeyDictionary
+
+    def _response_downloaded(self, response, request, spider):
+        """Adapt the concurrency of the slot, then its delay."""
+        key, slot = self._get_slot(request, spider)
+        if slot is not None:
+            self.adapt(key, slot, response.status, request.meta.get("download_latency"), spider)
+        super()._response_downloaded(response, request, spider)
+        if slot is not None:
+            self.report(key, slot, spider)
+
+    def adapt(self, key: str, slot, status: int, latency, spider):
+        """Change the target concurrency of a slot after a response."""
+        state = self.states.get(key)
+        if state is None:
+            state = self.states[key] = SlotState(min(self.start_concurrency, self.max_concurrency))
+
+        if status in self.overload_statuses or (latency is not None and latency > self.max_latency):
+            state.target = max(state.target / 2, 1.0)
+            state.healthy = 0
+            self.crawler.stats.inc_value("throttle/{}/decreases".format(key), spider=spider)
+        else:
+            state.healthy += 1
+            if state.healthy >= self.window:
+                state.target = min(state.target + 1, self.max_concurrency)
+                state.healthy = 0
+
+        slot.concurrency = ceil(state.target)
+        self.slot_targets[slot] = state.target
+
+    def _adjust_delay(self, slot, latency, response):
+        """Adjust the delay like AutoThrottle, with the target concurrency of the slot instead of a global one."""
+        target_delay = latency / self.slot_targets.get(slot, self.target_concurrency)
+        # Closer to the target delay, but never below it: it works better with problematic sites.
+        new_delay = max(target_delay, (slot.delay + target_delay) / 2.0)
+        new_delay = min(max(self.mindelay, new_delay), self.maxdelay)
+        # Error pages are usually small and fast: they don't lower the delay.
+        if response.status != 200 and new_delay <= slot.delay:
+            return
+        slot.delay = new_delay
+
+    def report(self, key: str, slot, spider):
+        """Keep the current and the highest limits of the slot in the crawl stats."""
+        stats = self.crawler.stats
+        stats.set_value("throttle/{}/concurrency".format(key), slot.concurrency, spider=spider)
+        stats.max_value("throttle/{}/concurrency_max".format(key), slot.concurrency, spider=spider)
+        stats.set_value("throttle/{}/delay".format(key), round(slot.delay, 3), spider=spider)
@@ -2,21 +2,54 @@
 """Helper utilities and decorators."""
 import logging
 import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import date, datetime, timedelta
-from itertools import cycle
+from itertools import cycle, zip_longest
+from time import monotonic, sleep
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Set, Tuple
+from urllib.parse import urlparse
 
 import requests
 from flask import flash, json
 from googlemaps import Client
 from googlemaps.exceptions import ApiError, HTTPError, Timeout
-from sqlalchemy import and_, or_
+from requests.adapters import HTTPAdapter
+from sqlalchemy import and_, bindparam, func, or_, true
 
+from tegenaria.dedup import Listing, features, group_duplicates, minhash
 from tegenaria.extensions import db
-from tegenaria.models import Apartment, Distance, Pin
-from tegenaria.settings import GOOGLE_MATRIX_API_KEYS
+from tegenaria.generic import normalize_address
+from tegenaria.geo import DistanceEstimator, calibrate, haversine_matrix
+from tegenaria.models import (
+    Apartment,
+    ApartmentHistory,
+    ApartmentPin,
+    ApartmentSignature,
+    CachedCount,
+    Centroid,
+    Distance,
+    DistanceCache,
+    Pin,
+)
+from tegenaria.settings import (
+    DEDUP_SIMILARITY,
+    DISTANCE_CACHE_DAYS,
+    DISTANCE_MATRIX_WORKERS,
+    GOOGLE_MATRIX_API_KEYS,
+    GOOGLE_MATRIX_BASE_URL,
+    LINK_CHECK_BATCH_SIZE,
+    LINK_CHECK_DOMAIN_CONCURRENCY,
+    LINK_CHECK_DOMAIN_DELAY,
+    LINK_CHECK_TIMEOUT,
+    LINK_CHECK_WORKERS,
+)
 
 PROJECT_NAME = "tegenaria"
 LOGGER = logging.getLogger(__name__)
+# Apartments read from the database at a time to compute their signatures.
+DEDUP_BATCH_SIZE = 1000
 
 
 def flash_errors(form, category="warning"):
@@ -27,16 +60,222 @@ def flash_errors(form, category="warning"):
 
 
 def remove_inactive_apartments():
-    """Remove 404 links."""
-    LOGGER.warning("Searching not found (404) among active records that were not updated in the last 24h")
-    last_24h = datetime.now() - timedelta(days=1)
-    for record in Apartment.query.filter_by(active=True).filter(Apartment.updated_at <= last_24h).all():
-        response = requests.head(record.url)
-        if response.status_code == requests.codes.NOT_FOUND:
-            LOGGER.warning("Not found: %s", record.url)
-            record.update(active=False)
+    """Remove 404 links.
+
+    Complete crawls already deactivate the apartments they don't see anymore (see :class:`~tegenaria.models.CrawlRun`);
+    this is the fallback for the ones left by partial crawls (shards, errors, interrupted crawls).
+    """
+    LOGGER.warning("Searching not found (404) among active records that were not seen in the last 24h")
+    counts = LinkChecker().deactivate_gone(datetime.now() - timedelta(days=1))
+    LOGGER.warning("Links checked: %(checked)d, not found: %(gone)d, errors: %(errors)d", counts)
+
+
+def deduplicate_apartments(threshold: float = DEDUP_SIMILARITY) -> Dict[str, int]:
+    """Point the duplicate listings of active apartments to their canonical listing (see :mod:`tegenaria.dedup`).
+
+    Signatures are only computed again for apartments whose content changed since the last run.
+
+    :return: Number of signatures computed, duplicates found and apartments changed.
+    """
+    rows = (
+        db.session.query(
+            Apartment.id,
+            Apartment.content_hash,
+            Apartment.size,
+            Apartment.rooms,
+            Apartment.canonical_id,
+            ApartmentSignature.content_hash,
+            ApartmentSignature.signature,
+        )
+        .outerjoin(ApartmentSignature, ApartmentSignature.apartment_id == Apartment.id)
+        .filter(Apartment.active.is_(True))
+        .all()
+    )
+    listings = {}  # type: Dict[int, Listing]
+    stale = []  # type: List[int]
+    for apartment_id, content_hash, size, rooms, _, signed_hash, signature in rows:
+        if signature is None or signed_hash is None or signed_hash != content_hash:
+            stale.append(apartment_id)
         else:
-            LOGGER.warning("Still active: %s", record.url)
+            listings[apartment_id] = Listing(signature, size, rooms)
+
+    for start in range(0, len(stale), DEDUP_BATCH_SIZE):
+        batch = db.session.query(
+            Apartment.id,
+            Apartment.content_hash,
+            Apartment.description,
+            Apartment.address,
+            Apartment.size,
+            Apartment.rooms,
+        ).filter(Apartment.id.in_(stale[start : start + DEDUP_BATCH_SIZE]))
+        signatures = []
+        for apartment_id, content_hash, description, address, size, rooms in batch:
+            signature = minhash(features(description, address, size, rooms))
+            listings[apartment_id] = Listing(signature, size, rooms)
+            signatures.append(dict(apartment_id=apartment_id, content_hash=content_hash, signature=signature))
+        if signatures:
+            db.session.execute(ApartmentSignature.upsert_statement(signatures))
+        db.session.commit()
+        LOGGER.warning("Signatures computed: %d of %d", min(start + DEDUP_BATCH_SIZE, len(stale)), len(stale))
+
+    canonical = group_duplicates(listings, threshold)
+    changes = [
+        {"apartment_id": apartment_id, "new_canonical_id": canonical.get(apartment_id)}
+        for apartment_id, _, _, _, canonical_id, _, _ in rows
+        if canonical.get(apartment_id) != canonical_id
+    ]
+    if changes:
+        table = Apartment.__table__
+        # Keep the update date: only the content of the listing sets it.
+        statement = (
+            table.update()
+            .where(table.c.id == bindparam("apartment_id"))
+            .values(canonical_id=bindparam("new_canonical_id"), updated_at=table.c.updated_at)
+        )
+        db.session.execute(statement, changes)
+        CachedCount.invalidate()
+    db.session.commit()
+    return {"signed": len(stale), "duplicates": len(canonical), "changed": len(changes)}
+
+
+def interleave_by_domain(rows: List[Tuple[int, str]]) -> List[Tuple[int, str]]:
+    """Reorder (id, URL) rows taking one URL of each domain in turn, so one big site doesn't hold all threads."""
+    by_domain = OrderedDict()  # type: Dict[str, List[Tuple[int, str]]]
+    for row in rows:
+        by_domain.setdefault(urlparse(row[1]).hostname or "", []).append(row)
+    return [row for group in zip_longest(*by_domain.values()) for row in group if row is not None]
+
+
+class DomainLimiter:
+    """Limit the requests to one domain: some at a time, and a minimum delay between them."""
+
+    def __init__(self, concurrency: int, delay: float):
+        """Init instance."""
+        self.semaphore = threading.BoundedSemaphore(concurrency)
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.next_start = 0.0
+
+    def __enter__(self):
+        """Wait for a free slot and for the delay since the previous request."""
+        self.semaphore.acquire()
+        with self.lock:
+            now = monotonic()
+            start = max(now, self.next_start)
+            self.next_start = start + self.delay
+        if start > now:
+            sleep(start - now)
+        return self
+
+    def __exit__(self, *exc_info):
+        """Free the slot."""
+        self.semaphore.release()
+
+
+class LinkChecker:
+    """Check links of apartments in parallel, and deactivate the ones that are gone.
+
+    Each domain has its own session (connections are reused) and its own :class:`DomainLimiter`.
+    Apartments are read and deactivated in batches of ``LINK_CHECK_BATCH_SIZE``, with one UPDATE per batch.
+    """
+
+    GONE_STATUSES = {requests.codes.NOT_FOUND, requests.codes.GONE}
+
+    def __init__(
+        self,
+        workers: int = LINK_CHECK_WORKERS,
+        domain_concurrency: int = LINK_CHECK_DOMAIN_CONCURRENCY,
+        domain_delay: float = LINK_CHECK_DOMAIN_DELAY,
+        timeout: float = LINK_CHECK_TIMEOUT,
+        batch_size: int = LINK_CHECK_BATCH_SIZE,
+    ):
+        """Init instance."""
+        self.workers = workers
+        self.domain_concurrency = domain_concurrency
+        self.domain_delay = domain_delay
+        self.timeout = timeout
+        self.batch_size = batch_size
+        self.sessions = {}  # type: Dict[str, requests.Session]
+        self.limiters = {}  # type: Dict[str, DomainLimiter]
+        self.lock = threading.Lock()
+
+    def for_domain(self, domain: str) -> Tuple[requests.Session, DomainLimiter]:
+        """Session and limiter of a domain, created on the first request."""
+        with self.lock:
+            if domain not in self.sessions:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.domain_concurrency)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self.sessions[domain] = session
+                self.limiters[domain] = DomainLimiter(self.domain_concurrency, self.domain_delay)
+            return self.sessions[domain], self.limiters[domain]
+
+    def is_gone(self, url: str) -> Optional[bool]:
+        """Return True if the link is gone, False if it's still online, None if it couldn't be checked."""
+        session, limiter = self.for_domain(urlparse(url).hostname or "")
+        try:
+            with limiter:
+                response = session.head(url, timeout=self.timeout)
+        except requests.RequestException as err:
+            LOGGER.error("Could not check %s: %s", url, err)
+            return None
+        return response.status_code in self.GONE_STATUSES
+
+    def stale_batches(self, not_seen_since: datetime) -> Iterator[List[Tuple[int, str]]]:
+        """Yield (id, URL) of active apartments not seen since a date, in batches ordered by ID.
+
+        Each batch is a new query starting after the last ID, so no cursor stays open while batches are committed.
+        """
+        last_seen = func.coalesce(Apartment.seen_at, Apartment.updated_at)
+        last_id = 0
+        while True:
+            batch = (
+                db.session.query(Apartment.id, Apartment.url)
+                .filter(Apartment.active.is_(True), last_seen <= not_seen_since, Apartment.id > last_id)
+                .order_by(Apartment.id)
+                .limit(self.batch_size)
+                .all()
+            )
+            if not batch:
+                return
+            yield batch
+            last_id = batch[-1][0]
+
+    def deactivate_gone(self, not_seen_since: datetime) -> Dict[str, int]:
+        """Check the links of apartments not seen since a date, and deactivate the ones that are gone.
+
+        :return: Number of links checked, gone and with errors.
+        """
+        counts = {"checked": 0, "gone": 0, "errors": 0}
+        executor = ThreadPoolExecutor(self.workers, thread_name_prefix="link-checker")
+        try:
+            for batch in self.stale_batches(not_seen_since):
+                rows = interleave_by_domain(batch)
+                results = executor.map(self.is_gone, [url for _, url in rows])
+                gone = []  # type: List[int]
+                for (apartment_id, url), result in zip(rows, results):
+                    if result is None:
+                        counts["errors"] += 1
+                    elif result:
+                        LOGGER.warning("Not found: %s", url)
+                        gone.append(apartment_id)
+                counts["checked"] += len(rows)
+                counts["gone"] += len(gone)
+
+                if gone:
+                    Apartment.query.filter(Apartment.id.in_(gone)).update(
+                        {Apartment.active: False}, synchronize_session=False
+                    )
+                    db.session.execute(ApartmentHistory.record_statement(Apartment.id.in_(gone), {"active": False}))
+                    CachedCount.invalidate()
+                    db.session.commit()
+                LOGGER.warning("Checked %d links, %d not found so far", counts["checked"], counts["gone"])
+        finally:
+            executor.shutdown()
+            for session in self.sessions.values():
+                session.close()
+        return counts
 
 
 def reprocess_invalid_apartments(output_dir):
@@ -52,76 +291,332 @@ def reprocess_invalid_apartments(output_dir):
         handle.writelines(["{}\n".format(record.url) for record in query.all()])
 
 
+# Limits of one Distance Matrix request.
+MATRIX_MAX_ORIGINS = 25
+MATRIX_MAX_DESTINATIONS = 25
+MATRIX_MAX_ELEMENTS = 100
+DISTANCE_MODE = "transit"
+# Provisional distances inserted per statement.
+DISTANCE_INSERT_BATCH_SIZE = 1000
+
+
+class MatrixRequest(NamedTuple):
+    """One Distance Matrix call: apartment addresses as origins and pins as destinations."""
+
+    # Normalized addresses, shared by all apartments in the same building.
+    origin_keys: List[str]
+    origins: List[str]
+    pin_ids: List[int]
+    destinations: List[str]
+
+
+def plan_matrix_requests(missing: List[Tuple[str, str, int]], pins: Dict[int, str]) -> List[MatrixRequest]:
+    """Split the missing distances in as few Distance Matrix requests as possible.
+
+    Origins missing the same pins are requested together, so no element (origin x destination) is paid twice;
+    each request takes as many origins as fit in the element limit with its pins as destinations.
+
+    :param missing: Normalized address, address and pin ID of each missing distance.
+    :param pins: Addresses of the pins, by ID.
+    """
+    addresses = OrderedDict()  # type: Dict[str, str]
+    missing_pins = OrderedDict()  # type: Dict[str, List[int]]
+    for origin_key, address, pin_id in missing:
+        addresses[origin_key] = address
+        missing_pins.setdefault(origin_key, []).append(pin_id)
+
+    groups = OrderedDict()  # type: Dict[Tuple[int, ...], List[str]]
+    for origin_key, pin_ids in missing_pins.items():
+        groups.setdefault(tuple(sorted(pin_ids)), []).append(origin_key)
+
+    plan = []
+    for pin_ids, origin_keys in groups.items():
+        for pin_start in range(0, len(pin_ids), MATRIX_MAX_DESTINATIONS):
+            pin_chunk = list(pin_ids[pin_start : pin_start + MATRIX_MAX_DESTINATIONS])
+            origins_per_request = min(MATRIX_MAX_ORIGINS, MATRIX_MAX_ELEMENTS // len(pin_chunk))
+            destinations = [pins[pin_id] for pin_id in pin_chunk]
+            for start in range(0, len(origin_keys), origins_per_request):
+                chunk = origin_keys[start : start + origins_per_request]
+                plan.append(MatrixRequest(chunk, [addresses[key] for key in chunk], pin_chunk, destinations))
+    return plan
+
+
+def matrix_elements(request: MatrixRequest, result: Dict[str, Any]) -> List[Tuple[str, int, Dict[str, Any]]]:
+    """Origin key, pin ID and element of each distance in the result of a Distance Matrix request."""
+    return [
+        (origin_key, pin_id, element)
+        for origin_key, row in zip(request.origin_keys, result["rows"])
+        for pin_id, element in zip(request.pin_ids, row["elements"])
+    ]
+
+
+def element_values(element: Dict[str, Any]) -> Tuple[int, int]:
+    """Meters and minutes of a Distance Matrix element; -1 meters if the route was not found."""
+    empty = {"text": "ERROR", "value": -1}
+    duration, distance = element.get("duration", empty), element.get("distance", empty)
+    return distance.get("value"), round(duration.get("value") / 60)
+
+
+def arrival_slot(arrival_time: datetime) -> str:
+    """Day type and time of an arrival: transit schedules differ on weekends."""
+    return "{} {:%H:%M}".format("weekend" if arrival_time.weekday() >= 5 else "weekday", arrival_time)
+
+
 class DistanceCalculator:
-    """Calculate distance between pins."""
+    """Calculate distance between pins.
 
-    def __init__(self):
+    Apartments at the same (normalized) address share one distance to each pin, kept in :class:`DistanceCache`
+    for ``DISTANCE_CACHE_DAYS``.
+    When every API key is exhausted, the distances still missing are estimated offline and saved as provisional;
+    the next runs replace them with Google Maps results.
+    The other missing distances of all pins are batched in full Distance Matrix requests
+    (see :func:`plan_matrix_requests`), sent by ``DISTANCE_MATRIX_WORKERS`` threads;
+    results are saved on the calling thread.
+    """
+
+    def __init__(
+        self,
+        keys: List[str] = GOOGLE_MATRIX_API_KEYS,
+        base_url: str = GOOGLE_MATRIX_BASE_URL,
+        workers: int = DISTANCE_MATRIX_WORKERS,
+        cache_days: int = DISTANCE_CACHE_DAYS,
+    ):
         """Init instance."""
-        self.matrix_client = None
-        self.key_generator = cycle(GOOGLE_MATRIX_API_KEYS)
+        self.matrix_client = None  # type: Optional[Client]
+        self.key_count = len(keys)
+        self.key_generator = cycle(keys)
+        self.base_url = base_url
+        self.workers = workers
+        self.cache_days = cache_days
+        self.lock = threading.Lock()
+        # Set when every API key timed out: the remaining requests are not sent.
+        self.exhausted = False
+        self.provisional = {}  # type: Dict[Tuple[int, int], int]
+        self.replaced = []  # type: List[int]
+        # New distances, added to the session only after the provisional ones they replace are deleted.
+        self.pending = []  # type: List[Distance]
+        # Apartments with new distances, to be refreshed on the admin list.
+        self.changed = set()  # type: Set[int]
 
     def load_client(self):
         """Load a client with the next API key."""
-        self.matrix_client = Client(key=next(self.key_generator))
+        self.matrix_client = Client(key=next(self.key_generator), base_url=self.base_url)
+
+    def next_client(self, failed: Client):
+        """Load the next API key, unless another thread already replaced the client that failed."""
+        with self.lock:
+            if self.matrix_client is failed:
+                self.load_client()
 
-    def calculate(self):
+    def calculate(self, offline: bool = False):
         """Calculate the distance for all apartments that were not calculated yet.
 
         - Query all pins;
-        - Query all apartments not yet calculated;
-        - Call Google Maps Distance Matrix;
-        - Save the results.
+        - Query all distances not yet calculated, or only estimated (duplicate listings are skipped);
+        - Fill the ones already in the cache;
+        - Call Google Maps Distance Matrix for the others;
+        - Save the results, also in the cache;
+        - When there is no API key left (or offline), estimate the distances still missing.
+
+        :param offline: Don't call Google Maps, only estimate the missing distances.
         """
-        self.load_client()
         tomorrow = date.today() + timedelta(0 if datetime.now().hour < 9 else 1)
         morning = datetime(tomorrow.year, tomorrow.month, tomorrow.day, 9, 0)
+        slot = arrival_slot(morning)
         LOGGER.warning("Next morning: %s", morning)
 
-        empty = {"text": "ERROR", "value": -1}
-        for pin in Pin.query.all():
-            while True:
-                apartments = (
-                    Apartment.query.outerjoin(
-                        Distance, and_(Apartment.id == Distance.apartment_id, Distance.pin_id == pin.id)
-                    )
-                    .filter(Apartment.active.is_(True), Apartment.address.isnot(None), Distance.apartment_id.is_(None))
-                    .limit(20)
-                )
-                search = {apartment.id: apartment.address for apartment in apartments.all()}
-                if not search:
-                    LOGGER.warning("All distances already calculated for %s", pin)
-                    break
-
-                ids = list(search.keys())
-                origin_addresses = list(search.values())
-                LOGGER.warning("Calling Google Maps for %s", pin)
-                try:
-                    result = self.matrix_client.distance_matrix(
-                        origin_addresses, [pin.address], mode="transit", units="metric", arrival_time=morning
-                    )
-                except (ApiError, HTTPError) as err:
-                    LOGGER.error("Error on Google Distance Matrix: %s %s", str(err), origin_addresses)
-                    continue
-                except Timeout:
-                    # A timeout usually happens when the daily request quota has expired.
-                    # Let's load another client with the next API key.
-                    LOGGER.error("Daily quota probably expired... loading next API key")
-                    self.load_client()
-                    continue
-
-                LOGGER.warning("Processing results from Google Maps for %s", pin)
-                for row_dict in [row["elements"][0] for row in result["rows"]]:
-                    duration, distance = row_dict.get("duration", empty), row_dict.get("distance", empty)
-                    meters = distance.get("value")
-                    apt_id = ids.pop(0)
-                    model = Distance.create(
-                        apartment_id=apt_id,
-                        pin_id=pin.id,
-                        json=row_dict,
+        pins = {pin.id: pin.address for pin in Pin.query.all()}
+        missing = (
+            db.session.query(Apartment.id, Apartment.address, Pin.id, Distance.id)
+            .join(Pin, true())
+            .outerjoin(Distance, and_(Apartment.id == Distance.apartment_id, Distance.pin_id == Pin.id))
+            .filter(
+                Apartment.active.is_(True),
+                Apartment.canonical_id.is_(None),
+                Apartment.address.isnot(None),
+                or_(Distance.apartment_id.is_(None), Distance.provisional.is_(True)),
+            )
+            .order_by(Apartment.id, Pin.id)
+            .all()
+        )
+        if not missing:
+            LOGGER.warning("All distances already calculated")
+            return
+
+        pin_keys = {pin_id: normalize_address(address) for pin_id, address in pins.items()}
+        addresses = {}  # type: Dict[str, str]
+        waiting = OrderedDict()  # type: Dict[Tuple[str, int], List[int]]
+        self.provisional = {}
+        for apartment_id, address, pin_id, provisional_id in missing:
+            origin_key = normalize_address(address)
+            addresses.setdefault(origin_key, address)
+            waiting.setdefault((origin_key, pin_id), []).append(apartment_id)
+            if provisional_id is not None:
+                self.provisional[apartment_id, pin_id] = provisional_id
+
+        cached = DistanceCache.fresh(
+            list(addresses), DISTANCE_MODE, slot, datetime.now() - timedelta(days=self.cache_days)
+        )
+        for origin_key, pin_id in list(waiting):
+            entry = cached.get((origin_key, pin_keys[pin_id]))
+            if entry is not None:
+                apartment_ids = waiting.pop((origin_key, pin_id))
+                self.add_distances(apartment_ids, pin_id, entry.json, entry.meters, entry.minutes)
+        self.commit()
+
+        if offline or not self.key_count:
+            self.estimate(waiting, addresses, pins)
+            return
+
+        self.load_client()
+        plan = plan_matrix_requests([(key, addresses[key], pin_id) for key, pin_id in waiting], pins)
+        LOGGER.warning(
+            "%d distances from the cache; calling Google Maps for %d addresses in %d requests",
+            len(missing) - sum(len(apartment_ids) for apartment_ids in waiting.values()),
+            len(waiting),
+            len(plan),
+        )
+        for request, result in self.fetch_all(plan, morning):
+            LOGGER.warning("Processing results from Google Maps for %d addresses", len(request.origin_keys))
+            cache_rows = {}  # type: Dict[Tuple[str, str], Dict[str, Any]]
+            for origin_key, pin_id, element in matrix_elements(request, result):
+                meters, minutes = element_values(element)
+                self.add_distances(waiting.pop((origin_key, pin_id)), pin_id, element, meters, minutes)
+                if element.get("status") == "OK":
+                    cache_rows[origin_key, pin_keys[pin_id]] = dict(
+                        origin=origin_key,
+                        destination=pin_keys[pin_id],
+                        mode=DISTANCE_MODE,
+                        arrival_slot=slot,
                         meters=meters,
-                        minutes=round(duration.get("value") / 60),
+                        minutes=minutes,
+                        json=element,
                     )
-                    if meters <= 0:
-                        LOGGER.error("Error calculating %s: %s", model, json.dumps(row_dict))
-                    else:
-                        LOGGER.warning("Calculating %s", model)
+            if cache_rows:
+                db.session.execute(DistanceCache.upsert_statement(list(cache_rows.values())))
+            self.commit()
+
+        if self.exhausted:
+            self.estimate(waiting, addresses, pins)
+
+    def add_distances(self, apartment_ids: List[int], pin_id: int, element: Dict[str, Any], meters: int, minutes: int):
+        """Add the same distance to a pin for apartments at the same address, replacing provisional distances."""
+        if meters <= 0:
+            LOGGER.error("Error calculating apartments %s to pin %d: %s", apartment_ids, pin_id, json.dumps(element))
+        for apartment_id in apartment_ids:
+            provisional_id = self.provisional.pop((apartment_id, pin_id), None)
+            if provisional_id is not None:
+                self.replaced.append(provisional_id)
+        self.changed.update(apartment_ids)
+        self.pending.extend(
+            Distance(apartment_id=apartment_id, pin_id=pin_id, json=element, meters=meters, minutes=minutes)
+            for apartment_id in apartment_ids
+        )
+
+    def commit(self):
+        """Delete the provisional distances that were replaced, save the new ones and show them on the admin list.
+
+        The provisional rows are deleted first: a new distance has the same apartment and pin,
+        which are unique together.
+        """
+        if self.replaced:
+            Distance.query.filter(Distance.id.in_(self.replaced)).delete(synchronize_session=False)
+            self.replaced = []
+        if self.pending:
+            db.session.add_all(self.pending)
+            self.pending = []
+        if self.changed:
+            db.session.flush()
+            ApartmentPin.refresh(self.changed)
+            self.changed = set()
+        db.session.commit()
+
+    def estimate(self, waiting: Dict[Tuple[str, int], List[int]], addresses: Dict[str, str], pins: Dict[int, str]):
+        """Save provisional distances for apartments without any, estimated from centroids (see :mod:`tegenaria.geo`).
+
+        The transit model is calibrated on distances already returned by Google Maps.
+        """
+        estimator = DistanceEstimator(Centroid.points())
+        estimator.model = calibrate(self.calibration_samples(estimator))
+        LOGGER.warning("Estimating distances offline with %s", estimator.model)
+
+        estimates = estimator.estimate({origin_key: addresses[origin_key] for origin_key, _ in waiting}, pins)
+        rows = []
+        for (origin_key, pin_id), apartment_ids in waiting.items():
+            if (origin_key, pin_id) not in estimates:
+                continue
+            meters, minutes = estimates[origin_key, pin_id]
+            rows.extend(
+                dict(
+                    apartment_id=apartment_id,
+                    pin_id=pin_id,
+                    json={"provisional": True},
+                    meters=meters,
+                    minutes=minutes,
+                    provisional=True,
+                )
+                for apartment_id in apartment_ids
+                if (apartment_id, pin_id) not in self.provisional
+            )
+        for start in range(0, len(rows), DISTANCE_INSERT_BATCH_SIZE):
+            db.session.execute(Distance.__table__.insert().values(rows[start : start + DISTANCE_INSERT_BATCH_SIZE]))
+        self.changed.update(row["apartment_id"] for row in rows)
+        self.commit()
+        LOGGER.warning("%d provisional distances saved", len(rows))
+
+    @staticmethod
+    def calibration_samples(estimator: DistanceEstimator, limit: int = 5000) -> List[Tuple[float, int, int]]:
+        """Straight line meters, route meters and minutes of the latest distances returned by Google Maps."""
+        query = (
+            db.session.query(Apartment.address, Pin.address, Distance.meters, Distance.minutes)
+            .select_from(Distance)
+            .join(Apartment, Apartment.id == Distance.apartment_id)
+            .join(Pin, Pin.id == Distance.pin_id)
+            .filter(Distance.provisional.is_(False), Distance.meters > 0, Apartment.address.isnot(None))
+            .order_by(Distance.updated_at.desc())
+            .limit(limit)
+        )
+        samples = []
+        for apartment_address, pin_address, meters, minutes in query:
+            origin, destination = estimator.locate(apartment_address), estimator.locate(pin_address)
+            if origin is not None and destination is not None:
+                samples.append((haversine_matrix([origin], [destination])[0][0], meters, minutes))
+        return samples
+
+    def fetch_all(self, plan: List[MatrixRequest], arrival_time: datetime) -> Iterator[Tuple[MatrixRequest, Any]]:
+        """Send the requests in parallel and yield the successful results as they arrive."""
+        with ThreadPoolExecutor(self.workers, thread_name_prefix="distance-matrix") as executor:
+            futures = {executor.submit(self.fetch, request, arrival_time): request for request in plan}
+            for future in as_completed(futures):
+                result = future.result()
+                if result is not None:
+                    yield futures[future], result
+
+    def fetch(self, request: MatrixRequest, arrival_time: datetime) -> Optional[Dict[str, Any]]:
+        """Call Google Maps Distance Matrix, trying the next API keys on timeouts.
+
+        :return: The result, or None if the request failed (it will be tried again on the next run).
+        """
+        if self.exhausted:
+            return None
+        for _ in range(max(self.key_count, 1)):
+            client = self.matrix_client
+            try:
+                return client.distance_matrix(
+                    request.origins,
+                    request.destinations,
+                    mode=DISTANCE_MODE,
+                    units="metric",
+                    arrival_time=arrival_time,
+                )
+            except (ApiError, HTTPError) as err:
+                LOGGER.error("Error on Google Distance Matrix: %s %s", str(err), request.origins)
+                return None
+            except Timeout:
+                # A timeout usually happens when the daily request quota has expired.
+                # Let's load another client with the next API key.
+                LOGGER.error("Daily quota probably expired... loading next API key")
+                self.next_client(client)
+        LOGGER.error("All API keys timed out")
+        self.exhausted = True
+        return None
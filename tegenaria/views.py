@@ -1,27 +1,100 @@
 """Admin views."""
-from datetime import date
+from datetime import date, timedelta
 
-from flask_admin.contrib.sqla import ModelView
+from flask_admin.contrib.sqla import ModelView, tools
 from flask_admin.contrib.sqla.filters import FilterEmpty
 from flask_admin.model import typefmt
-from sqlalchemy import func, lateral, true
+from sqlalchemy import and_, func, literal_column, or_
+from sqlalchemy.orm import Query
 
 from tegenaria.generic import format_as_human_date, format_json_textarea, render_link, when_none
-from tegenaria.models import Apartment, Distance, Pin
+from tegenaria.models import SEARCHABLE_COLUMNS, Apartment, ApartmentPin, CachedCount
+from tegenaria.settings import ADMIN_COUNT_CAP, ADMIN_COUNT_MAX_AGE
 
 MAPS_PLACE_URL = "https://www.google.de/maps/place/{address}/"
 MAPS_DIRECTIONS_URL = "https://www.google.de/maps/dir/{origin}/{destination}/"
 
+# Searched by substring; the other texts of the apartments are searched by words (see ``Apartment.full_text``).
+SUBSTRING_SEARCH_COLUMNS = ("address", "neighborhood")
+
 MY_DEFAULT_FORMATTERS = dict(typefmt.BASE_FORMATTERS)
 MY_DEFAULT_FORMATTERS.update({date: format_as_human_date, dict: format_json_textarea})
 
 
+def estimated(value, provisional: bool) -> str:
+    """Show a distance, with a tilde if it's only estimated offline."""
+    return "~{}".format(value) if provisional and value is not None else when_none(value)
+
+
+class ListCountQuery(Query):
+    """Count of the apartment list: cached when unfiltered, capped or estimated by the planner when filtered.
+
+    Flask-Admin applies search and filters with ``filter()`` and ``join()``, which copy the query;
+    every copy is marked as narrowed.
+    """
+
+    cache_name = "admin/apartment_pin"
+    narrowed = False
+
+    @classmethod
+    def for_apartments(cls, session=None) -> "ListCountQuery":
+        """Count the rows of the admin list: active canonical apartments with each pin."""
+        query = (
+            cls([func.count("*")], session)
+            .select_from(Apartment)
+            .join(ApartmentPin, ApartmentPin.apartment_id == Apartment.id)
+            .filter(Apartment.active.is_(True), Apartment.canonical_id.is_(None))
+        )
+        query.narrowed = False
+        return query
+
+    def _clone(self):
+        """Copy the query, marking it as narrowed by a search or a filter."""
+        clone = super()._clone()
+        clone.narrowed = True
+        return clone
+
+    def scalar(self):
+        """Return the count."""
+        return self.capped_count() if self.narrowed else self.cached_count()
+
+    def cached_count(self) -> int:
+        """Exact count, reused until the pipelines write apartments or it's older than ``ADMIN_COUNT_MAX_AGE``."""
+        value = CachedCount.fresh(self.cache_name, timedelta(seconds=ADMIN_COUNT_MAX_AGE))
+        if value is None:
+            value = super().scalar()
+            self.session.execute(CachedCount.store_statement(self.cache_name, value))
+            self.session.commit()
+        return value
+
+    def capped_count(self) -> int:
+        """Exact count up to ``ADMIN_COUNT_CAP`` rows; above it, the planner estimate."""
+        rows = self.with_entities(literal_column("1")).limit(ADMIN_COUNT_CAP + 1).subquery()
+        value = self.session.query(func.count("*")).select_from(rows).scalar()
+        if value <= ADMIN_COUNT_CAP:
+            return value
+        return max(value, self.estimated_count())
+
+    def estimated_count(self) -> int:
+        """Rows the planner expects, from ``EXPLAIN``; nothing is read."""
+        connection = self.session.connection()
+        compiled = self.with_entities(literal_column("1")).statement.compile(dialect=connection.dialect)
+        plan = connection.execute("EXPLAIN (FORMAT JSON) {}".format(compiled), compiled.params).scalar()
+        return int(plan[0]["Plan"]["Plan Rows"])
+
+
 class PinModelView(ModelView):
     """Custom model view for pins."""
 
     can_create = True
     can_delete = False
 
+    def after_model_change(self, form, model, is_created):
+        """Show the new or changed pin with every apartment on the admin list."""
+        ApartmentPin.refresh(pin_ids=[model.id])
+        CachedCount.invalidate()
+        self.session.commit()
+
 
 class ApartmentModelView(ModelView):
     """Custom model view for the apartments, times and distances."""
@@ -72,18 +145,18 @@ class ApartmentModelView(ModelView):
         "address": lambda v, c, m, n: render_link(url=MAPS_PLACE_URL.format(address=m.address), text=m.address),
         "minutes": lambda v, c, m, n: render_link(
             url=MAPS_DIRECTIONS_URL.format(origin=m.address, destination=c["row"].pin_address),
-            text=when_none(c["row"].minutes),
+            text=estimated(c["row"].minutes, c["row"].provisional),
             title="from {} to {}".format(m.address, c["row"].pin_address),
         ),
         "meters": lambda v, c, m, n: render_link(
             url=MAPS_DIRECTIONS_URL.format(origin=m.address, destination=c["row"].pin_address),
-            text=when_none(c["row"].meters),
+            text=estimated(c["row"].meters, c["row"].provisional),
             title="from {} to {}".format(m.address, c["row"].pin_address),
         ),
     }
 
     column_type_formatters = MY_DEFAULT_FORMATTERS
-    column_searchable_list = ("address", "neighborhood", "comments", "description", "equipment", "location", "other")
+    column_searchable_list = SEARCHABLE_COLUMNS
     column_details_list = (
         "url",
         "title",
@@ -126,28 +199,56 @@ class ApartmentModelView(ModelView):
     edit_modal = True
 
     def get_query(self):
-        """Return a query for apartments and their distances to pins."""
-        lateral_pin = lateral(Pin.query.with_entities(Pin.id.label("id"), Pin.address.label("pin_address")), name="pin")
-        lateral_distance = lateral(
-            Distance.query.with_entities(Distance.minutes.label("minutes"), Distance.meters.label("meters")).filter(
-                Distance.apartment_id == Apartment.id, Distance.pin_id == lateral_pin.c.id
-            ),
-            name="distance",
-        )
+        """Return a query for apartments and their distances to pins, from the apartment/pin rows.
 
+        Duplicates of listings on other portals are hidden: only their canonical listing is shown.
+        """
         # We need all apartment columns expanded.
         # If the query has only `Apartment` plus the columns, this error is raised:
         # AttributeError: 'result' object has no attribute 'id'
-        columns = list(Apartment.__table__.columns) + [
-            lateral_pin.c.pin_address,
-            lateral_distance.c.minutes,
-            lateral_distance.c.meters,
+        columns = [column for column in Apartment.__table__.columns if column.key != "search_vector"] + [
+            ApartmentPin.pin_address,
+            ApartmentPin.minutes,
+            ApartmentPin.meters,
+            ApartmentPin.provisional,
         ]
-        query = self.session.query(*columns).filter(Apartment.active.is_(True))
+        return (
+            self.session.query(*columns)
+            .select_from(Apartment)
+            .join(ApartmentPin, ApartmentPin.apartment_id == Apartment.id)
+            .filter(Apartment.active.is_(True), Apartment.canonical_id.is_(None))
+        )
+
+    def _apply_search(self, query, count_query, joins, count_joins, search):
+        """Search the texts by words with German stemming, ranked, and the address and neighborhood by substring.
 
-        # All pins that might have a distance or not.
-        return query.join(lateral_pin, true()).outerjoin(lateral_distance, true())
+        Instead of one ``ILIKE '%term%'`` per term and column, the texts are matched on the GIN index of
+        ``Apartment.search_vector``.
+        """
+        terms = [tools.parse_like_term(term) for term in search.split()]
+        if not terms:
+            return query, count_query, joins, count_joins
+
+        matches, rank = Apartment.full_text(search)
+        substring = and_(
+            *[or_(*[getattr(Apartment, name).ilike(term) for name in SUBSTRING_SEARCH_COLUMNS]) for term in terms]
+        )
+        query = query.filter(or_(matches, substring)).order_by(rank.desc())
+        if count_query is not None:
+            count_query = count_query.filter(or_(matches, substring))
+        return query, count_query, joins, count_joins
+
+    def _apply_sorting(self, query, joins, sort_column, sort_desc):
+        """Sort by the column chosen on the list; otherwise, search results are sorted by rank first."""
+        if sort_column is not None:
+            query = query.order_by(None)
+        return super()._apply_sorting(query, joins, sort_column, sort_desc)
 
     def get_count_query(self):
-        """Return the count query for the query above."""
-        return self.get_query().with_entities(func.count("*"))
+        """Return the count query for the query above, without an exact ``count(*)`` on each page load."""
+        return ListCountQuery.for_apartments(self.session())
+
+    def after_model_change(self, form, model, is_created):
+        """Count the list again, the apartment might have been (de)activated."""
+        CachedCount.invalidate()
+        self.session.commit()
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""Crawl in many worker processes: whole spiders, or shards of one spider (see :class:`ShardMiddleware`).
+
+A Twisted reactor can't be restarted, so every crawl runs in a fresh process, with its own reactor,
+database connection and pipeline.
+"""
+import logging
+import multiprocessing
+from functools import partial
+from typing import Any, Dict, List, Optional, Tuple
+
+from scrapy.crawler import CrawlerProcess
+from scrapy.spiderloader import SpiderLoader
+from scrapy.utils.project import get_project_settings
+
+LOGGER = logging.getLogger(__name__)
+
+CrawlTask = Tuple[str, Optional[str]]
+
+# Stats with the same value in every shard (the URL index of the spider domains) or a wall clock time:
+# the merged value is the highest one, like for maximums.
+MAX_STATS = ("apartment_index/size", "apartment_index/memory_bytes", "elapsed_time_seconds")
+# Stats of one crawl process, that mean nothing added together: kept by shard.
+SHARD_STATS = ("crawl_run/id", "apartment_writer/queue_depth")
+SHARD_STAT_SUFFIXES = ("/concurrency", "/delay")
+
+
+def plan_crawls(spider_names: List[str], processes: int) -> List[CrawlTask]:
+    """Split the spiders between processes.
+
+    With at least one process per spider, each spider is also split in shards to use the remaining processes.
+
+    :return: Spider names and their shard argument (None for a whole spider).
+    """
+    shards = processes // len(spider_names) if spider_names else 1
+    if shards <= 1:
+        return [(name, None) for name in spider_names]
+    return [(name, "{}/{}".format(index, shards)) for name in spider_names for index in range(shards)]
+
+
+def crawl_one(settings_dict: Dict[str, Any], task: CrawlTask) -> Tuple[str, Optional[str], Dict[str, float]]:
+    """Run one crawl in this process, until it finishes.
+
+    :return: The spider name, the shard and its numeric stats.
+    """
+    spider_name, shard = task
+    settings = get_project_settings()
+    settings.setdict(settings_dict, priority="cmdline")
+    if shard:
+        # All shards of a spider hit the same site: together, they keep the request rate of a single crawl.
+        # The delay can come from the profile of the spider.
+        SpiderLoader.from_settings(settings).load(spider_name).update_settings(settings)
+        shard_count = int(shard.split("/")[1])
+        settings.set("DOWNLOAD_DELAY", settings.getfloat("DOWNLOAD_DELAY") * shard_count, priority="cmdline")
+
+    process = CrawlerProcess(settings)
+    crawler = process.create_crawler(spider_name)
+    process.crawl(crawler, **({"shard": shard} if shard else {}))
+    process.start()
+    stats = {key: value for key, value in crawler.stats.get_stats().items() if isinstance(value, (int, float))}
+    return spider_name, shard, stats
+
+
+def merge_shard_stats(shard_stats: Dict[Optional[str], Dict[str, float]]) -> Dict[str, Any]:
+    """Merge the stats of the shards of one spider.
+
+    Counters are added; maximums and :data:`MAX_STATS` keep the highest value;
+    :data:`SHARD_STATS` and the current limits of the throttle slots are dicts by shard;
+    the hit rate of the URL index is computed again from the merged counters.
+
+    :param shard_stats: Numeric stats by shard argument (None for a whole spider, returned as is).
+    """
+    if None in shard_stats:
+        return dict(shard_stats[None])
+
+    merged = {}  # type: Dict[str, Any]
+    for shard, stats in sorted(shard_stats.items()):
+        for key, value in stats.items():
+            if key == "apartment_index/hit_rate":
+                continue
+            if key.endswith(("_max", "/max")) or key in MAX_STATS:
+                merged[key] = max(merged.get(key, value), value)
+            elif key in SHARD_STATS or (key.startswith("throttle/") and key.endswith(SHARD_STAT_SUFFIXES)):
+                merged.setdefault(key, {})[shard] = value
+            else:
+                merged[key] = merged.get(key, 0) + value
+
+    lookups = merged.get("apartment_index/hits", 0) + merged.get("apartment_index/misses", 0)
+    if lookups:
+        merged["apartment_index/hit_rate"] = round(merged["apartment_index/hits"] / lookups, 4)
+    return merged
+
+
+def crawl_in_processes(
+    spider_names: List[str], processes: int, settings_dict: Optional[Dict[str, Any]] = None
+) -> Dict[str, Dict[str, Any]]:
+    """Crawl the spiders in a pool of worker processes.
+
+    :return: The stats of each spider, merged for all its shards (see :func:`merge_shard_stats`).
+    """
+    tasks = plan_crawls(spider_names, processes)
+    LOGGER.info("Crawling %d spiders in %d tasks with %d processes", len(spider_names), len(tasks), processes)
+
+    shard_stats = {}  # type: Dict[str, Dict[Optional[str], Dict[str, float]]]
+    # Spawn fresh processes, instead of forking database connections; one crawl per process.
+    context = multiprocessing.get_context("spawn")
+    pool = context.Pool(processes, maxtasksperchild=1)
+    try:
+        for spider_name, shard, stats in pool.imap_unordered(partial(crawl_one, settings_dict or {}), tasks):
+            shard_stats.setdefault(spider_name, {})[shard] = stats
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+    return {spider_name: merge_shard_stats(stats) for spider_name, stats in shard_stats.items()}
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+"""JSON API tests."""
+from datetime import date, datetime
+from decimal import Decimal
+
+import pytest
+
+from tegenaria.api import DEFAULT_FIELDS, decode_cursor, encode_cursor, parse_fields
+from tegenaria.generic import json_value
+
+
+def test_cursor_round_trip():
+    """Cursors are opaque, URL safe, and keep the exact warm rent."""
+    for cursor in [(Decimal("1234.50"), 42), (None, 7)]:
+        value = encode_cursor(cursor)
+        assert "=" not in value and "/" not in value
+        assert decode_cursor(value) == cursor
+
+    with pytest.raises(ValueError):
+        decode_cursor("not a cursor")
+
+
+def test_parse_fields():
+    """The ID is always returned; unknown fields are refused."""
+    assert parse_fields(None) == list(DEFAULT_FIELDS)
+    assert parse_fields("title, warm_rent_price,id") == ["id", "title", "warm_rent_price"]
+    with pytest.raises(ValueError):
+        parse_fields("title,password")
+
+
+def test_bad_requests(testapp):
+    """Invalid parameters are answered with a JSON error, before any query."""
+    response = testapp.get("/api/apartments?fields=secret", status=400)
+    assert response.json == {"error": "Unknown fields: secret"}
+    testapp.get("/api/apartments?cursor=abc", status=400)
+    testapp.get("/api/apartments?limit=0", status=400)
+
+
+def test_json_value():
+    """Decimals become numbers, dates become ISO 8601 strings."""
+    assert json_value(Decimal("850.50")) == 850.5
+    assert json_value(date(2026, 10, 1)) == "2026-10-01"
+    assert json_value(datetime(2026, 10, 1, 9, 30)) == "2026-10-01T09:30:00"
+    assert json_value("text") == "text"
@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 """Basic tests."""
 from tegenaria.app import create_app
-from tegenaria.items import clean_number
+from tegenaria.items import clean_number, clean_numbers
 from tegenaria.settings import DevConfig, ProdConfig
 
 
@@ -55,3 +55,10 @@ def test_clean_number():
     }
     for input_value, expected_output in data.items():
         assert clean_number(input_value) == expected_output, "In: {} Out: {}".format(input_value, expected_output)
+
+
+def test_clean_numbers():
+    """A whole column is cleaned the same way as one value at a time."""
+    values = ["1.234,50 €", None, "1.234,50 €", "ab 1.000 bis 1.200 €", "k.A.", "2\x003", "", " 10,0 "]
+    assert clean_numbers(values) == [None if value is None else clean_number(value) for value in values]
+    assert clean_numbers(values)[:4] == ["1234.50", None, "1234.50", "1.0001.200"]
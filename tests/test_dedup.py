@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""Duplicate listing tests."""
+from decimal import Decimal
+
+from tegenaria.dedup import Listing, LshIndex, features, group_duplicates, minhash, similarity
+
+DESCRIPTION = (
+    "Schöne helle Altbauwohnung im Herzen von Neukölln mit Dielenboden, Einbauküche und Balkon zum ruhigen Innenhof. "
+    "Die Wohnung liegt im dritten Obergeschoss, Bäder und Küche wurden 2019 saniert. "
+    "Einkaufsmöglichkeiten, Cafés und die U-Bahn sind in wenigen Minuten zu Fuß erreichbar."
+)
+
+
+def listing(description: str, address: str, size: str, rooms: str) -> Listing:
+    """A listing with its signature."""
+    signature = minhash(features(description, address, Decimal(size), Decimal(rooms)))
+    return Listing(signature, Decimal(size), Decimal(rooms))
+
+
+def test_minhash_estimates_similarity():
+    """Identical sets have identical signatures; different texts have a low similarity."""
+    first = minhash(features(DESCRIPTION, "Weserstraße 10, 12047 Berlin", Decimal(70), Decimal(2)))
+    assert first == minhash(features(DESCRIPTION, "Weserstr. 10, 12047 Berlin", Decimal("70.0"), Decimal("2.0")))
+    other = minhash(features("Moderne Neubauwohnung am Stadtrand mit Tiefgarage", None, None, None))
+    assert similarity(first, other) < 0.2
+    assert minhash([]) == [] and similarity([], []) == 0.0
+
+
+def test_group_duplicates():
+    """The same flat on three portals is grouped under the lowest ID; flats with other rooms are not."""
+    listings = {
+        5: listing(DESCRIPTION, "Weserstraße 10, 12047 Berlin", "70", "2"),
+        9: listing(DESCRIPTION + " Provisionsfrei!", "Weserstr. 10, 12047 Berlin", "70.5", "2"),
+        3: listing(DESCRIPTION.replace("2019", "2020"), "Weserstraße, 12047 Berlin", "70", "2"),
+        # Same building and text, but another flat.
+        7: listing(DESCRIPTION, "Weserstraße 10, 12047 Berlin", "95", "3"),
+        8: listing("Moderne Neubauwohnung am Stadtrand mit Tiefgarage", "Am Rand 1, 13599 Berlin", "70", "2"),
+    }
+    assert group_duplicates(listings, threshold=0.7) == {5: 3, 9: 3}
+
+
+def test_lsh_index_candidates():
+    """Only signatures sharing a band are candidates; empty signatures match nothing."""
+    index = LshIndex()
+    signature = minhash(features(DESCRIPTION, None, None, None))
+    assert index.add(1, signature) == set()
+    assert index.add(2, signature) == {1}
+    assert index.add(3, minhash(features("Ganz andere Wohnung ohne Balkon in Spandau", None, None, None))) == set()
+    assert index.add(4, []) == set()
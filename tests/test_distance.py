@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""Distance calculation tests."""
+from datetime import datetime
+
+from sqlalchemy.dialects import postgresql
+
+from tegenaria.extensions import db
+from tegenaria.generic import normalize_address
+from tegenaria.geo import DistanceEstimator, Point, TransitModel, calibrate, centroid_keys, haversine_matrix
+from tegenaria.models import ApartmentPin, Distance, DistanceCache
+from tegenaria.utils import (
+    MATRIX_MAX_ELEMENTS,
+    DistanceCalculator,
+    MatrixRequest,
+    arrival_slot,
+    element_values,
+    matrix_elements,
+    plan_matrix_requests,
+)
+
+
+def test_plan_matrix_requests():
+    """Addresses missing the same pins share full requests; no element is requested twice."""
+    pins = {1: "Pin 1", 2: "Pin 2", 3: "Pin 3"}
+    missing = [
+        ("street {}".format(number), "Street {}".format(number), pin_id) for number in range(40) for pin_id in pins
+    ]
+    missing.append(("street 99", "Street 99", 2))
+
+    plan = plan_matrix_requests(missing, pins)
+    assert [(len(request.origins), request.pin_ids) for request in plan] == [
+        (25, [1, 2, 3]),
+        (15, [1, 2, 3]),
+        (1, [2]),
+    ]
+    assert all(len(request.origins) * len(request.destinations) <= MATRIX_MAX_ELEMENTS for request in plan)
+    assert plan[2] == MatrixRequest(["street 99"], ["Street 99"], [2], ["Pin 2"])
+
+    many_pins = {pin_id: "Pin {}".format(pin_id) for pin_id in range(30)}
+    plan = plan_matrix_requests([("street 1", "Street 1", pin_id) for pin_id in many_pins], many_pins)
+    assert [len(request.destinations) for request in plan] == [25, 5]
+
+
+def test_matrix_elements():
+    """Each element of the matrix is the distance from an address to a pin; missing values are errors."""
+    request = MatrixRequest(["a", "b"], ["A", "B"], [1, 2], ["P", "Q"])
+    ok = {"status": "OK", "distance": {"value": 1500}, "duration": {"value": 600}}
+    result = {"rows": [{"elements": [ok, ok]}, {"elements": [ok, {"status": "NOT_FOUND"}]}]}
+    elements = matrix_elements(request, result)
+    assert [(key, pin_id, element_values(element)) for key, pin_id, element in elements] == [
+        ("a", 1, (1500, 10)),
+        ("a", 2, (1500, 10)),
+        ("b", 1, (1500, 10)),
+        ("b", 2, (-1, 0)),
+    ]
+
+
+def test_distance_cache_keys():
+    """The same building is found with different spellings, on the same kind of day."""
+    assert normalize_address("Karl-Marx-Straße 5, 12043 Berlin") == normalize_address(
+        "karl-marx-str. 5,  12043 Berlin, Deutschland"
+    )
+    assert normalize_address("Strassenbahnweg 2") == "strassenbahnweg 2"
+    assert arrival_slot(datetime(2026, 10, 19, 9)) == "weekday 09:00"
+    assert arrival_slot(datetime(2026, 10, 18, 9)) == "weekend 09:00"
+
+    row = dict(origin="a", destination="p", mode="transit", arrival_slot="weekday 09:00", meters=1, minutes=1, json={})
+    sql = str(DistanceCache.upsert_statement([row]).compile(dialect=postgresql.dialect()))
+    assert "ON CONFLICT (origin, destination, mode, arrival_slot) DO UPDATE" in sql
+    assert "fetched_at = now()" in sql
+
+
+def test_estimate_distances_offline():
+    """Addresses are located on street or postcode centroids; the transit model is fitted on Google routes."""
+    assert centroid_keys("Karl-Marx-Straße 5a, 12043 Berlin") == [
+        ("street", "karl marx str 12043"),
+        ("postcode", "12043"),
+    ]
+    assert centroid_keys("Somewhere in Berlin") == []
+
+    alexanderplatz, brandenburger_tor = Point(52.5219, 13.4132), Point(52.5163, 13.3777)
+    [[meters]] = haversine_matrix([alexanderplatz], [brandenburger_tor])
+    assert 2400 < meters < 2500
+
+    model = TransitModel(detour=1.5, fixed_minutes=6, minutes_per_km=3)
+    samples = [(straight, *model.estimate(straight)) for straight in range(1000, 31000, 1000)]
+    calibrated = calibrate(samples)
+    assert round(calibrated.detour, 2) == 1.5
+    assert abs(calibrated.fixed_minutes - 6) < 1 and abs(calibrated.minutes_per_km - 3) < 0.1
+    assert calibrate(samples[:5]) == TransitModel()
+
+    estimator = DistanceEstimator(
+        {("street", "karl marx str 12043"): alexanderplatz, ("postcode", "10117"): brandenburger_tor}, model
+    )
+    estimates = estimator.estimate(
+        {"a": "Karl-Marx-Str. 7, 12043 Berlin", "b": "Unknown 1, 99999 Nowhere"}, {1: "Pariser Platz, 10117 Berlin"}
+    )
+    assert list(estimates) == [("a", 1)]
+    assert estimates["a", 1] == model.estimate(meters)
+
+
+def test_replace_provisional_distance(app, monkeypatch):
+    """The provisional distance is deleted before the real one with the same apartment and pin is inserted."""
+    events = []
+
+    class FakeQuery:
+        def filter(self, condition):
+            return self
+
+        def delete(self, synchronize_session):
+            assert not db.session.new, "autoflush would insert the new distance before the delete"
+            events.append("delete")
+
+    monkeypatch.setattr(Distance, "query", FakeQuery())
+    monkeypatch.setattr(db.session, "flush", lambda: events.append("flush"))
+    monkeypatch.setattr(db.session, "commit", lambda: events.append("commit"))
+    monkeypatch.setattr(ApartmentPin, "refresh", lambda apartment_ids: events.append("refresh"))
+
+    calculator = DistanceCalculator(keys=[])
+    calculator.provisional = {(10, 1): 99}
+    calculator.add_distances([10, 11], 1, {"status": "OK"}, 1500, 12)
+    assert calculator.replaced == [99]
+    assert not db.session.new
+
+    calculator.commit()
+    assert events == ["delete", "flush", "refresh", "commit"]
+    assert sorted(distance.apartment_id for distance in db.session.new) == [10, 11]
+    db.session.expunge_all()
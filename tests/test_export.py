@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""Export tests."""
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from tegenaria.export import CsvWriter, JsonLinesWriter, ParquetWriter, export_statement
+
+ROWS = [
+    (1, Decimal("850.50"), date(2026, 11, 1), datetime(2026, 10, 18, 9, 30), True, None),
+    (2, None, None, None, False, 12),
+]
+
+
+@pytest.fixture
+def columns():
+    """Columns of different types from the export query."""
+    statement = export_statement()
+    return [statement.c[name] for name in ("id", "warm_rent_price", "availability", "updated_at", "active", "minutes")]
+
+
+def test_export_statement():
+    """Apartments without distances are exported too; incremental exports filter both tables."""
+    sql = str(export_statement().compile(dialect=postgresql.dialect()))
+    assert "FROM apartment LEFT OUTER JOIN distance ON distance.apartment_id = apartment.id" in sql
+    assert "distance.updated_at AS distance_updated_at" in sql
+    assert "WHERE" not in sql
+
+    sql = str(export_statement(datetime(2026, 10, 1)).compile(dialect=postgresql.dialect()))
+    assert "WHERE apartment.updated_at >= %(updated_at_1)s OR distance.updated_at >= %(updated_at_2)s" in sql
+
+
+def test_csv_and_json_lines(tmp_path, columns):
+    """Decimals keep their digits in CSV; dates are ISO 8601 in both formats."""
+    writer = CsvWriter(str(tmp_path / "export.csv"), columns)
+    writer.write(ROWS)
+    writer.close()
+    assert (tmp_path / "export.csv").read_text().splitlines() == [
+        "id,warm_rent_price,availability,updated_at,active,minutes",
+        "1,850.50,2026-11-01,2026-10-18T09:30:00,True,",
+        "2,,,,False,12",
+    ]
+
+    writer = JsonLinesWriter(str(tmp_path / "export.jsonl"), columns)
+    writer.write(ROWS)
+    writer.close()
+    lines = [json.loads(line) for line in (tmp_path / "export.jsonl").read_text().splitlines()]
+    assert lines[0] == {
+        "id": 1,
+        "warm_rent_price": 850.5,
+        "availability": "2026-11-01",
+        "updated_at": "2026-10-18T09:30:00",
+        "active": True,
+        "minutes": None,
+    }
+
+
+def test_parquet(tmp_path, columns):
+    """Parquet columns are typed like the database columns."""
+    pyarrow = pytest.importorskip("pyarrow")
+    import pyarrow.parquet
+
+    writer = ParquetWriter(str(tmp_path / "export.parquet"), columns)
+    writer.write(ROWS)
+    writer.close()
+    table = pyarrow.parquet.read_table(str(tmp_path / "export.parquet"))
+    assert table.schema.field("warm_rent_price").type == pyarrow.decimal128(10, 2)
+    assert table.schema.field("availability").type == pyarrow.date32()
+    assert table.column("warm_rent_price").to_pylist() == [Decimal("850.50"), None]
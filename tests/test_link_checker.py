@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""Link checker tests."""
+from time import monotonic
+
+import requests
+
+from tegenaria.utils import DomainLimiter, LinkChecker, interleave_by_domain
+
+
+def test_interleave_by_domain():
+    """One URL of each domain in turn, keeping the order within a domain."""
+    rows = [(number, "http://{}.de/{}".format(domain, number)) for number, domain in enumerate("aaabc", 1)]
+    assert [apartment_id for apartment_id, _ in interleave_by_domain(rows)] == [1, 4, 5, 2, 3]
+
+
+def test_domain_limiter_delay():
+    """Requests to a domain start at least the delay apart."""
+    limiter = DomainLimiter(concurrency=2, delay=0.05)
+    start = monotonic()
+    for _ in range(3):
+        with limiter:
+            pass
+    assert monotonic() - start >= 0.1
+
+
+def test_link_checker_statuses():
+    """404 and 410 are gone, other statuses are online, errors are unknown."""
+
+    class FakeResponse:
+        def __init__(self, status_code):
+            self.status_code = status_code
+
+    class FakeSession:
+        def head(self, url, timeout):
+            if url.endswith("error"):
+                raise requests.ConnectionError("refused")
+            return FakeResponse(int(url.rsplit("/", 1)[1]))
+
+    checker = LinkChecker(domain_delay=0)
+    checker.for_domain("a.de")
+    checker.sessions["a.de"] = FakeSession()
+    results = {path: checker.is_gone("http://a.de/" + path) for path in ("404", "410", "200", "301", "error")}
+    assert results == {"404": True, "410": True, "200": False, "301": False, "error": None}
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""Pipeline tests."""
+
+from datetime import date
+from decimal import Decimal
+
+from flask import _app_ctx_stack
+from scrapy.utils.test import get_crawler
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import OperationalError
+from twisted.internet.defer import Deferred
+
+from tegenaria.extensions import db
+from tegenaria.items import ApartmentItem, content_hash
+from tegenaria.models import HISTORY_COLUMNS, Apartment, ApartmentHistory, ApartmentPin
+from tegenaria.pipelines import ApartmentIndex, BulkApartmentPipeline, ThreadedApartmentPipeline, is_complete_run
+from tegenaria.spiders.merkur import MerkurSpider
+
+
+def test_upsert_statement():
+    """One statement with many rows, updating on URL conflicts."""
+    rows = [{"url": "http://a", "title": "A", "json": {}}, {"url": "http://b", "title": "B", "json": {}}]
+    sql = str(Apartment.upsert_statement(rows).compile(dialect=postgresql.dialect()))
+    assert "ON CONFLICT (url) DO UPDATE" in sql
+    assert "coalesce(excluded.title, apartment.title)" in sql
+    assert "json = excluded.json" in sql
+
+
+def test_apartment_pin_refresh_statement():
+    """The admin rows of some apartments are refreshed with one statement, one row per apartment and pin."""
+    sql = str(ApartmentPin.refresh_statement(apartment_ids=[1, 2]).compile(dialect=postgresql.dialect()))
+    assert sql.startswith("INSERT INTO apartment_pin (apartment_id, pin_id, pin_address, minutes, meters, provisional)")
+    assert "SELECT DISTINCT ON (apartment.id, pin.id)" in sql
+    assert "WHERE apartment.id IN (" in sql
+    assert "ON CONFLICT (apartment_id, pin_id) DO UPDATE SET pin_address = excluded.pin_address" in sql
+
+
+def test_bulk_pipeline_flushes_on_size(app, monkeypatch):
+    """Rows are buffered, deduplicated by URL and flushed when the batch is full."""
+    statements = []
+    monkeypatch.setattr(db.session, "execute", lambda statement: statements.append(statement) or [])
+    monkeypatch.setattr(db.session, "commit", lambda: None)
+
+    crawler = get_crawler(MerkurSpider, {"APARTMENT_BATCH_SIZE": 2})
+    spider = MerkurSpider()
+    pipeline = BulkApartmentPipeline.from_crawler(crawler)
+
+    pipeline.process_item(ApartmentItem(url="http://a", title="first", rooms="2"), spider)
+    pipeline.process_item(ApartmentItem(url="http://a", title="second", rooms="2"), spider)
+    assert not statements
+    assert pipeline.rows["http://a"]["title"] == "second"
+
+    pipeline.process_item(ApartmentItem(url="http://b", title="other", rooms="invalid"), spider)
+    assert len(statements) == 1
+    assert not pipeline.rows
+    assert crawler.stats.get_value("apartment/saved") == 2
+
+    # The pipeline pushes its own app context.
+    _app_ctx_stack.top.pop()
+
+
+def test_bulk_pipeline_flush_survives_seen_errors(app, monkeypatch):
+    """A failed "last seen" UPDATE is rolled back and logged, and the buffered rows are still saved."""
+    statements, rollbacks = [], []
+    monkeypatch.setattr(db.session, "execute", lambda statement: statements.append(statement) or [])
+    monkeypatch.setattr(db.session, "commit", lambda: None)
+    monkeypatch.setattr(db.session, "rollback", lambda: rollbacks.append(True))
+
+    def fail(ids, run_id):
+        raise OperationalError("UPDATE apartment", {}, Exception("connection lost"))
+
+    monkeypatch.setattr(Apartment, "mark_seen", fail)
+
+    crawler = get_crawler(MerkurSpider)
+    pipeline = BulkApartmentPipeline.from_crawler(crawler)
+    pipeline.seen_ids = [1, 2]
+    pipeline.rows["http://a"] = pipeline.build_row(ApartmentItem(url="http://a"), "", MerkurSpider())
+    pipeline.flush()
+    assert rollbacks == [True]
+    assert not pipeline.seen_ids
+    assert len(statements) == 1 and not pipeline.rows
+    assert crawler.stats.get_value("apartment/seen_failed") == 1
+
+    _app_ctx_stack.top.pop()
+
+
+def test_apartment_index():
+    """The index finds URLs loaded from the database and URLs added later."""
+    index = ApartmentIndex(["example.com"])
+    for key, apartment_id in sorted(
+        [(index.digest("https://www.example.com/1"), 10), (index.digest("https://www.example.com/2"), 20)]
+    ):
+        index.keys.append(key)
+        index.ids.append(apartment_id)
+        index.hashes.append(0)
+    index.add("https://www.example.com/3", 30, "ab" * 16)
+
+    assert index.covers("https://www.example.com/4")
+    assert not index.covers("https://www.other.com/1")
+    assert index.get("https://www.example.com/1") == (10, 0)
+    assert index.get("https://www.example.com/2") == (20, 0)
+    assert index.get("https://www.example.com/3") == (30, int("ab" * 8, 16))
+    assert index.get("https://www.example.com/4") is None
+    assert (len(index), index.hits, index.misses) == (3, 3, 1)
+
+
+def test_unchanged_items_are_only_marked_as_seen(app, monkeypatch):
+    """An item with the same content hash is not saved again."""
+    crawler = get_crawler(MerkurSpider)
+    spider = MerkurSpider()
+    pipeline = BulkApartmentPipeline.from_crawler(crawler)
+    pipeline.index = ApartmentIndex(spider.allowed_domains)
+
+    item = ApartmentItem(url="http://www.merkur-berlin.de/?exposeID=1", title="Flat", rooms="2")
+    pipeline.index.add(item["url"], 1, content_hash(ApartmentItem(title=" Flat ", rooms="2", url=item["url"])))
+    pipeline.process_item(item, spider)
+    assert pipeline.seen_ids == [1]
+    assert not pipeline.rows
+    assert crawler.stats.get_value("apartment/unchanged") == 1
+
+    item["title"] = "Another flat"
+    pipeline.process_item(item, spider)
+    assert pipeline.seen_ids == [1]
+    assert list(pipeline.rows) == [item["url"]]
+
+    _app_ctx_stack.top.pop()
+
+
+def test_is_complete_run():
+    """Only a whole crawl that finished by itself, without failed requests or saves, is complete."""
+    assert is_complete_run("finished", None, {"apartment/saved": 10, "retry/count": 2})
+    assert not is_complete_run("shutdown", None, {})
+    assert not is_complete_run("finished", "0/2", {})
+    assert not is_complete_run("finished", None, {"retry/max_reached": 1})
+    assert not is_complete_run("finished", None, {"spider_exceptions/KeyError": 1})
+
+
+def test_rows_are_stamped_with_the_crawl_run(app):
+    """Saved rows are stamped with the run, and are not deactivated by a previous run anymore."""
+    rows = [{"url": "http://a", "json": {}, "last_run_id": 7}]
+    sql = str(Apartment.upsert_statement(rows).compile(dialect=postgresql.dialect()))
+    assert "last_run_id = coalesce(excluded.last_run_id, apartment.last_run_id)" in sql
+    assert "deactivated_run_id = NULL" in sql
+
+    crawler = get_crawler(MerkurSpider)
+    pipeline = BulkApartmentPipeline.from_crawler(crawler)
+    pipeline.run_id = 7
+    row = pipeline.build_row(ApartmentItem(url="http://www.merkur-berlin.de/?exposeID=1"), "", MerkurSpider())
+    assert row["last_run_id"] == 7
+
+    _app_ctx_stack.top.pop()
+
+
+def test_history_has_only_changed_fields():
+    """New apartments record all their known values; saved ones only the changes, empty values are no change."""
+    current = {"warm_rent_price": Decimal("850"), "cold_rent_price": None, "availability": date(2026, 11, 1)}
+    assert ApartmentHistory.changed_fields(None, dict(current, active=True)) == {
+        "warm_rent_price": 850.0,
+        "availability": "2026-11-01",
+        "active": True,
+    }
+    previous = {"warm_rent_price": Decimal("850.00"), "cold_rent_price": Decimal("700.00"), "active": True}
+    assert ApartmentHistory.changed_fields(previous, dict(current, active=True)) == {"availability": "2026-11-01"}
+    assert ApartmentHistory.entry(1, dict(previous, availability=date(2026, 11, 1)), current) is None
+
+
+def test_upsert_returns_previous_values():
+    """Previous values are read in the same statement as the upsert, and are empty for new apartments."""
+    rows = [{"url": "http://a", "warm_rent_price": Decimal("900"), "json": {}}]
+    sql = str(Apartment.upsert_previous_statement(rows, HISTORY_COLUMNS).compile(dialect=postgresql.dialect()))
+    assert sql.startswith("WITH saved AS \n(INSERT INTO apartment")
+    assert "RETURNING apartment.id, apartment.url, apartment.content_hash)" in sql
+    assert "previous.warm_rent_price AS previous_warm_rent_price" in sql
+    assert "FROM saved LEFT OUTER JOIN previous ON previous.id = saved.id" in sql
+
+
+def test_threaded_pipeline_queue(app, monkeypatch):
+    """Items are saved in order, Scrapy waits while the queue is full, and closing drains the queue."""
+    crawler = get_crawler(MerkurSpider, {"APARTMENT_WRITER_QUEUE_SIZE": 2})
+    spider = MerkurSpider()
+    pipeline = ThreadedApartmentPipeline.from_crawler(crawler)
+    calls = []
+
+    def in_thread(function, *args):
+        calls.append(args[0]["url"] if isinstance(args[0], ApartmentItem) else function.__name__)
+        deferred = Deferred()
+        saves.append(deferred)
+        return deferred
+
+    saves = []
+    monkeypatch.setattr(pipeline, "in_thread", in_thread)
+    monkeypatch.setattr(pipeline.thread_pool, "stop", lambda: calls.append("stop"))
+
+    items = [ApartmentItem(url="http://{}".format(letter)) for letter in "abcd"]
+    results = [pipeline.process_item(item, spider) for item in items]
+    assert [result.called for result in results] == [True, True, False, False]
+    assert calls == ["http://a", "http://b"]
+
+    closed = pipeline.close_spider(spider)
+    saves[0].callback(None)
+    assert results[2].called and not results[3].called
+    saves[1].errback(Exception("broken"))
+    saves[2].callback(None)
+    assert results[3].called and not closed.called
+    saves[3].callback(None)
+    assert calls == ["http://a", "http://b", "http://c", "http://d", "close_spider"]
+    saves[4].callback(None)
+    assert closed.called and calls[-1] == "stop"
+
+    assert crawler.stats.get_value("apartment_writer/queue_depth_max") == 2
+    assert crawler.stats.get_value("apartment_writer/queue_depth") == 0
+    assert crawler.stats.get_value("apartment_writer/waited") == 2
+    assert crawler.stats.get_value("apartment_writer/failed") == 1
+
+    _app_ctx_stack.top.pop()
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""HTTP cache replay tests."""
+from datetime import datetime
+
+from flask import _app_ctx_stack
+from scrapy import Request
+from scrapy.extensions.httpcache import FilesystemCacheStorage
+from scrapy.http import HtmlResponse
+from scrapy.settings import Settings
+from scrapy.utils.test import get_crawler
+from sqlalchemy.dialects import postgresql
+
+from tegenaria.extensions import db
+from tegenaria.items import ApartmentItem
+from tegenaria.models import HISTORY_COLUMNS, Apartment
+from tegenaria.replay import CacheReader, ReplayApartmentPipeline
+from tegenaria.spiders.akelius import AkeliusSpider
+from tegenaria.spiders.immobilien_scout_24 import ImmobilienScout24Spider
+from tegenaria.spiders.merkur import MerkurSpider
+
+
+def test_item_callback():
+    """Cached URLs are parsed by the callback that would handle them during a crawl."""
+    merkur = MerkurSpider()
+    assert merkur.item_callback("http://www.merkur-berlin.de/?showExpose=1&exposeID=84857B0A") == merkur.parse_item
+    assert merkur.item_callback("http://www.merkur-berlin.de/?page_id=39") is None
+
+    scout = ImmobilienScout24Spider()
+    assert scout.item_callback("https://www.immobilienscout24.de/expose/93354819") == scout.parse_item
+    assert scout.item_callback(scout.start_urls[0]) is None
+
+    akelius = AkeliusSpider()
+    assert akelius.item_callback(akelius.start_urls[0]) == akelius.parse
+
+
+def test_cache_reader(tmp_path):
+    """Responses stored by the Scrapy cache storage are read back with their metadata."""
+    settings = Settings({"HTTPCACHE_DIR": str(tmp_path)})
+    spider = MerkurSpider()
+    request = Request("http://www.merkur-berlin.de/?exposeID=1")
+    storage = FilesystemCacheStorage(settings)
+    response = HtmlResponse(request.url, headers={"Content-Type": "text/html"}, body=b"<h4>Flat</h4>", encoding="utf-8")
+    storage.store_response(spider, request, response)
+
+    reader = CacheReader(settings)
+    [path] = reader.entries(spider.name)
+    assert path == reader.request_path(spider.name, request)
+    meta = reader.read_meta(path)
+    response = reader.read_response(path, meta)
+    assert isinstance(response, HtmlResponse)
+    assert (response.url, response.status, response.body) == (request.url, 200, b"<h4>Flat</h4>")
+    assert response.request.url == request.url
+
+
+def test_replayed_rows_keep_the_latest_seen_date():
+    """A replayed row doesn't move the "last seen" date back."""
+    rows = [{"url": "http://a", "json": {}, "seen_at": datetime(2020, 1, 1)}]
+    sql = str(Apartment.upsert_statement(rows).compile(dialect=postgresql.dialect()))
+    assert "seen_at = greatest(excluded.seen_at, apartment.seen_at)" in sql
+
+
+def test_replay_does_not_reactivate_apartments(app, monkeypatch):
+    """An old cached response of an apartment deactivated since then leaves it inactive, also in the history."""
+    crawler = get_crawler(MerkurSpider)
+    pipeline = ReplayApartmentPipeline.from_crawler(crawler)
+    row = pipeline.build_row(
+        ApartmentItem(url="http://www.merkur-berlin.de/?exposeID=1", rooms="2"), "", MerkurSpider()
+    )
+    assert row["active"] is True
+
+    sql = str(
+        Apartment.upsert_previous_statement([row], HISTORY_COLUMNS, pipeline.insert_only_columns).compile(
+            dialect=postgresql.dialect()
+        )
+    )
+    assert "active = coalesce(" not in sql
+    assert "rooms = coalesce(excluded.rooms, apartment.rooms)" in sql
+
+    class SavedRow(dict):
+        __getattr__ = dict.__getitem__
+
+    inactive = SavedRow(id=1, url=row["url"], previous_id=1)
+    inactive.update({"previous_" + key: None for key in HISTORY_COLUMNS}, previous_active=False, previous_rooms=2)
+    statements = []
+    monkeypatch.setattr(db.session, "execute", lambda statement: statements.append(statement))
+    pipeline.save_history([row], [inactive])
+    assert not statements
+
+    _app_ctx_stack.top.pop()
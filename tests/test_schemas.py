@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""Schema tests."""
+from datetime import date
+from decimal import Decimal
+
+from marshmallow import ValidationError
+from sqlalchemy import inspect
+
+from tegenaria.schemas import ApartmentLoader, ApartmentSchema
+from tegenaria.spiders import SpiderMixin
+
+
+def test_loader_matches_schema(app):
+    """The compiled loader returns the same values and errors as the Marshmallow schema."""
+    spider = SpiderMixin()
+    loader = ApartmentLoader(spider)
+    items = [
+        {"url": "http://a", "rooms": "2.5", "size": "65", "availability": "2020-05-01", "active": "true"},
+        {"url": "http://b", "rooms": "", "warm_rent_price": "NaN", "availability": "ab sofort", "active": "maybe"},
+        {"url": "http://c", "title": 10, "cold_rent_price": True, "unknown": "x"},
+        {"title": None, "size": None},
+    ]
+    for item in items:
+        data = dict(item, json=dict(item), errors=None)
+        schema = ApartmentSchema()
+        schema.context["spider"] = spider
+        try:
+            apartment = schema.load(dict(data), transient=True)
+            expected = {key: value for key, value in inspect(apartment).dict.items() if not key.startswith("_")}, None
+        except ValidationError as err:
+            expected = err.valid_data, err.messages
+        assert loader.load(dict(data)) == expected
+
+    valid, errors = loader.load(dict(items[0], json={}))
+    assert valid["rooms"] == Decimal("2.5")
+    assert valid["size"] == Decimal("65.00")
+    assert valid["availability"] == date(2020, 5, 1)
+    assert errors is None
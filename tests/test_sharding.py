@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""Sharded crawl tests."""
+import pytest
+from scrapy import Request
+from scrapy.utils.test import get_crawler
+
+from tegenaria.items import ApartmentItem
+from tegenaria.middlewares import ShardMiddleware, in_shard, parse_shard
+from tegenaria.spiders.akelius import AkeliusSpider
+from tegenaria.spiders.merkur import MerkurSpider
+from tegenaria.workers import merge_shard_stats, plan_crawls
+
+
+def test_plan_crawls():
+    """Whole spiders while there are fewer processes than spiders, then shards."""
+    assert plan_crawls(["a", "b", "c"], 2) == [("a", None), ("b", None), ("c", None)]
+    assert plan_crawls(["a", "b"], 5) == [("a", "0/2"), ("a", "1/2"), ("b", "0/2"), ("b", "1/2")]
+    assert plan_crawls([], 4) == []
+
+
+def test_merge_shard_stats():
+    """Counters are added, maximums and the shared URL index are not; values of one crawl are kept by shard."""
+    shard0 = {
+        "apartment/saved": 10,
+        "apartment_index/hits": 30,
+        "apartment_index/misses": 10,
+        "apartment_index/hit_rate": 0.75,
+        "apartment_index/size": 500,
+        "crawl_run/id": 7,
+        "throttle/a.de/concurrency": 2,
+        "throttle/a.de/concurrency_max": 4,
+        "throttle/a.de/decreases": 1,
+        "apartment_writer/queue_depth_max": 3,
+    }
+    shard1 = {
+        "apartment/saved": 5,
+        "apartment_index/hits": 10,
+        "apartment_index/misses": 30,
+        "apartment_index/hit_rate": 0.25,
+        "apartment_index/size": 500,
+        "crawl_run/id": 8,
+        "throttle/a.de/concurrency": 3,
+        "throttle/a.de/concurrency_max": 3,
+        "throttle/a.de/decreases": 2,
+        "apartment_writer/queue_depth_max": 5,
+    }
+    assert merge_shard_stats({"0/2": shard0, "1/2": shard1}) == {
+        "apartment/saved": 15,
+        "apartment_index/hits": 40,
+        "apartment_index/misses": 40,
+        "apartment_index/hit_rate": 0.5,
+        "apartment_index/size": 500,
+        "crawl_run/id": {"0/2": 7, "1/2": 8},
+        "throttle/a.de/concurrency": {"0/2": 2, "1/2": 3},
+        "throttle/a.de/concurrency_max": 4,
+        "throttle/a.de/decreases": 3,
+        "apartment_writer/queue_depth_max": 5,
+    }
+    assert merge_shard_stats({None: shard0}) == shard0
+
+
+def test_parse_shard():
+    """The shard argument has an index and a count."""
+    assert parse_shard(None) is None
+    assert parse_shard("1/4") == (1, 4)
+    with pytest.raises(ValueError):
+        parse_shard("4/4")
+
+
+def test_shard_middleware():
+    """Each item page and item goes to exactly one shard; list pages go to all shards."""
+    list_page = Request("http://www.merkur-berlin.de/?page_id=39")
+    item_pages = [Request("http://www.merkur-berlin.de/?exposeID={:X}".format(number)) for number in range(20)]
+    items = [ApartmentItem(url=request.url) for request in item_pages]
+
+    kept = []
+    for index in range(3):
+        spider = MerkurSpider(shard="{}/3".format(index))
+        middleware = ShardMiddleware.from_crawler(get_crawler(MerkurSpider))
+        output = list(middleware.process_spider_output(None, [list_page] + item_pages + items, spider))
+        assert output[0] is list_page
+        assert all(
+            in_shard(value.url if isinstance(value, Request) else value["url"], index, 3) for value in output[1:]
+        )
+        kept.extend(output[1:])
+    assert len(kept) == len(item_pages) + len(items)
+
+    unsharded = ShardMiddleware.from_crawler(get_crawler(MerkurSpider))
+    assert len(list(unsharded.process_spider_output(None, item_pages, MerkurSpider()))) == len(item_pages)
+
+
+def test_all_shards_cover_the_whole_list():
+    """Every shard starts on the list pages, even when they have items; together, shards follow every item page."""
+    item_pages = [
+        Request("https://www.akelius.de/en/search/apartments/osten/berlin/2.{}.16".format(number))
+        for number in range(20)
+    ]
+
+    followed = []
+    for index in range(3):
+        spider = AkeliusSpider(shard="{}/3".format(index))
+        middleware = ShardMiddleware.from_crawler(get_crawler(AkeliusSpider))
+        start = list(middleware.process_start_requests(spider.start_requests(), spider))
+        assert [request.url for request in start] == spider.start_urls
+        followed.extend(request.url for request in middleware.process_spider_output(None, item_pages, spider))
+    assert sorted(followed) == sorted(request.url for request in item_pages)
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""Spider tests that can't be written as contracts."""
+import json
+
+from scrapy import Request
+from scrapy.http import HtmlResponse, TextResponse
+from twisted.python.failure import Failure
+
+from tegenaria.spiders.akelius import AkeliusSpider
+from tegenaria.spiders.city_wohnen import CityWohnenSpider
+
+AKELIUS_URL = "https://www.akelius.de/en/search/apartments/osten/berlin/2.7037.16"
+
+
+def test_akelius_address_from_map_request():
+    """The apartment item is finished by the map request, or returned without address if the map fails."""
+    spider = AkeliusSpider()
+    page = HtmlResponse(AKELIUS_URL, body=b"<h2>Flat</h2><p>Total rent 950.00 EUR</p>", encoding="utf-8")
+    [request] = list(spider.parse_item(page))
+    assert isinstance(request, Request)
+    assert request.url == AKELIUS_URL + "/karte"
+    assert spider.item_callback(request.url) is None
+
+    map_page = HtmlResponse(
+        request.url,
+        body=b"""<script>var m = '<div class="g-map-marker"><p>Street 1</p><p>10245 Berlin</p></div>';
+        m.infowindow = true;</script>""",
+        encoding="utf-8",
+        request=request,
+    )
+    [item] = list(request.callback(map_page, **request.cb_kwargs))
+    assert (item["title"], item["warm_rent_price"], item["address"]) == ("Flat", "950", "Street 1, 10245 Berlin")
+
+    failure = Failure(Exception("404"))
+    failure.request = request
+    [item] = list(request.errback(failure))
+    assert item["url"] == AKELIUS_URL
+
+
+def test_city_wohnen_search_pages():
+    """Search pages are followed while they are full, and the ads on them are requested."""
+    spider = CityWohnenSpider()
+    spider.PAGE_SIZE = 2
+    [first] = list(spider.start_requests())
+    assert "page_nr=1&page_size=2" in first.url
+
+    def search_page(request, *ids):
+        results = "".join('<a href="/eng/berlin/{}-flat-mitte">Flat</a>'.format(ad_id) for ad_id in ids)
+        body = json.dumps({"results": results}).encode()
+        return TextResponse(request.url, body=body, encoding="utf-8", request=request)
+
+    second, *ads = list(first.callback(search_page(first, 1, 2, 2), **first.cb_kwargs))
+    assert "page_nr=2" in second.url
+    assert [ad.url for ad in ads] == [
+        "https://www.city-wohnen.de/eng/berlin/1-flat-mitte",
+        "https://www.city-wohnen.de/eng/berlin/2-flat-mitte",
+    ]
+
+    # Last page: not full.
+    assert [ad.url for ad in second.callback(search_page(second, 3), **second.cb_kwargs)] == [
+        "https://www.city-wohnen.de/eng/berlin/3-flat-mitte"
+    ]
+    # A full page that only repeats ads ends the search.
+    assert list(first.callback(search_page(first, 1, 2), **first.cb_kwargs)) == []
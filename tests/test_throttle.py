@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""Adaptive throttle tests."""
+from scrapy.core.downloader import Slot
+from scrapy.http import HtmlResponse
+from scrapy.utils.test import get_crawler
+
+from tegenaria.spiders.merkur import MerkurSpider
+from tegenaria.throttle import AdaptiveThrottle
+
+
+def test_adaptive_concurrency():
+    """Concurrency grows slowly on healthy responses and is halved on errors, within the spider profile."""
+    crawler = get_crawler(MerkurSpider, {"AUTOTHROTTLE_ENABLED": True, "ADAPTIVE_WINDOW": 2})
+    spider = MerkurSpider()
+    throttle = AdaptiveThrottle(crawler)
+    slot = Slot(concurrency=1, delay=0.25, randomize_delay=False)
+    key = "www.merkur-berlin.de"
+
+    throttle.adapt(key, slot, 200, 0.3, spider)
+    assert slot.concurrency == 2
+
+    for _ in range(20):
+        throttle.adapt(key, slot, 200, 0.3, spider)
+    assert slot.concurrency == 8
+
+    throttle.adapt(key, slot, 503, 0.1, spider)
+    assert slot.concurrency == 4
+    throttle.adapt(key, slot, 200, 30.0, spider)
+    assert slot.concurrency == 2
+    assert crawler.stats.get_value("throttle/www.merkur-berlin.de/decreases") == 2
+
+    throttle.report(key, slot, spider)
+    assert crawler.stats.get_value("throttle/www.merkur-berlin.de/concurrency") == 2
+
+
+def test_adaptive_concurrency_per_slot():
+    """Each site keeps its own target concurrency, and its delay is computed from it."""
+    crawler = get_crawler(
+        MerkurSpider,
+        {"AUTOTHROTTLE_ENABLED": True, "ADAPTIVE_WINDOW": 1, "DOWNLOAD_DELAY": 0, "ADAPTIVE_MAX_CONCURRENCY": 8},
+    )
+    spider = MerkurSpider()
+    throttle = AdaptiveThrottle(crawler)
+    throttle.mindelay, throttle.maxdelay = 0.0, 60.0
+    healthy = Slot(concurrency=1, delay=1.0, randomize_delay=False)
+    overloaded = Slot(concurrency=1, delay=1.0, randomize_delay=False)
+
+    assert throttle.start_concurrency == 2
+    for _ in range(2):
+        throttle.adapt("healthy.de", healthy, 200, 1.0, spider)
+    throttle.adapt("overloaded.de", overloaded, 503, 1.0, spider)
+    assert (healthy.concurrency, overloaded.concurrency) == (4, 1)
+    assert throttle.target_concurrency == throttle.start_concurrency
+
+    response = HtmlResponse("http://healthy.de", status=200)
+    throttle._adjust_delay(healthy, 4.0, response)
+    throttle._adjust_delay(overloaded, 4.0, response)
+    assert healthy.delay == 1.0
+    assert overloaded.delay == 4.0
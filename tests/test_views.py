@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""Admin view tests."""
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateIndex
+
+from tegenaria.database import db
+from tegenaria.models import Apartment, CachedCount
+from tegenaria.views import ApartmentModelView, ListCountQuery
+
+
+def test_list_count_query_narrowed_by_filters():
+    """The unfiltered count can be cached; a search or a filter makes it narrowed."""
+    query = ListCountQuery.for_apartments()
+    assert not query.narrowed
+    assert "apartment.active IS true" in str(query.statement)
+
+    filtered = query.filter(Apartment.rooms >= 2)
+    assert filtered.narrowed
+    assert isinstance(filtered, ListCountQuery)
+    assert not query.narrowed
+
+
+def test_cached_count_invalidate_statement():
+    """Only counts that are not stale yet are rewritten."""
+    sql = str(CachedCount.invalidate_statement().compile(dialect=postgresql.dialect()))
+    assert sql.startswith("UPDATE cached_count SET stale=")
+    assert "WHERE cached_count.stale IS false" in sql
+
+
+def test_searchable_columns_have_trigram_indexes():
+    """Every column searched on the admin list has a trigram index, so ``ILIKE '%term%'`` doesn't scan the table."""
+    indexes = {index.name: index for index in Apartment.__table__.indexes}
+    for name in ApartmentModelView.column_searchable_list:
+        index = indexes["ix_apartment_{}_trgm".format(name)]
+        sql = str(CreateIndex(index).compile(dialect=postgresql.dialect()))
+        assert sql.endswith("USING gin ({} gin_trgm_ops)".format(name))
+
+
+def test_search_by_words_and_address(app):
+    """Texts are searched on the full text column and ranked; addresses are still searched by substring."""
+    view = ApartmentModelView(Apartment, db.session)
+    query, count_query, _, _ = view._apply_search(
+        ListCountQuery.for_apartments(), ListCountQuery.for_apartments(), {}, {}, "Balkon 12043"
+    )
+    sql = str(query.statement.compile(dialect=postgresql.dialect()))
+    assert "apartment.search_vector @@ websearch_to_tsquery(" in sql
+    assert "apartment.address ILIKE" in sql
+    assert "ORDER BY ts_rank_cd(apartment.search_vector, websearch_to_tsquery(" in sql
+    assert count_query.narrowed
+
+    assert view._apply_search(query, None, {}, {}, "  ")[0] is query